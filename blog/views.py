@@ -2,6 +2,7 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from .models import Post, Tag
 from .forms import CommentForm
+from sugarqube.prefetch import prefetch_cross_db
 
 def blog_home(request):
     # Get all posts initially
@@ -21,7 +22,8 @@ def blog_home(request):
     if sort_by not in valid_sort_fields:
         sort_by = '-created_at' # Default if invalid sort is provided
         
-    posts = posts.order_by(sort_by)
+    # Authors live in the 'credentials' db, fetched in one query instead of one per post
+    posts = prefetch_cross_db(posts.order_by(sort_by), 'author')
 
     context = {
         'posts': posts,
@@ -51,7 +53,7 @@ def post_detail(request, pk):
     
     context = {
         'post': post,
-        'comments': post.comments.order_by('-created_at'),
+        'comments': prefetch_cross_db(post.comments.order_by('-created_at'), 'author'),
         'comment_form': comment_form
     }
     return render(request, 'blog/post_detail.html', context)
\ No newline at end of file
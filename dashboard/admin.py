@@ -1,8 +1,9 @@
+import uuid
 from django.contrib import admin
+from django.db import transaction
 from django.urls import reverse
-from django.contrib.auth import get_user_model
-from .models import SugarPrice
-from notifications.models import Notification
+from .models import Candle, SugarPrice
+from notifications.models import BroadcastNotification
 
 @admin.register(SugarPrice)
 class SugarPriceAdmin(admin.ModelAdmin):
@@ -18,19 +19,22 @@ class SugarPriceAdmin(admin.ModelAdmin):
 
         # Check if the price has changed or if this is the first price entry
         if not last_price or obj.amount != last_price.amount:
-            try:
-                User = get_user_model()
-                all_users = User.objects.using('credentials').all()
-
-                message = f"Market Update: The price of sugar is now {obj.amount} on {obj.date.strftime('%B %d')}."
-
-                notifications_to_create = [
-                    Notification(user=user, message=message, link=reverse('market_trends'))
-                    for user in all_users
-                ]
-
-                if notifications_to_create:
-                    Notification.objects.using('credentials').bulk_create(notifications_to_create)
-
-            except Exception as e:
-                print(f"Error creating price shift notifications: {e}")
\ No newline at end of file
+            message = f"Market Update: The price of sugar is now {obj.amount} on {obj.date.strftime('%B %d')}."
+            # One key per change, so a price that changes back is announced again
+            event_key = f"price:{obj.pk}:{uuid.uuid4().hex}"
+            link = reverse('market_trends')
+
+            def send_price_shift_notification():
+                try:
+                    BroadcastNotification.send(event_key, message, link)
+                except Exception as e:
+                    print(f"Error creating price shift notifications: {e}")
+
+            # A single broadcast row reaches every user, published once the price is committed
+            transaction.on_commit(send_price_shift_notification, using='sugarprices')
+
+@admin.register(Candle)
+class CandleAdmin(admin.ModelAdmin):
+    list_display = ('source', 'interval', 'start', 'open', 'high', 'low', 'close', 'volume', 'trades')
+    list_filter = ('interval', 'source')
+    ordering = ('-start',)
@@ -0,0 +1,228 @@
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import IntegrityError, router, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from .models import Candle, SugarPrice
+
+PRICE_SOURCE = 'sugarprice'
+
+INTERVAL_SECONDS = {'1m': 60, '1h': 3600, '1d': 86400, '1w': 604800}
+# SugarPrice only has a date, so finer candles would each hold a single price
+PRICE_INTERVALS = ('1d', '1w')
+TRADE_INTERVALS = ('1m', '1h', '1d', '1w')
+
+# The epoch was a Thursday; shifting by this makes weekly buckets start on Monday
+WEEK_OFFSET = 3 * 86400
+
+
+def bucket_start(moment, interval):
+    """
+    Start of the `interval` bucket holding the aware datetime `moment`, in UTC.
+    """
+    seconds = INTERVAL_SECONDS[interval]
+    offset = WEEK_OFFSET if interval == '1w' else 0
+    timestamp = int(moment.timestamp()) + offset
+    return datetime.fromtimestamp(timestamp - timestamp % seconds - offset, tz=dt_timezone.utc)
+
+
+def _date_moment(day):
+    return datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+
+
+def _merge(candle, price, quantity):
+    if price > candle.high:
+        candle.high = price
+    if price < candle.low:
+        candle.low = price
+    candle.close = price
+    candle.volume += quantity
+    candle.trades += 1
+
+
+# SugarPrice history
+
+def rebuild_price_candles(start=None, end=None):
+    """
+    Recomputes the SugarPrice candles for the weeks overlapping `start`..`end`
+    (dates, both optional) from the price rows themselves, so edits and deletes are
+    reflected too. Called for the week of each saved price, and to backfill.
+    Returns the number of candles written.
+    """
+    using = router.db_for_write(Candle)
+    prices = SugarPrice.objects.using(using).order_by('date', 'id')
+    candles = Candle.objects.using(using).filter(source=PRICE_SOURCE)
+    # Widen to whole weeks, which also covers every day bucket inside them
+    if start is not None:
+        week = bucket_start(_date_moment(start), '1w')
+        prices = prices.filter(date__gte=week.date())
+        candles = candles.filter(start__gte=week)
+    if end is not None:
+        week_end = bucket_start(_date_moment(end), '1w') + timedelta(weeks=1)
+        prices = prices.filter(date__lt=week_end.date())
+        candles = candles.filter(start__lt=week_end)
+
+    built = {}
+    for day, amount in prices.values_list('date', 'amount').iterator(chunk_size=2000):
+        moment = _date_moment(day)
+        for interval in PRICE_INTERVALS:
+            key = (interval, bucket_start(moment, interval))
+            candle = built.get(key)
+            if candle is None:
+                built[key] = Candle(
+                    source=PRICE_SOURCE, interval=interval, start=key[1],
+                    open=amount, high=amount, low=amount, close=amount, trades=1,
+                )
+            else:
+                _merge(candle, amount, 0)
+
+    with transaction.atomic(using=using):
+        candles.delete()
+        Candle.objects.using(using).bulk_create(built.values(), batch_size=1000)
+    return len(built)
+
+
+# Trades
+
+class TradeCandleAggregator:
+    """
+    Rolls trades into candles in memory as they happen and writes the changes at
+    most every `flush_interval` seconds, so a burst of trades costs one write per
+    candle rather than one per trade.
+
+    What is held in memory is only what changed since the last flush, and a flush
+    folds it into the stored row in the database (higher high, lower low, added
+    volume and trades) instead of overwriting the row, so rows written before a
+    restart, or by another process, are kept.
+    """
+
+    def __init__(self, intervals=TRADE_INTERVALS, flush_interval=5):
+        self.intervals = intervals
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = {}
+        self.last_flush = time.monotonic()
+
+    def add(self, source, price, quantity, at):
+        with self.lock:
+            for interval in self.intervals:
+                key = (source, interval, bucket_start(at, interval))
+                candle = self.pending.get(key)
+                if candle is None:
+                    self.pending[key] = Candle(
+                        source=source, interval=interval, start=key[2],
+                        open=price, high=price, low=price, close=price,
+                        volume=quantity, trades=1,
+                    )
+                else:
+                    _merge(candle, price, quantity)
+
+    def flush_if_due(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        using = router.db_for_write(Candle)
+        with self.flush_lock:
+            with self.lock:
+                self.last_flush = time.monotonic()
+                pending, self.pending = self.pending, {}
+            try:
+                with transaction.atomic(using=using):
+                    for change in pending.values():
+                        _fold_into_stored(change, using)
+            except Exception:
+                # Nothing was written; keep the changes for the next flush
+                with self.lock:
+                    for key, change in pending.items():
+                        newer = self.pending.get(key)
+                        if newer is not None:
+                            change.high = max(change.high, newer.high)
+                            change.low = min(change.low, newer.low)
+                            change.close = newer.close
+                            change.volume += newer.volume
+                            change.trades += newer.trades
+                        self.pending[key] = change
+                raise
+            return len(pending)
+
+
+def _fold_into_stored(change, using):
+    """
+    Adds the trades summarised by the unsaved candle `change` to the stored candle
+    for its bucket, creating it if there is none yet.
+    """
+    stored = Candle.objects.using(using).filter(source=change.source, interval=change.interval, start=change.start)
+    update = {
+        'high': Greatest('high', Value(change.high)),
+        'low': Least('low', Value(change.low)),
+        'close': change.close,
+        'volume': F('volume') + change.volume,
+        'trades': F('trades') + change.trades,
+    }
+    if stored.update(**update):
+        return
+    try:
+        with transaction.atomic(using=using):
+            Candle.objects.using(using).create(
+                source=change.source, interval=change.interval, start=change.start, open=change.open,
+                high=change.high, low=change.low, close=change.close, volume=change.volume, trades=change.trades,
+            )
+    except IntegrityError:
+        # Another process created the row in the meantime
+        stored.update(**update)
+
+
+trade_candles = TradeCandleAggregator()
+
+
+# Reading
+
+def candle_range(source, start, end, interval=None, points=500):
+    """
+    Returns (interval, bucket seconds, candles) for `source` between the aware
+    datetimes `start` and `end`, with at most `points` candles. Without an interval,
+    the finest stored one that fits is used; if the range still has too many
+    candles, they are merged into buckets a whole number of intervals wide,
+    aligned like the intervals themselves, so every merged candle covers exactly
+    the reported bucket even where some intervals had no trades. Candles are
+    (start, open, high, low, close, volume) tuples, oldest first.
+    """
+    available = PRICE_INTERVALS if source == PRICE_SOURCE else TRADE_INTERVALS
+    span = max((end - start).total_seconds(), 1)
+    if interval is None:
+        fitting = [i for i in available if span / INTERVAL_SECONDS[i] <= points]
+        interval = fitting[0] if fitting else available[-1]
+    elif interval not in available:
+        raise ValueError(f'Interval must be one of: {", ".join(available)}')
+
+    first = bucket_start(start, interval)
+    rows = list(
+        Candle.objects.filter(source=source, interval=interval, start__gte=first, start__lt=end)
+        .order_by('start')
+        .values_list('start', 'open', 'high', 'low', 'close', 'volume')
+    )
+    seconds = INTERVAL_SECONDS[interval]
+    if len(rows) <= points:
+        return interval, seconds, rows
+
+    # Buckets of `width` seconds overlapping the range, counting partial ones at
+    # either end, must not outnumber `points`
+    intervals = math.ceil((end - first).total_seconds() / seconds)
+    group = math.ceil(intervals / max(points - 1, 1))
+    width = seconds * group
+    offset = WEEK_OFFSET if interval == '1w' else 0
+
+    merged = []
+    for row in rows:
+        timestamp = int(row[0].timestamp()) + offset
+        bucket = datetime.fromtimestamp(timestamp - timestamp % width - offset, tz=dt_timezone.utc)
+        if merged and merged[-1][0] == bucket:
+            last = merged[-1]
+            merged[-1] = (bucket, last[1], max(last[2], row[2]), min(last[3], row[3]), row[4], last[5] + row[5])
+        else:
+            merged.append((bucket, *row[1:]))
+    return interval, width, merged
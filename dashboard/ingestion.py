@@ -0,0 +1,167 @@
+import os
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMNS = ['Date', 'Amount', 'Rate']
+DATE_FORMAT = '%d/%m/%Y'
+SUPPORTED_FORMATS = ('csv', 'csv.gz', 'parquet')
+
+
+def detect_format(file_path):
+    """
+    Works out the input format from the file extension.
+    """
+    name = file_path.lower()
+    if name.endswith(('.parquet', '.pq')):
+        return 'parquet'
+    if name.endswith('.gz'):
+        return 'csv.gz'
+    return 'csv'
+
+
+def iter_price_chunks(file_path, file_format=None, chunk_size=50000):
+    """
+    Yields raw price rows in chunks of at most `chunk_size` rows.
+    Every chunk is a DataFrame with the Date, Amount and Rate columns and an
+    extra 'row' column locating the row in the source: its line number for CSV
+    (the header is line 1), its 1-based row number for Parquet.
+    """
+    file_format = file_format or detect_format(file_path)
+
+    if file_format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported format '{file_format}'. Use one of: {', '.join(SUPPORTED_FORMATS)}.")
+
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+
+    if file_format == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet files requires the 'pyarrow' package.")
+
+        parquet_file = pq.ParquetFile(file_path)
+        offset = 0
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=PRICE_COLUMNS):
+            chunk = batch.to_pandas()
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            yield _with_row_numbers(chunk, first=1)
+        return
+
+    reader = pd.read_csv(
+        file_path,
+        compression='gzip' if file_format == 'csv.gz' else None,
+        usecols=range(len(PRICE_COLUMNS)),
+        names=PRICE_COLUMNS,
+        header=0,
+        # Dates stay as text for the fast fixed-width parser below. Numbers are left to
+        # the C parser, which only falls back to text for chunks with a bad value.
+        dtype={'Date': str},
+        skipinitialspace=True,
+        chunksize=chunk_size,
+    )
+    with reader:
+        for chunk in reader:
+            # The data starts on line 2, below the header
+            yield _with_row_numbers(chunk, first=2)
+
+
+def _with_row_numbers(chunk, first):
+    chunk = chunk[PRICE_COLUMNS].copy()
+    # Chunked readers keep a running index, so this maps straight onto rows in the source
+    chunk['row'] = chunk.index.to_numpy() + first
+    return chunk
+
+
+def _to_numbers(column):
+    if pd.api.types.is_numeric_dtype(column):
+        return column.astype('float64')
+    return pd.to_numeric(column.astype(str).str.strip(), errors='coerce')
+
+
+def _parse_fixed_width_dates(values):
+    """
+    Parses dd/mm/yyyy strings with integer arithmetic over a (n, 11) code point matrix.
+    Returns datetime64[D] values and a mask of the rows that parsed.
+    """
+    # A fixed-width unicode array is just UCS-4 code points, so it can be viewed as integers.
+    # One spare column catches values longer than ten characters.
+    matrix = values.astype('U11').view(np.uint32).reshape(len(values), 11).astype(np.int32)
+    digits = matrix - ord('0')
+
+    digit_cols = [0, 1, 3, 4, 6, 7, 8, 9]
+    ok = (
+        (matrix[:, 10] == 0)
+        & (matrix[:, 2] == ord('/')) & (matrix[:, 5] == ord('/'))
+        & ((digits[:, digit_cols] >= 0) & (digits[:, digit_cols] <= 9)).all(axis=1)
+    )
+
+    day = digits[:, 0] * 10 + digits[:, 1]
+    month = digits[:, 3] * 10 + digits[:, 4]
+    year = digits[:, 6] * 1000 + digits[:, 7] * 100 + digits[:, 8] * 10 + digits[:, 9]
+    ok &= (month >= 1) & (month <= 12) & (day >= 1)
+
+    months = np.where(ok, (year - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+    month_length = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int32)
+    ok &= day <= month_length
+
+    dates = months.astype('datetime64[D]') + np.where(ok, day - 1, 0)
+    return dates, ok
+
+
+def _to_dates(column):
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column
+    if column.dtype == object and len(column) and column.notna().any() and not isinstance(column.dropna().iloc[0], str):
+        # Parquet date32 columns arrive as datetime.date objects
+        return pd.to_datetime(column, errors='coerce')
+
+    text = column.fillna('').astype(str).str.strip().to_numpy(dtype=object)
+    dates, ok = _parse_fixed_width_dates(text)
+    parsed = pd.Series(dates.astype('datetime64[ns]'), index=column.index).where(ok)
+
+    # Rows that are not zero-padded (e.g. 1/9/2016) go through the slower generic parser
+    fallback = ~ok & (text != '')
+    if fallback.any():
+        parsed[fallback] = pd.to_datetime(pd.Series(text[fallback], index=column.index[fallback]), format=DATE_FORMAT, errors='coerce')
+    return parsed
+
+
+def parse_price_chunk(chunk):
+    """
+    Parses a raw chunk into typed arrays in one vectorised pass.
+    Returns (valid, rejected): `valid` has datetime64 'date' and float64 'amount'/'rate'
+    columns, `rejected` keeps the raw values plus the row number and a reason.
+    """
+    raw = chunk[PRICE_COLUMNS]
+    missing = raw.isna().any(axis=1).to_numpy()
+    text_columns = [name for name in PRICE_COLUMNS if raw[name].dtype == object]
+    if text_columns:
+        missing |= raw[text_columns].apply(lambda col: col.astype(str).str.strip() == '').any(axis=1).to_numpy()
+
+    dates = _to_dates(raw['Date'])
+    amounts = _to_numbers(raw['Amount'])
+    rates = _to_numbers(raw['Rate'])
+
+    bad_date = dates.isna().to_numpy()
+    bad_amount = ~np.isfinite(amounts.to_numpy(dtype='float64', na_value=np.nan))
+    bad_rate = ~np.isfinite(rates.to_numpy(dtype='float64', na_value=np.nan))
+
+    reasons = np.select(
+        [missing, bad_date, bad_amount, bad_rate],
+        ['missing data', f'invalid date (expected {DATE_FORMAT})', 'invalid amount', 'invalid rate'],
+        default='',
+    )
+    rejected_mask = reasons != ''
+
+    valid = pd.DataFrame({
+        'date': dates[~rejected_mask],
+        'amount': amounts[~rejected_mask].round(2),
+        'rate': rates[~rejected_mask].round(2),
+    })
+
+    rejected = chunk.loc[rejected_mask, ['row'] + PRICE_COLUMNS].copy()
+    rejected['reason'] = reasons[rejected_mask]
+
+    return valid, rejected
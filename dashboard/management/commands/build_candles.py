@@ -0,0 +1,27 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.candles import rebuild_price_candles, trade_candles
+
+class Command(BaseCommand):
+    help = 'Backfill the SugarPrice OHLC candles from the price history, and write any pending trade candles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild from this date (YYYY-MM-DD); defaults to the whole history')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['since']}")
+
+        started = time.perf_counter()
+        count = rebuild_price_candles(start=since)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} price candles in {time.perf_counter() - started:.2f}s'))
+
+        # Trade candles are built live by the engine's process; this only flushes what this process holds
+        flushed = trade_candles.flush()
+        if flushed:
+            self.stdout.write(f'Wrote {flushed} pending trade candles')
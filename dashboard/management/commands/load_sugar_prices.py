@@ -1,66 +1,101 @@
-import csv
+import os
+import time
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from dashboard.models import SugarPrice
-from datetime import datetime
+from dashboard.signals import suppress_price_signals
+from dashboard.candles import rebuild_price_candles
+from dashboard.ingestion import iter_price_chunks, parse_price_chunk, SUPPORTED_FORMATS
 
 class Command(BaseCommand):
-    help = 'Efficiently bulk loads data from sugar prices CSV, skipping rows with errors.'
+    help = 'Efficiently bulk loads sugar prices from CSV, gzip CSV or Parquet, reporting rows with errors to a separate file.'
 
-    def handle(self, *args, **kwargs):
-        self.stdout.write("Preparing for a new bulk import...")
-        
-        # 1. Clear existing data for a fresh start
-        count, _ = SugarPrice.objects.using('sugarprices').all().delete()
-        self.stdout.write(self.style.SUCCESS(f"Cleared {count} old price records."))
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default='dashboard/management/commands/sugarprices.csv',
+            help='Path to the price file (.csv, .csv.gz or .parquet)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=SUPPORTED_FORMATS,
+            help='Input format; detected from the file extension when omitted',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50000,
+            help='Number of rows parsed per chunk',
+        )
+        parser.add_argument(
+            '--error-report',
+            help='Where to write rejected rows (defaults to <file>.errors.csv)',
+        )
+
+    def handle(self, *args, **options):
+        file_path = options['file']
+        error_report = options['error_report'] or f'{file_path}.errors.csv'
 
-        file_path = 'dashboard/management/commands/sugarprices.csv'
+        if not os.path.exists(file_path):
+            self.stdout.write(self.style.ERROR(f"Error: The file '{file_path}' was not found."))
+            return
+
+        self.stdout.write("Preparing for a new bulk import...")
         self.stdout.write(f"Reading and processing rows from {file_path}...")
-        
-        objects_to_create = []
+
         successful_reads = 0
         skipped_rows = 0
+        parse_seconds = 0.0
+
+        # Drop the report from a previous run so it only ever describes this import
+        if os.path.exists(error_report):
+            os.remove(error_report)
 
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                header = next(reader)  # Skip header
-
-                for i, row in enumerate(reader, start=2):
-                    try:
-                        date_str, amount_str, rate_str = row
-                        
-                        if not all([date_str, amount_str, rate_str]):
-                            self.stdout.write(self.style.WARNING(f"Skipping row {i}: missing data."))
-                            skipped_rows += 1
-                            continue
-                        
-                        # Create a SugarPrice object in memory (don't save yet)
-                        price_obj = SugarPrice(
-                            date=datetime.strptime(date_str.strip(), '%d/%m/%Y').date(),
-                            amount=float(amount_str.strip()),
-                            rate=float(rate_str.strip())
-                        )
-                        objects_to_create.append(price_obj)
-                        successful_reads += 1
-
-                    except (ValueError, IndexError) as e:
-                        self.stdout.write(self.style.WARNING(f"Skipping row {i} due to formatting error: {e}"))
-                        skipped_rows += 1
-                        continue
-            
-            self.stdout.write(f"CSV processing complete. Found {successful_reads} valid records.")
-
-            # 2. Perform the bulk insert
-            if objects_to_create:
-                self.stdout.write("Starting bulk import into the database...")
-                SugarPrice.objects.using('sugarprices').bulk_create(objects_to_create, batch_size=1000)
-                self.stdout.write(self.style.SUCCESS(f"\nImport complete!"))
-                self.stdout.write(self.style.SUCCESS(f"Successfully imported {len(objects_to_create)} new records."))
-            else:
-                self.stdout.write(self.style.WARNING("No new records to import."))
-
-            if skipped_rows > 0:
-                self.stdout.write(self.style.WARNING(f"Skipped {skipped_rows} rows due to errors."))
-
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f"Error: The file '{file_path}' was not found."))
\ No newline at end of file
+            # Run the whole import in one transaction so a failed load never leaves the table empty,
+            # with the per-row price signals replaced by a single cache invalidation at the end
+            with suppress_price_signals(), transaction.atomic(using='sugarprices'):
+                # 1. Clear existing data for a fresh start
+                count, _ = SugarPrice.objects.using('sugarprices').all().delete()
+                self.stdout.write(self.style.SUCCESS(f"Cleared {count} old price records."))
+
+                chunks = iter_price_chunks(file_path, options['format'], options['chunk_size'])
+                while True:
+                    started = time.perf_counter()
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    valid, rejected = parse_price_chunk(chunk)
+                    parse_seconds += time.perf_counter() - started
+
+                    # 2. Write the rejected rows to the error report instead of the console
+                    if not rejected.empty:
+                        rejected.to_csv(error_report, mode='w' if skipped_rows == 0 else 'a', header=skipped_rows == 0, index=False)
+                        skipped_rows += len(rejected)
+
+                    # 3. Bulk insert the chunk
+                    objects_to_create = [
+                        SugarPrice(date=date, amount=amount, rate=rate)
+                        for date, amount, rate in zip(valid['date'].dt.date, valid['amount'].tolist(), valid['rate'].tolist())
+                    ]
+                    SugarPrice.objects.using('sugarprices').bulk_create(objects_to_create, batch_size=1000)
+                    successful_reads += len(objects_to_create)
+
+                # 4. Candles are skipped per row along with the other price signals
+                candles = rebuild_price_candles()
+                self.stdout.write(f"Rebuilt {candles} price candles.")
+
+        except (ValueError, ImportError) as e:
+            self.stdout.write(self.style.ERROR(f"Error: {e}"))
+            return
+
+        self.stdout.write(f"Parsing took {parse_seconds:.3f}s.")
+
+        if successful_reads:
+            self.stdout.write(self.style.SUCCESS(f"\nImport complete!"))
+            self.stdout.write(self.style.SUCCESS(f"Successfully imported {successful_reads} new records."))
+        else:
+            self.stdout.write(self.style.WARNING("No new records to import."))
+
+        if skipped_rows > 0:
+            self.stdout.write(self.style.WARNING(f"Skipped {skipped_rows} rows due to errors. See {error_report} for details."))
@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
 from dashboard.tasks import prewarm_prediction_cache
+from dashboard.prediction_models import prediction_cache_keys
+from sugarqube.celery import PRIORITY_USER
 from django.core.cache import cache
 
 class Command(BaseCommand):
@@ -23,33 +25,29 @@ class Command(BaseCommand):
 
         if clear_cache:
             self.stdout.write('Clearing existing prediction caches...')
-            # Clear prepared data
-            cache.delete('prepared_sugar_data')
-            
-            # Clear all prediction caches
-            for days in [7, 14, 30]:
-                for model in ['auto', 'arima', 'ets', 'ma']:
-                    for ci in ['True', 'False']:
-                        cache_key = f'prediction_api_{days}_{model}_{ci}'
-                        cache.delete(cache_key)
-            
+            # Clear prepared data and all prediction caches in one round trip
+            cache.delete_many(prediction_cache_keys())
+
             self.stdout.write(self.style.SUCCESS('✓ Caches cleared'))
 
         self.stdout.write('Warming prediction cache...')
         
         if sync:
-            # Run synchronously
-            result = prewarm_prediction_cache()
+            # Run synchronously, with every cell built in this process
+            result = prewarm_prediction_cache(fan_out=False)
             
-            if result.get('status') == 'success':
-                self.stdout.write(self.style.SUCCESS('\n✓ Cache warming completed successfully'))
+            if result.get('status') in ('success', 'partial'):
+                style = self.style.SUCCESS if result['status'] == 'success' else self.style.WARNING
+                self.stdout.write(style(f'\n✓ Cache warming completed: {result["cached"]}/{len(result["cells"])} cells cached'))
+                self.stdout.write(f'Model fits took {result["fit_seconds"]}s, {result["total_seconds"]}s in total')
                 self.stdout.write('\nCached predictions:')
-                for period, status in result.get('results', {}).items():
-                    self.stdout.write(f'  {period}: {status}')
+                for cell in result.get('cells', []):
+                    self.stdout.write(f'  {cell["cell"]}: {cell["status"]} ({cell["seconds"]}s)')
             else:
-                self.stdout.write(self.style.ERROR(f'\n✗ Cache warming failed: {result.get("error")}'))
+                self.stdout.write(self.style.ERROR(f'\n✗ Cache warming failed: {result.get("error", result.get("status"))}'))
         else:
-            # Run as Celery task
-            task = prewarm_prediction_cache.delay()
+            # Run as Celery task, fanned out to the workers as a group, ahead of scheduled prewarms
+            task = prewarm_prediction_cache.apply_async(priority=PRIORITY_USER)
             self.stdout.write(self.style.SUCCESS(f'\n✓ Cache warming task queued: {task.id}'))
-            self.stdout.write('Use --sync flag to run synchronously and see immediate results')
\ No newline at end of file
+            self.stdout.write('Its result holds the id of the summary task that reports per-cell status')
+            self.stdout.write('Use --sync flag to run synchronously and see immediate results')
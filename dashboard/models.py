@@ -1,9 +1,45 @@
 from django.db import models
+from sugarqube.tracking import FieldTrackerMixin
+
+class SugarPrice(FieldTrackerMixin, models.Model):
+    tracked_fields = ('rate', 'date')
 
-class SugarPrice(models.Model):
     date = models.DateField(db_index=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     rate = models.DecimalField(max_digits=10, decimal_places=2)
 
     def __str__(self):
-        return f'{self.date} - {self.amount}'
\ No newline at end of file
+        return f'{self.date} - {self.amount}'
+
+
+class Candle(models.Model):
+    """
+    OHLCV summary of one source's prices over one time bucket. The source is a
+    trading engine symbol, or PRICE_SOURCE for the SugarPrice history.
+    Maintained by dashboard.candles.
+    """
+    INTERVAL_CHOICES = [
+        ('1m', '1 minute'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+        ('1w', '1 week'),
+    ]
+
+    source = models.CharField(max_length=32)
+    interval = models.CharField(max_length=2, choices=INTERVAL_CHOICES)
+    start = models.DateTimeField()
+    open = models.DecimalField(max_digits=12, decimal_places=2)
+    high = models.DecimalField(max_digits=12, decimal_places=2)
+    low = models.DecimalField(max_digits=12, decimal_places=2)
+    close = models.DecimalField(max_digits=12, decimal_places=2)
+    volume = models.PositiveBigIntegerField(default=0)
+    trades = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index range queries read candles through, in time order
+            models.UniqueConstraint(fields=['source', 'interval', 'start'], name='candle_bucket_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.source} {self.interval} {self.start:%Y-%m-%d %H:%M}'
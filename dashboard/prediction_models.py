@@ -13,9 +13,25 @@ from django.views.decorators.csrf import csrf_exempt
 from django.core.cache import cache
 import hashlib
 import json
+from io import StringIO
 
 warnings.filterwarnings("ignore")
 
+# Forecast windows and model hints that api_predict responses are cached for
+PREDICTION_CACHE_DAYS = [7, 14, 30]
+PREDICTION_CACHE_MODELS = ['auto', 'arima', 'ets', 'ma']
+
+def prediction_cache_keys():
+    """
+    Returns every api_predict cache key, plus the prepared data key they are built from.
+    """
+    keys = ['prepared_sugar_data']
+    for days in PREDICTION_CACHE_DAYS:
+        for model in PREDICTION_CACHE_MODELS:
+            for ci in [True, False]:
+                keys.append(f'prediction_api_{days}_{model}_{ci}')
+    return keys
+
 def prepare_data():
     """
     Prepares data for model training with enhanced cleaning.
@@ -25,7 +41,7 @@ def prepare_data():
     cached_data = cache.get(cache_key)
     
     if cached_data is not None:
-        return pd.read_json(cached_data, orient='split')
+        return pd.read_json(StringIO(cached_data), orient='split')
     
     prices = SugarPrice.objects.all().values('date', 'amount')
     df = pd.DataFrame(list(prices))
@@ -299,6 +315,19 @@ def train_and_predict(df, forecast_days=14, model_hint='auto'):
         'window': int(window)
     }
 
+    predictions_df, summary = select_forecast(per_model_metrics, df.index[-1], forecast_days, model_hint)
+
+    return predictions_df, summary, per_model_metrics
+
+
+def select_forecast(per_model_metrics, last_date, forecast_days, model_hint='auto'):
+    """
+    Picks the forecast for `model_hint` out of the per-model results of train_and_predict.
+    Forecasts are truncated to `forecast_days`, so one fit at the longest window
+    can serve every shorter window.
+    Returns:
+      predictions_df, metrics_summary
+    """
     # Decide which model to return for the "prediction" array based on model_hint
     selected_model_key = (model_hint or 'auto').lower()
     if selected_model_key in ('arima', 'ets', 'ma'):
@@ -309,9 +338,9 @@ def train_and_predict(df, forecast_days=14, model_hint='auto'):
         chosen_key = best[0]
 
     # Build predictions_df using the chosen model's forecast
-    chosen_forecast = per_model_metrics[chosen_key]['forecast']
-    last_date = df.index[-1]
-    future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=forecast_days, freq='D')
+    chosen_forecast = per_model_metrics[chosen_key]['forecast'][:forecast_days]
+    last_date = pd.Timestamp(last_date)
+    future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=len(chosen_forecast), freq='D')
 
     predictions_df = pd.DataFrame({
         'Date': future_dates,
@@ -326,7 +355,37 @@ def train_and_predict(df, forecast_days=14, model_hint='auto'):
         'best_model': f"{chosen_key}"
     }
 
-    return predictions_df, summary, per_model_metrics
+    return predictions_df, summary
+
+
+def truncate_model_metrics(per_model_metrics, forecast_days):
+    """
+    Returns a copy of the per-model results with every forecast cut to `forecast_days`.
+    """
+    return {
+        name: dict(metrics, forecast=metrics['forecast'][:forecast_days])
+        for name, metrics in per_model_metrics.items()
+    }
+
+
+def build_prediction_response(predictions_df, metrics_summary, all_metrics, days, model_hint, ci_flag):
+    """
+    Builds the api_predict payload, with predictions formatted for Highcharts as [timestamp_ms, value].
+    """
+    if predictions_df.empty:
+        preds_list = []
+    else:
+        timestamps = pd.to_datetime(predictions_df['Date']).to_numpy(dtype='datetime64[ms]').astype('int64')
+        preds_list = [[int(ts), float(val)] for ts, val in zip(timestamps, predictions_df['Amount'].astype(float))]
+
+    return {
+        'prediction': preds_list,
+        'metrics': metrics_summary,
+        'all_metrics': all_metrics,
+        'forecast_days': days,
+        'model_hint': model_hint,
+        'ci': ci_flag
+    }
 
 
 @require_GET
@@ -363,25 +422,11 @@ def api_predict(request):
     except Exception as exc:
         return JsonResponse({'error': 'prediction failed', 'detail': str(exc)}, status=500)
 
-    # Format predictions for Highcharts: [timestamp_ms, value]
     try:
-        preds_list = []
-        for _, row in predictions_df.iterrows():
-            ts = int(pd.Timestamp(row['Date']).timestamp() * 1000)
-            val = float(row['Amount'])
-            preds_list.append([ts, val])
+        response_data = build_prediction_response(predictions_df, metrics_summary, all_metrics, days, model_hint, ci_flag)
     except Exception as exc:
         return JsonResponse({'error': 'failed to format predictions', 'detail': str(exc)}, status=500)
 
-    response_data = {
-        'prediction': preds_list,
-        'metrics': metrics_summary,
-        'all_metrics': all_metrics,
-        'forecast_days': days,
-        'model_hint': model_hint,
-        'ci': ci_flag
-    }
-
     cache.set(cache_key, response_data, 1800)
     return JsonResponse(response_data, status=200)
 
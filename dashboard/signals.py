@@ -1,76 +1,145 @@
+import threading
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import transaction
 from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from django.contrib.auth import get_user_model
 from .models import SugarPrice
-from notifications.models import Notification
+from .prediction_models import prediction_cache_keys
+from notifications.models import BroadcastNotification
+from trading_engine.orderbook import from_ticks
+from trading_engine.signals import trades_executed
+from .candles import rebuild_price_candles, trade_candles
 from django.core.cache import cache
 
-@receiver(pre_save, sender=SugarPrice)
-def exchange_rate_shift_notification(sender, instance, **kwargs):
+PREWARM_PENDING_KEY = 'prewarm_prediction_cache_pending'
+
+_signal_state = threading.local()
+
+
+def price_signals_suppressed():
+    return getattr(_signal_state, 'depth', 0) > 0
+
+
+@contextmanager
+def suppress_price_signals(using='sugarprices'):
     """
-    Triggers a notification only when the 'rate' field is updated.
+    Silences the per-row SugarPrice signal handlers for bulk writes.
+    The prediction caches are invalidated once when the outermost block exits.
     """
-    if instance.pk:
+    _signal_state.depth = getattr(_signal_state, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _signal_state.depth -= 1
+        if _signal_state.depth == 0:
+            schedule_prediction_cache_invalidation(using)
+
+
+def invalidate_prediction_caches():
+    """
+    Clears the prepared data and prediction caches, then schedules a single
+    prewarm at the end of the debounce window. Writes landing inside the window
+    find the pending flag already set and do not enqueue another prewarm.
+    """
+    cache.delete_many(prediction_cache_keys())
+
+    debounce = getattr(settings, 'PREDICTION_PREWARM_DEBOUNCE', 30)
+    # The flag outlives the window so a busy worker does not cause a second prewarm;
+    # prewarm_prediction_cache clears it as soon as it starts.
+    if cache.add(PREWARM_PENDING_KEY, True, debounce + 300):
         try:
-            original = sender.objects.get(pk=instance.pk)
-            # Only proceed if the rate has changed
-            if original.rate != instance.rate:
-                User = get_user_model()
-                all_users = User.objects.using('credentials').all()
-                message = f"Currency Update: The KES/USD exchange rate has been updated to {instance.rate}."
+            from .tasks import prewarm_prediction_cache
+            from sugarqube.celery import PRIORITY_SCHEDULED
+            prewarm_prediction_cache.apply_async(countdown=debounce, priority=PRIORITY_SCHEDULED)
+        except Exception:
+            cache.delete(PREWARM_PENDING_KEY)  # Celery not available, skip async warming
+
+
+def schedule_candle_refresh(day, using='sugarprices'):
+    """
+    Rebuilds the price candles for the week of `day` once the write commits.
+    """
+    transaction.on_commit(lambda: rebuild_price_candles(day, day), using=using)
 
-                notifications_to_create = [
-                    Notification(user=user, message=message) for user in all_users
-                ]
 
-                if notifications_to_create:
-                    Notification.objects.using('credentials').bulk_create(notifications_to_create)
-        except sender.DoesNotExist:
-            pass
+def schedule_prediction_cache_invalidation(using='sugarprices'):
+    """
+    Runs invalidate_prediction_caches once per transaction, after it commits.
+    Outside a transaction it runs straight away.
+    """
+    connection = transaction.get_connection(using)
+    if connection.in_atomic_block:
+        # Already queued for this transaction by an earlier row
+        if any(entry[1] is invalidate_prediction_caches for entry in connection.run_on_commit):
+            return
+    transaction.on_commit(invalidate_prediction_caches, using=using)
+
+
+@receiver(pre_save, sender=SugarPrice)
+def exchange_rate_shift_notification(sender, instance, using, **kwargs):
+    """
+    Triggers a notification only when the 'rate' field is updated.
+    The update is stored once as a broadcast after the save commits.
+    """
+    if price_signals_suppressed():
+        return
+
+    # Only proceed if the rate has changed since the row was loaded
+    if instance.has_changed('rate'):
+        message = f"Currency Update: The KES/USD exchange rate has been updated to {instance.rate}."
+        # One key per change, so a rate that changes back is announced again
+        event_key = f"rate:{instance.pk}:{uuid.uuid4().hex}"
+        transaction.on_commit(lambda: BroadcastNotification.send(event_key, message), using=using)
 
 
 @receiver(post_save, sender=SugarPrice)
-def invalidate_prediction_cache_on_save(sender, instance, created, **kwargs):
+def invalidate_prediction_cache_on_save(sender, instance, created, using, **kwargs):
     """
     Invalidate prediction caches when price data is modified.
-    Trigger async cache warming.
-    """
-    # Clear prepared data cache
-    cache.delete('prepared_sugar_data')
-    
-    # Clear all prediction caches
-    for days in [7, 14, 30]:
-        for model in ['auto', 'arima', 'ets', 'ma']:
-            for ci in ['True', 'False']:
-                cache_key = f'prediction_api_{days}_{model}_{ci}'
-                cache.delete(cache_key)
-    
-    # Trigger async cache warming (only if Celery is available)
-    try:
-        from .tasks import prewarm_prediction_cache
-        prewarm_prediction_cache.delay()
-    except:
-        pass  # Celery not available, skip async warming
+    Coalesced per transaction, with the async cache warming debounced.
+    """
+    if not price_signals_suppressed():
+        schedule_prediction_cache_invalidation(using)
+        schedule_candle_refresh(instance.date, using)
+        # A changed date also empties the week it moved out of
+        previous_date = instance.previous('date') if not created else None
+        if previous_date and previous_date != instance.date:
+            schedule_candle_refresh(previous_date, using)
 
 
 @receiver(post_delete, sender=SugarPrice)
-def invalidate_prediction_cache_on_delete(sender, instance, **kwargs):
+def invalidate_prediction_cache_on_delete(sender, instance, using, **kwargs):
     """
     Invalidate prediction caches when price data is deleted.
     """
-    # Clear prepared data cache
-    cache.delete('prepared_sugar_data')
-    
-    # Clear all prediction caches
-    for days in [7, 14, 30]:
-        for model in ['auto', 'arima', 'ets', 'ma']:
-            for ci in ['True', 'False']:
-                cache_key = f'prediction_api_{days}_{model}_{ci}'
-                cache.delete(cache_key)
-    
-    # Trigger async cache warming
+    if not price_signals_suppressed():
+        schedule_prediction_cache_invalidation(using)
+        schedule_candle_refresh(instance.date, using)
+
+
+# symbol -> the last trade sequence added to candles. The engine sends trades
+# from one thread at a time, in order.
+_candled_through = {}
+
+
+@receiver(trades_executed)
+def roll_trades_into_candles(sender, symbol, trades, at, replayed=False, **kwargs):
+    """
+    Adds each trade to the symbol's open candles; the changed candles are written
+    every few seconds rather than per trade. Trades sent again are skipped: those
+    already added by this process, and replayed ones, which a candle written
+    before the restart may already hold.
+    """
+    if replayed:
+        return
+    last = _candled_through.get(symbol, 0)
+    for trade in trades:
+        if trade.sequence > last:
+            trade_candles.add(symbol, from_ticks(trade.price), trade.quantity, at)
+    _candled_through[symbol] = max(last, trades[-1].sequence)
     try:
-        from .tasks import prewarm_prediction_cache
-        prewarm_prediction_cache.delay()
-    except:
-        pass
\ No newline at end of file
+        trade_candles.flush_if_due()
+    except Exception as e:
+        print(f"Error writing trade candles: {e}")
@@ -1,6 +1,11 @@
-from celery import shared_task
-from .prediction_models import prepare_data, train_and_predict
+from celery import shared_task, chord, group
+from .prediction_models import (
+    prepare_data, train_and_predict, select_forecast, truncate_model_metrics,
+    build_prediction_response, PREDICTION_CACHE_DAYS, PREDICTION_CACHE_MODELS,
+)
 from django.core.cache import cache
+from sugarqube.task_payloads import store_payload
+from sugarqube.celery import PRIORITY_USER, PRIORITY_SCHEDULED
 from .models import SugarPrice
 from django.db import models
 import json
@@ -9,17 +14,51 @@ import time
 @shared_task
 def update_market_trends(forecast_days):
     """
-    A Celery task to update the market trends data and return the results.
+    A Celery task to update the market trends data.
+    The context is stored in the cache; only the small payload handle is returned,
+    so the chart history never passes through the result backend.
     """
     historical_df = prepare_data()
 
     if historical_df.empty:
         return None
 
-    predictions_df, accuracy_metrics, per_model_metrics = train_and_predict(
-    historical_df,
-    forecast_days=forecast_days
-)
+    context = market_trends_context(historical_df, forecast_days)
+    return store_market_trends(context)
+
+
+def build_market_trends_context(historical_df, forecast_days, per_model_metrics=None):
+    """
+    Builds the market trends page context and caches it compressed, with
+    `market_trends_<days>` pointing at the stored payload.
+    Pass the per-model results of an earlier train_and_predict run to reuse its fits.
+    """
+    context = market_trends_context(historical_df, forecast_days, per_model_metrics)
+    store_market_trends(context)
+    return context
+
+
+def store_market_trends(context):
+    """
+    Stores a market trends context and points `market_trends_<days>` at it.
+    Returns the payload handle.
+    """
+    handle = store_payload('market_trends', context, 3600)
+    cache.set(f"market_trends_{context['forecast_days']}", handle, 3600)
+    return handle
+
+
+def market_trends_context(historical_df, forecast_days, per_model_metrics=None):
+    """
+    The market trends page context, without caching it.
+    """
+    if per_model_metrics is None:
+        predictions_df, accuracy_metrics, per_model_metrics = train_and_predict(
+            historical_df,
+            forecast_days=forecast_days
+        )
+    else:
+        predictions_df, accuracy_metrics = select_forecast(per_model_metrics, historical_df.index[-1], forecast_days)
 
     # Format data for Highcharts
     chart_data = []
@@ -70,73 +109,127 @@ def update_market_trends(forecast_days):
         'accuracy_metrics': accuracy_metrics,
         'forecast_days': forecast_days,
     }
-
-    # Store the data in the cache
-    cache_key = f'market_trends_{forecast_days}'
-    cache.set(cache_key, context, 3600)
-    
     return context
 
 
-@shared_task
-def prewarm_prediction_cache():
+@shared_task(bind=True)
+def prewarm_prediction_cache(self, fan_out=True):
     """
-    Pre-warm the prediction cache for common forecast periods.
-    This should be run periodically (e.g., every 30 minutes) or after data updates.
+    Pre-warm every api_predict variant (forecast window x model x ci) and the
+    market trends contexts. Runs periodically (every 30 minutes) and after data updates.
+
+    The prepared data and the model fits are computed once here, at the longest
+    window, and shared by every cell. With fan_out the cells then run as a Celery
+    group whose results are collected by summarise_prewarm; otherwise they run inline.
+    The cells inherit this task's priority.
     """
-    from .prediction_models import prepare_data, train_and_predict
-    import pandas as pd
-    
+    from .signals import PREWARM_PENDING_KEY
+
+    # Writes from here on must schedule a fresh prewarm
+    cache.delete(PREWARM_PENDING_KEY)
+
+    started_at = time.time()
     try:
         df = prepare_data()
-        
+
         if df.empty or len(df) < 40:
             return {'status': 'no_data'}
-        
-        # Pre-calculate predictions for common forecast periods
-        forecast_periods = [7, 14, 30]
-        results = {}
-        
-        for days in forecast_periods:
-            try:
-                predictions_df, metrics = train_and_predict(df, forecast_days=days)
-                
-                # Format for API response
-                preds_list = []
-                for _, row in predictions_df.iterrows():
-                    ts = int(pd.Timestamp(row['Date']).timestamp() * 1000)
-                    val = float(row['Amount'])
-                    preds_list.append([ts, val])
-                
-                response_data = {
-                    'prediction': preds_list,
-                    'metrics': metrics,
-                    'forecast_days': days,
-                    'model_hint': 'auto',
-                    'ci': False
-                }
-                
-                # Cache with the same key structure as api_predict
-                cache_key = f'prediction_api_{days}_auto_False'
-                cache.set(cache_key, response_data, 1800)  # 30 minutes
-                
-                results[f'{days}d'] = 'cached'
-                
-            except Exception as e:
-                results[f'{days}d'] = f'error: {str(e)}'
-        
-        return {
-            'status': 'success',
-            'results': results,
-            'timestamp': time.time()
-        }
-        
+
+        _, _, per_model_metrics = train_and_predict(df, forecast_days=max(PREDICTION_CACHE_DAYS))
     except Exception as e:
         return {
             'status': 'error',
             'error': str(e)
         }
 
+    fit_seconds = round(time.time() - started_at, 3)
+    last_date = df.index[-1].isoformat()
+
+    cells = []
+    for days in PREDICTION_CACHE_DAYS:
+        for model_hint in PREDICTION_CACHE_MODELS:
+            for ci_flag in (False, True):
+                cells.append(prewarm_prediction_cell.s(days, model_hint, ci_flag, per_model_metrics, last_date))
+        cells.append(prewarm_market_trends_cell.s(days, per_model_metrics))
+
+    if not fan_out:
+        results = [cell() for cell in cells]
+        return summarise_prewarm(results, started_at, fit_seconds)
+
+    priority = (self.request.delivery_info or {}).get('priority')
+    if priority is None:
+        priority = PRIORITY_SCHEDULED
+    cells = [cell.set(priority=priority) for cell in cells]
+    summary = chord(group(cells))(summarise_prewarm.s(started_at, fit_seconds).set(priority=priority))
+    return {
+        'status': 'dispatched',
+        'cells': len(cells),
+        'fit_seconds': fit_seconds,
+        'summary_task_id': summary.id,
+    }
+
+
+def _timed_cell(name, build):
+    """
+    Runs one prewarm cell and reports its status and timing.
+    """
+    started = time.perf_counter()
+    try:
+        build()
+        status = 'cached'
+    except Exception as e:
+        status = f'error: {str(e)}'
+    return {
+        'cell': name,
+        'status': status,
+        'seconds': round(time.perf_counter() - started, 4),
+    }
+
+
+@shared_task
+def prewarm_prediction_cell(days, model_hint, ci_flag, per_model_metrics, last_date):
+    """
+    Caches one api_predict response from the shared model fits.
+    """
+    def build():
+        all_metrics = truncate_model_metrics(per_model_metrics, days)
+        predictions_df, metrics = select_forecast(all_metrics, last_date, days, model_hint)
+        response_data = build_prediction_response(predictions_df, metrics, all_metrics, days, model_hint, ci_flag)
+
+        # Cache with the same key structure as api_predict
+        cache.set(f'prediction_api_{days}_{model_hint}_{ci_flag}', response_data, 1800)  # 30 minutes
+
+    return _timed_cell(f'{days}d/{model_hint}/ci={ci_flag}', build)
+
+
+@shared_task
+def prewarm_market_trends_cell(days, per_model_metrics):
+    """
+    Caches one market trends context from the shared model fits.
+    """
+    def build():
+        # prepare_data is served from the cache filled by prewarm_prediction_cache
+        build_market_trends_context(prepare_data(), days, truncate_model_metrics(per_model_metrics, days))
+
+    return _timed_cell(f'{days}d/market_trends', build)
+
+
+@shared_task
+def summarise_prewarm(results, started_at, fit_seconds):
+    """
+    Collects the per-cell results of a prewarm run into one task result.
+    """
+    failed = [r['cell'] for r in results if r['status'] != 'cached']
+    return {
+        'status': 'success' if not failed else 'partial',
+        'cells': results,
+        'cached': len(results) - len(failed),
+        'failed': failed,
+        'fit_seconds': fit_seconds,
+        'total_seconds': round(time.time() - started_at, 3),
+        'timestamp': time.time()
+    }
+
 
 @shared_task
 def update_on_price_change():
@@ -144,13 +237,12 @@ def update_on_price_change():
     Trigger cache updates when new price data is added.
     Call this after bulk price imports or individual price updates.
     """
-    # Clear old caches
-    cache.delete('prepared_sugar_data')
-    
-    # Trigger pre-warming
-    prewarm_prediction_cache.delay()
-    
-    # Update market trends for default period
-    update_market_trends.delay(7)
+    from .signals import invalidate_prediction_caches
+
+    # Clear old caches and trigger a (debounced) pre-warm
+    invalidate_prediction_caches()
+
+    # Update market trends for default period, ahead of scheduled work
+    update_market_trends.apply_async((7,), priority=PRIORITY_USER)
     
     return {'status': 'caches_invalidated'}
\ No newline at end of file
@@ -5,5 +5,6 @@ from . import prediction_models
 urlpatterns = [
     path('', views.market_trends, name='market_trends'),
     path('api/predict/', prediction_models.api_predict, name='api_predict'),
+    path('api/candles/', views.candle_data, name='candle_data'),
 
 ]
\ No newline at end of file
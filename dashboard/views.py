@@ -2,10 +2,13 @@ from django.shortcuts import render
 from .models import SugarPrice
 import time
 from django.contrib.auth.decorators import login_required
-from datetime import datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.http import JsonResponse
 from django.core.cache import cache
-from .tasks import update_market_trends
+from .tasks import build_market_trends_context
+from .candles import PRICE_SOURCE, candle_range
+from .prediction_models import prepare_data
+from sugarqube.task_payloads import load_payload
 from celery.result import AsyncResult
 
 @login_required
@@ -16,14 +19,16 @@ def market_trends(request):
     forecast_days = int(request.GET.get('forecast_days', 7))
     cache_key = f'market_trends_{forecast_days}'
     
-    # Try to get the data from the cache
-    context = cache.get(cache_key)
+    # Try to get the data from the cache (the key holds a handle to the compressed payload)
+    context = load_payload(cache.get(cache_key))
 
     # If the data is not in the cache, generate it now
     if context is None:
         # Call the task's logic directly (synchronously) to get the data
         # for the initial page load.
-        context = update_market_trends(forecast_days)
+        historical_df = prepare_data()
+        if not historical_df.empty:
+            context = build_market_trends_context(historical_df, forecast_days)
 
     # If the task returned no data (e.g., empty database), provide an empty context
     # to prevent the template from breaking.
@@ -34,6 +39,10 @@ def market_trends(request):
     return render(request, 'dashboard/market_trends.html', context)
 
 def task_status(request, task_id):
+    """
+    Reports a task's state. Heavy tasks return a payload handle rather than
+    their output, so the result passed back here stays small.
+    """
     task = AsyncResult(task_id)
     if task.state == 'SUCCESS':
         response = {
@@ -55,4 +64,44 @@ def landing_chart_data(request):
     target_year = datetime.now().year - 5
     prices = SugarPrice.objects.filter(date__year=target_year).order_by('date')
     chart_data = [[int(time.mktime(p.date.timetuple())) * 1000, float(p.amount)] for p in prices]
-    return JsonResponse(chart_data, safe=False)
\ No newline at end of file
+    return JsonResponse(chart_data, safe=False)
+
+# Candles per response, unless the request asks for fewer
+CANDLE_POINTS = 500
+MAX_CANDLE_POINTS = 2000
+
+def _parse_moment(value, default):
+    if not value:
+        return default
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=dt_timezone.utc)
+
+@login_required
+def candle_data(request):
+    """
+    API endpoint returning OHLCV candles for the SugarPrice history (the default
+    source) or a trading symbol. Takes optional start/end (ISO dates or times;
+    defaults to the past year), interval (1m/1h/1d/1w; picked to fit when left
+    out) and points (the most candles to return; neighbours are merged past it).
+    """
+    source = request.GET.get('source', PRICE_SOURCE)
+    if source != PRICE_SOURCE:
+        source = source.upper()
+    try:
+        end = _parse_moment(request.GET.get('end'), datetime.now(dt_timezone.utc))
+        start = _parse_moment(request.GET.get('start'), end - timedelta(days=365))
+        points = max(1, min(int(request.GET.get('points', CANDLE_POINTS)), MAX_CANDLE_POINTS))
+        interval, bucket, candles = candle_range(source, start, end, request.GET.get('interval') or None, points)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    return JsonResponse({
+        'source': source,
+        'interval': interval,
+        'bucket_seconds': bucket,
+        # Same [timestamp ms, ...] layout as the landing chart
+        'candles': [
+            [int(start.timestamp()) * 1000, float(o), float(h), float(l), float(c), volume]
+            for start, o, h, l, c, volume in candles
+        ],
+    })
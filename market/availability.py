@@ -0,0 +1,69 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from .models import SugarListing
+
+ATP_KEY = 'listing_atp_{}'
+# Cached values are re-read from the database after this long, which also bounds
+# any drift from a change that landed while a value was being loaded
+ATP_TIMEOUT = 60
+
+# listing id -> (bags, read at), this process's copy of the cached values
+_local = {}
+
+
+def _load(listing_id):
+    key = ATP_KEY.format(listing_id)
+    value = cache.get(key)
+    if value is None:
+        row = (
+            SugarListing.objects.using(router.db_for_read(SugarListing))
+            .filter(pk=listing_id).values_list('quantity_available', 'quantity_reserved').first()
+        )
+        if row is None:
+            return None
+        value = row[0] - row[1]
+        if not cache.add(key, value, ATP_TIMEOUT):
+            value = cache.get(key, value)  # Another process loaded it first
+    return value
+
+
+def available_to_promise(listing_id):
+    """
+    Bags of a listing neither sold nor held, or None for an unknown listing.
+    Served from memory, re-read from the cache at most every STOCK_ATP_REFRESH
+    seconds; the database is only read when the cache has no value.
+    """
+    entry = _local.get(listing_id)
+    now = time.monotonic()
+    if entry is None or now - entry[1] > getattr(settings, 'STOCK_ATP_REFRESH', 1.0):
+        value = _load(listing_id)
+        if value is None:
+            _local.pop(listing_id, None)
+            return None
+        entry = _local[listing_id] = (value, now)
+    return max(0, entry[0])
+
+
+def adjust_available(listing_id, delta):
+    """
+    Applies a committed change to the cached value. A missing key is left for the next read to load.
+    """
+    if not delta:
+        return
+    try:
+        value = cache.incr(ATP_KEY.format(listing_id), delta)
+    except ValueError:
+        _local.pop(listing_id, None)
+        return
+    _local[listing_id] = (value, time.monotonic())
+
+
+def forget_available(listing_ids):
+    """
+    Drops cached values after writes that change stock some other way (admin edits, settlement).
+    """
+    cache.delete_many([ATP_KEY.format(listing_id) for listing_id in listing_ids])
+    for listing_id in listing_ids:
+        _local.pop(listing_id, None)
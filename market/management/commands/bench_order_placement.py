@@ -0,0 +1,111 @@
+import threading
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Sum
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from market.models import SugarListing, Order
+from market.services import place_order, InsufficientStock
+
+# The run's credit exposure and stock counters stay in this process, away from the
+# shared cache, where they would land on the real users with the same ids
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench_order_placement',
+    }
+}
+
+class Command(BaseCommand):
+    help = (
+        'Place orders against one listing from many threads and check that stock is never oversold. '
+        'Runs against freshly created test databases, never the configured ones.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent buyers')
+        parser.add_argument('--orders', type=int, default=2000, help='Orders to attempt in total')
+        parser.add_argument('--stock', type=int, default=1000, help='Bags on the benchmark listing')
+        parser.add_argument('--quantity', type=int, default=1, help='Bags per order')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the test databases between runs instead of recreating them')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Setting up test databases...')
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                self.run_benchmark(options)
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+
+    def run_benchmark(self, options):
+        threads, total, stock, quantity = options['threads'], options['orders'], options['stock'], options['quantity']
+
+        User = get_user_model()
+        buyer, _ = User.objects.get_or_create(username='order_benchmark', defaults={'email': 'order_benchmark@example.com'})
+        listing = SugarListing.objects.create(
+            sugar_type='Benchmark', origin='Benchmark', quantity_available=stock,
+            price_per_bag=1, minimum_order_quantity=1, specifications='Order placement benchmark',
+        )
+
+        self.stdout.write(f'Placing {total} orders of {quantity} bag(s) from {threads} threads against {stock} bags...')
+
+        remaining = [total]
+        lock = threading.Lock()
+        counts = {'placed': 0, 'sold_out': 0, 'errors': 0}
+        barrier = threading.Barrier(threads)
+
+        def take_one():
+            with lock:
+                if remaining[0] == 0:
+                    return False
+                remaining[0] -= 1
+                return True
+
+        def count(outcome):
+            with lock:
+                counts[outcome] += 1
+
+        def buyer_thread():
+            try:
+                barrier.wait()
+                while take_one():
+                    try:
+                        place_order(buyer, listing.pk, quantity)
+                        count('placed')
+                    except InsufficientStock:
+                        count('sold_out')
+                    except Exception as e:
+                        count('errors')
+                        self.stderr.write(f"Error placing benchmark order: {e}")
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=buyer_thread) for _ in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - started
+
+        listing.refresh_from_db()
+        ordered = Order.objects.filter(listing=listing).aggregate(bags=Sum('quantity'))['bags'] or 0
+        oversold = max(0, ordered - stock)
+        consistent = listing.quantity_available == stock - ordered and listing.quantity_available >= 0
+
+        self.stdout.write(f'\nPlaced:     {counts["placed"]} orders ({ordered} bags)')
+        self.stdout.write(f'Sold out:   {counts["sold_out"]}')
+        self.stdout.write(f'Errors:     {counts["errors"]}')
+        self.stdout.write(f'Time:       {seconds:.2f}s, {total / seconds:.0f} attempts/s, {counts["placed"] / seconds:.0f} orders/s')
+        self.stdout.write(f'Stock left: {listing.quantity_available}')
+
+        if oversold or not consistent:
+            self.stdout.write(self.style.ERROR(f'\n✗ Stock inconsistent: {oversold} bags oversold'))
+        else:
+            self.stdout.write(self.style.SUCCESS('\n✓ No stock oversold'))
+
+        if options['keepdb']:
+            Order.objects.filter(listing=listing).delete()
+            listing.delete()
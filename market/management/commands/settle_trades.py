@@ -0,0 +1,29 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from market.settlement import settle_day, unsettled_days
+
+class Command(BaseCommand):
+    help = "Net and settle the trading engine's fills, for one day or every finished day still unsettled"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--day', help='Day to settle (YYYY-MM-DD); defaults to every unsettled day before today')
+
+    def handle(self, *args, **options):
+        if options['day']:
+            try:
+                days = [date.fromisoformat(options['day'])]
+            except ValueError:
+                raise CommandError('--day must be a date as YYYY-MM-DD')
+        else:
+            days = unsettled_days(timezone.localdate())
+        if not days:
+            self.stdout.write('Nothing to settle')
+            return
+
+        for day in days:
+            result = settle_day(day)
+            self.stdout.write(self.style.SUCCESS(
+                f'{result["day"]}: {result["fills"]} fills netted into {result["settlements"]} settlements '
+                f'for {result["parties"]} parties, stock updated on {result["listings"]} listings, in {result["seconds"]}s'
+            ))
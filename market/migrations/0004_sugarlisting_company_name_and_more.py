@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:31
+
+from django.db import migrations, models
+
+
+def backfill_company_names(apps, schema_editor):
+    """
+    Copies each seller's company name onto their listings. Sellers and users are
+    read from the 'credentials' db; listings are written on this one.
+    """
+    SugarListing = apps.get_model('market', 'SugarListing')
+    Seller = apps.get_model('users', 'Seller')
+    db = schema_editor.connection.alias
+
+    seller_ids = set(
+        SugarListing.objects.using(db).exclude(seller_id=None).values_list('seller_id', flat=True).distinct()
+    )
+    names = dict(
+        Seller.objects.using('credentials').filter(pk__in=seller_ids).values_list('pk', 'user__company_name')
+    )
+    for seller_id, company_name in names.items():
+        SugarListing.objects.using(db).filter(seller_id=seller_id).update(company_name=company_name or '')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0003_alter_order_created_at'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sugarlisting',
+            name='company_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_company_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='sugarlisting',
+            index=models.Index(fields=['company_name', 'id'], name='listing_company_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sugarlisting',
+            index=models.Index(fields=['price_per_bag', 'id'], name='listing_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sugarlisting',
+            index=models.Index(fields=['quantity_available', 'id'], name='listing_quantity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sugarlisting',
+            index=models.Index(fields=['sugar_type', 'id'], name='listing_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sugarlisting',
+            index=models.Index(fields=['origin', 'id'], name='listing_origin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sugarlisting',
+            index=models.Index(fields=['minimum_order_quantity', 'id'], name='listing_min_order_idx'),
+        ),
+    ]
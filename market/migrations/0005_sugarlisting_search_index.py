@@ -0,0 +1,80 @@
+from django.db import migrations
+
+# PostgreSQL: a stored tsvector column kept up to date by the database, with a GIN index.
+# Type and origin are weighted above the free-text specifications.
+POSTGRES_FORWARDS = [
+    """
+    ALTER TABLE market_sugarlisting ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(sugar_type, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(origin, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(specifications, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX listing_search_idx ON market_sugarlisting USING GIN (search_vector)",
+]
+POSTGRES_BACKWARDS = [
+    "DROP INDEX IF EXISTS listing_search_idx",
+    "ALTER TABLE market_sugarlisting DROP COLUMN IF EXISTS search_vector",
+]
+
+# SQLite (local runs): an external-content FTS5 table over the listing columns,
+# kept in step by triggers
+SQLITE_FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE market_sugarlisting_fts USING fts5(
+        sugar_type, origin, specifications,
+        content='market_sugarlisting', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER market_sugarlisting_fts_insert AFTER INSERT ON market_sugarlisting BEGIN
+        INSERT INTO market_sugarlisting_fts(rowid, sugar_type, origin, specifications)
+        VALUES (new.id, new.sugar_type, new.origin, new.specifications);
+    END
+    """,
+    """
+    CREATE TRIGGER market_sugarlisting_fts_delete AFTER DELETE ON market_sugarlisting BEGIN
+        INSERT INTO market_sugarlisting_fts(market_sugarlisting_fts, rowid, sugar_type, origin, specifications)
+        VALUES ('delete', old.id, old.sugar_type, old.origin, old.specifications);
+    END
+    """,
+    """
+    CREATE TRIGGER market_sugarlisting_fts_update AFTER UPDATE OF sugar_type, origin, specifications
+    ON market_sugarlisting BEGIN
+        INSERT INTO market_sugarlisting_fts(market_sugarlisting_fts, rowid, sugar_type, origin, specifications)
+        VALUES ('delete', old.id, old.sugar_type, old.origin, old.specifications);
+        INSERT INTO market_sugarlisting_fts(rowid, sugar_type, origin, specifications)
+        VALUES (new.id, new.sugar_type, new.origin, new.specifications);
+    END
+    """,
+    "INSERT INTO market_sugarlisting_fts(market_sugarlisting_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS market_sugarlisting_fts_insert",
+    "DROP TRIGGER IF EXISTS market_sugarlisting_fts_delete",
+    "DROP TRIGGER IF EXISTS market_sugarlisting_fts_update",
+    "DROP TABLE IF EXISTS market_sugarlisting_fts",
+]
+
+
+def run_for_vendor(postgres, sqlite):
+    def run(apps, schema_editor):
+        statements = {'postgresql': postgres, 'sqlite': sqlite}.get(schema_editor.connection.vendor, [])
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0004_sugarlisting_company_name_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARDS, SQLITE_FORWARDS),
+            run_for_vendor(POSTGRES_BACKWARDS, SQLITE_BACKWARDS),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_buyer_stats(apps, schema_editor):
+    """
+    Totals up existing orders per buyer.
+    """
+    Order = apps.get_model('market', 'Order')
+    BuyerOrderStats = apps.get_model('market', 'BuyerOrderStats')
+    db = schema_editor.connection.alias
+
+    rows = (
+        Order.objects.using(db).order_by().values('buyer_id')
+        .annotate(
+            order_count=Count('id'),
+            bag_count=Sum('quantity'),
+            total_spend=Sum('total_price'),
+            pending_count=Count('id', filter=Q(status='Pending')),
+            confirmed_count=Count('id', filter=Q(status='Confirmed')),
+            delivered_count=Count('id', filter=Q(status='Delivered')),
+        )
+    )
+    BuyerOrderStats.objects.using(db).bulk_create([BuyerOrderStats(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0005_sugarlisting_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuyerOrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('bag_count', models.PositiveIntegerField(default=0)),
+                ('total_spend', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pending_count', models.PositiveIntegerField(default=0)),
+                ('confirmed_count', models.PositiveIntegerField(default=0)),
+                ('delivered_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', 'created_at', 'id'], name='order_buyer_history_idx'),
+        ),
+        migrations.AddField(
+            model_name='buyerorderstats',
+            name='buyer',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='order_stats', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_buyer_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:09
+
+import django.core.validators
+import django.db.models.deletion
+import re
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0006_buyerorderstats_order_order_buyer_history_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sugarlisting',
+            name='trading_symbol',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True, validators=[django.core.validators.RegexValidator('^[A-Z0-9][A-Z0-9_-]*$', flags=re.RegexFlag['IGNORECASE'], message='Use letters, digits, _ and -.')]),
+        ),
+        migrations.CreateModel(
+            name='Settlement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('quantity', models.PositiveIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('fill_count', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('buyer', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='bought_settlements', to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='settlements', to='market.sugarlisting')),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='settlement', to='market.order')),
+                ('seller', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='sold_settlements', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Fill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('sequence', models.PositiveBigIntegerField()),
+                ('executed_at', models.DateTimeField()),
+                ('settled_on', models.DateField(blank=True, null=True)),
+                ('buyer', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='bought_fills', to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fills', to='market.sugarlisting')),
+                ('seller', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='sold_fills', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['settled_on', 'executed_at'], name='fill_unsettled_idx')],
+                'constraints': [models.UniqueConstraint(fields=('listing', 'sequence'), name='fill_trade_unique')],
+            },
+        ),
+    ]
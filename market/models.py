@@ -1,17 +1,34 @@
+import re
+from django.core.validators import RegexValidator
 from django.db import models
 from django.conf import settings
+from sugarqube.tracking import FieldTrackerMixin
 
-class SugarListing(models.Model):
+class SugarListing(FieldTrackerMixin, models.Model):
     """
     This model represents sugar products in the marketplace
     """
+    tracked_fields = ('seller',)
+
     seller = models.ForeignKey('users.Seller', on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
+    # Copy of the seller's company name, since sellers live in the 'credentials' db
+    # and cannot be joined for sorting. Kept in step by market.signals.
+    company_name = models.CharField(max_length=255, blank=True, default='', editable=False)
     sugar_type = models.CharField(max_length=255)
     origin = models.CharField(max_length=255)
     quantity_available = models.PositiveIntegerField(help_text="In 50kg bags")
+    # Bags held by StockReservations, included in quantity_available until ordered
+    # or released; see market.services
+    quantity_reserved = models.PositiveIntegerField(default=0, editable=False)
     price_per_bag = models.DecimalField(max_digits=10, decimal_places=2, help_text="Price per 50kg bag")
     minimum_order_quantity = models.PositiveIntegerField(help_text="In 50kg bags")
     specifications = models.TextField()
+    # Matching engine book this listing's stock trades in; its trades are settled
+    # against the listing (see market.settlement)
+    trading_symbol = models.CharField(
+        max_length=32, unique=True, null=True, blank=True,
+        validators=[RegexValidator(r'^[A-Z0-9][A-Z0-9_-]*$', flags=re.IGNORECASE, message='Use letters, digits, _ and -.')],
+    )
 
     def __str__(self):
         """
@@ -19,10 +36,23 @@ class SugarListing(models.Model):
         """
         return f'{self.sugar_type} from {self.origin}'
 
-class Order(models.Model):
+    class Meta:
+        # One per marketplace sort key, with id as the keyset tie-breaker
+        indexes = [
+            models.Index(fields=['company_name', 'id'], name='listing_company_idx'),
+            models.Index(fields=['price_per_bag', 'id'], name='listing_price_idx'),
+            models.Index(fields=['quantity_available', 'id'], name='listing_quantity_idx'),
+            models.Index(fields=['sugar_type', 'id'], name='listing_type_idx'),
+            models.Index(fields=['origin', 'id'], name='listing_origin_idx'),
+            models.Index(fields=['minimum_order_quantity', 'id'], name='listing_min_order_idx'),
+        ]
+
+class Order(FieldTrackerMixin, models.Model):
     """
     This model represents a transaction record for a sugar product purchase
     """
+    tracked_fields = ('status',)
+
     # Define status choices
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
@@ -42,4 +72,98 @@ class Order(models.Model):
         """
         String concatenation of models for easy identification
         """
-        return f'Order #{self.id} by {self.buyer.username}'
\ No newline at end of file
+        return f'Order #{self.id} by {self.buyer.username}'
+
+    class Meta:
+        indexes = [
+            # Serves a buyer's order history page by page, newest first
+            models.Index(fields=['buyer', 'created_at', 'id'], name='order_buyer_history_idx'),
+        ]
+
+class StockReservation(models.Model):
+    """
+    Bags of a listing held for a buyer until expires_at, so they cannot be sold to
+    anyone else while the buyer decides. One per buyer and listing.
+    """
+    listing = models.ForeignKey(SugarListing, related_name='reservations', on_delete=models.CASCADE)
+    buyer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.quantity} bags of listing #{self.listing_id} held for buyer #{self.buyer_id}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'buyer'], name='reservation_per_buyer_unique'),
+        ]
+
+class BuyerOrderStats(models.Model):
+    """
+    Running totals of a buyer's orders, kept up to date as orders are placed,
+    change status or are deleted (see market.stats) so they never need an aggregate query.
+    """
+    # Count column for each Order status
+    STATUS_FIELDS = {
+        'Pending': 'pending_count',
+        'Confirmed': 'confirmed_count',
+        'Delivered': 'delivered_count',
+    }
+
+    buyer = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False, related_name='order_stats')
+    order_count = models.PositiveIntegerField(default=0)
+    bag_count = models.PositiveIntegerField(default=0)
+    total_spend = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    confirmed_count = models.PositiveIntegerField(default=0)
+    delivered_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Order stats for buyer #{self.buyer_id}'
+
+class Fill(models.Model):
+    """
+    A trade from the matching engine in a listing's book, held until the
+    end-of-day settlement nets it with the other fills between the same parties.
+    """
+    listing = models.ForeignKey(SugarListing, related_name='fills', on_delete=models.CASCADE)
+    buyer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False, related_name='bought_fills')
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False, related_name='sold_fills')
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    # The trade's sequence number in its book, so a trade is only recorded once
+    sequence = models.PositiveBigIntegerField()
+    executed_at = models.DateTimeField()
+    settled_on = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.quantity} bags of listing #{self.listing_id} at {self.price}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'sequence'], name='fill_trade_unique'),
+        ]
+        indexes = [
+            # Serves the settlement run's scan of a day's unsettled fills
+            models.Index(fields=['settled_on', 'executed_at'], name='fill_unsettled_idx'),
+        ]
+
+class Settlement(models.Model):
+    """
+    A day's fills between one buyer and one seller in one listing, netted into a
+    single amount and booked as one Order.
+    """
+    day = models.DateField(db_index=True)
+    listing = models.ForeignKey(SugarListing, related_name='settlements', on_delete=models.CASCADE)
+    buyer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False, related_name='bought_settlements')
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False, related_name='sold_settlements')
+    quantity = models.PositiveIntegerField()
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    fill_count = models.PositiveIntegerField()
+    order = models.OneToOneField(Order, related_name='settlement', on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Settlement of {self.quantity} bags on {self.day}'
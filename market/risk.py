@@ -0,0 +1,312 @@
+import threading
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.db.models import DecimalField, F, Sum
+from .models import BuyerOrderStats, Fill, Order
+
+# Order statuses that still commit the buyer's money; delivery settles an order
+OPEN_STATUSES = ('Pending', 'Confirmed')
+
+ORDERS_KEY = 'risk_orders_{}'
+TRADING_KEY = 'risk_trading_{}'
+LIMIT_KEY = 'risk_limit_{}'
+# Running total of each buyer's fills settled into orders, and a counter bumped
+# once per settlement run so the engine knows to look at them
+SETTLED_KEY = 'risk_settled_{}'
+SETTLED_GENERATION_KEY = 'risk_settled_generation'
+# Values are corrected by reconcile_exposure rather than expiring
+LEDGER_TIMEOUT = None
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def default_credit_limit():
+    return to_cents(getattr(settings, 'BUYER_CREDIT_LIMIT', 0))
+
+
+def open_order_exposure(buyer_ids):
+    """
+    Cents committed to each buyer's open marketplace orders, from the database.
+    Only used to seed the ledger and to reconcile it, never per order.
+    """
+    using = router.db_for_read(Order)
+    rows = (
+        Order.objects.using(using)
+        .filter(buyer_id__in=buyer_ids, status__in=OPEN_STATUSES)
+        .order_by().values('buyer_id').annotate(total=Sum('total_price'))
+    )
+    exposure = {buyer_id: 0 for buyer_id in buyer_ids}
+    exposure.update({row['buyer_id']: to_cents(row['total']) for row in rows})
+    return exposure
+
+
+class ExposureLedger:
+    """
+    Each buyer's open exposure against their credit limit, in cents, in two parts:
+
+    - marketplace orders: a counter in the cache, changed with atomic incr/decr so
+      every web process shares it. reserve_order() adds first and backs out if the
+      total went over the limit, so concurrent orders cannot both slip through.
+    - trading engine orders and fills: held in memory by the engine's process,
+      which is the only writer, and copied to the cache every `refresh` seconds
+      for the other processes to read. The copy overwrites the cached values, so
+      a second writer would undo the first's changes: the trading methods raise
+      until claim_trading() has been called, which only start_engine() does.
+
+    The engine checks against memory alone, re-reading the marketplace part and the
+    limit from the cache at most every `refresh` seconds per buyer, so a check is a
+    few dict lookups. The database is only read on a cold cache and by
+    reconcile_exposure(), which corrects drift periodically.
+
+    Filled engine buys stay in the trading part until the end-of-day settlement
+    books them as orders. It then moves them to the marketplace part with
+    release_settled(), which the engine picks up on its next flush.
+    """
+
+    def __init__(self, refresh=None):
+        self.refresh = refresh if refresh is not None else getattr(settings, 'RISK_LEDGER_REFRESH', 1.0)
+        self.lock = threading.Lock()
+        self.trading = {}
+        self.trading_writer = False
+        self._dirty = set()
+        self._flushed_at = time.monotonic()
+        # buyer id -> (value, read at) mirrors of the shared values
+        self._orders = {}
+        self._limits = {}
+        # buyer id -> the SETTLED_KEY total already taken off, and releases not yet applied
+        self._settled = {}
+        self._released = {}
+        self._settled_generation = None
+
+    # Shared values
+
+    def _load_orders(self, buyer_id):
+        key = ORDERS_KEY.format(buyer_id)
+        value = cache.get(key)
+        if value is None:
+            value = open_order_exposure([buyer_id])[buyer_id]
+            if not cache.add(key, value, LEDGER_TIMEOUT):
+                value = cache.get(key, value)  # Another process seeded it first
+        return value
+
+    def _load_limit(self, buyer_id):
+        key = LIMIT_KEY.format(buyer_id)
+        value = cache.get(key)
+        if value is None:
+            limit = (
+                get_user_model().objects.using('credentials')
+                .filter(pk=buyer_id).values_list('credit_limit', flat=True).first()
+            )
+            value = to_cents(limit) if limit is not None else default_credit_limit()
+            cache.set(key, value, LEDGER_TIMEOUT)
+        return value
+
+    def _mirrored(self, mirror, loader, buyer_id):
+        entry = mirror.get(buyer_id)
+        now = time.monotonic()
+        if entry is None or now - entry[1] > self.refresh:
+            entry = mirror[buyer_id] = (loader(buyer_id), now)
+        return entry[0]
+
+    def limit(self, buyer_id):
+        return self._mirrored(self._limits, self._load_limit, buyer_id)
+
+    def forget_limit(self, buyer_id):
+        cache.delete(LIMIT_KEY.format(buyer_id))
+        self._limits.pop(buyer_id, None)
+
+    def exposure(self, buyer_id):
+        """
+        Total open exposure in cents, as this process currently sees it.
+        """
+        trading = self.trading.get(buyer_id)
+        if trading is None:
+            trading = cache.get(TRADING_KEY.format(buyer_id), 0)
+        return self._mirrored(self._orders, self._load_orders, buyer_id) + trading
+
+    # Marketplace orders (any process)
+
+    def reserve_order(self, buyer_id, cents):
+        """
+        Adds an order's value to the buyer's exposure if it stays within their
+        limit. Returns False, changing nothing, if it would not.
+        """
+        key = ORDERS_KEY.format(buyer_id)
+        if cache.get(key) is None:
+            self._load_orders(buyer_id)
+        try:
+            orders = cache.incr(key, cents)
+        except ValueError:
+            # Evicted since it was loaded
+            self._load_orders(buyer_id)
+            orders = cache.incr(key, cents)
+        trading = cache.get(TRADING_KEY.format(buyer_id), 0)
+        if orders + trading > self.limit(buyer_id):
+            cache.decr(key, cents)
+            return False
+        self._orders[buyer_id] = (orders, time.monotonic())
+        return True
+
+    def adjust_order(self, buyer_id, cents):
+        """
+        Changes the marketplace part without a limit check, e.g. on delivery (negative).
+        """
+        try:
+            value = cache.incr(ORDERS_KEY.format(buyer_id), cents)
+        except ValueError:
+            return  # Not loaded; the next read seeds it from the database
+        self._orders[buyer_id] = (value, time.monotonic())
+
+    def release_settled(self, amounts):
+        """
+        Takes settled fills, {buyer id: cents}, off the buyers' trading exposure.
+        The cached trading values drop at once; the engine's process applies the
+        same release to its memory when it next flushes.
+        """
+        for buyer_id, cents in amounts.items():
+            key = SETTLED_KEY.format(buyer_id)
+            cache.add(key, 0, LEDGER_TIMEOUT)
+            cache.incr(key, cents)
+            try:
+                cache.decr(TRADING_KEY.format(buyer_id), cents)
+            except ValueError:
+                pass  # Never flushed; the engine writes it after applying the release
+        if amounts:
+            cache.add(SETTLED_GENERATION_KEY, 0, LEDGER_TIMEOUT)
+            cache.incr(SETTLED_GENERATION_KEY)
+
+    # Trading engine (its process only; callers serialise)
+
+    def claim_trading(self):
+        """
+        Makes this process the writer of the trading part. Called by start_engine(),
+        whose process holds the engine lock, so there is never more than one.
+        """
+        self.trading_writer = True
+
+    def _check_writer(self):
+        if not self.trading_writer:
+            raise RuntimeError('Trading exposure is only written by the trading engine process')
+
+    def _track(self, buyer_id):
+        # Settlements before the engine first counts a buyer are not in its memory
+        if buyer_id not in self._settled:
+            if self._settled_generation is None:
+                self._settled_generation = cache.get(SETTLED_GENERATION_KEY, 0)
+            self._settled[buyer_id] = cache.get(SETTLED_KEY.format(buyer_id), 0)
+
+    def _apply_released(self):
+        with self.lock:
+            released, self._released = self._released, {}
+        for buyer_id, cents in released.items():
+            self.trading[buyer_id] = max(0, self.trading.get(buyer_id, 0) - cents)
+            self._dirty.add(buyer_id)
+
+    def reserve_trading(self, buyer_id, cents):
+        """
+        Adds to the buyer's trading exposure if the total stays within their limit.
+        Returns False, changing nothing, if it would not.
+        """
+        self._check_writer()
+        if self._released:
+            self._apply_released()
+        self._track(buyer_id)
+        trading = self.trading.get(buyer_id, 0)
+        orders = self._mirrored(self._orders, self._load_orders, buyer_id)
+        if orders + trading + cents > self.limit(buyer_id):
+            return False
+        self.trading[buyer_id] = trading + cents
+        self._dirty.add(buyer_id)
+        return True
+
+    def adjust_trading(self, buyer_id, cents):
+        """
+        Changes the trading part without a limit check: negative to release what
+        an order no longer needs, positive to restore resting orders on startup.
+        """
+        self._check_writer()
+        if self._released:
+            self._apply_released()
+        self._track(buyer_id)
+        self.trading[buyer_id] = self.trading.get(buyer_id, 0) + cents
+        self._dirty.add(buyer_id)
+
+    def flush_trading(self, force=False):
+        """
+        Copies changed trading exposure to the cache, at most every `refresh` seconds,
+        and collects any settlements since the last flush.
+        """
+        self._check_writer()
+        if not force and time.monotonic() - self._flushed_at < self.refresh:
+            return
+        self._collect_settled()
+        if not self._dirty:
+            self._flushed_at = time.monotonic()
+            return
+        with self.lock:
+            dirty, self._dirty = self._dirty, set()
+            # Releases waiting for the engine are already out of the cached values
+            values = {
+                TRADING_KEY.format(buyer_id): max(0, self.trading.get(buyer_id, 0) - self._released.get(buyer_id, 0))
+                for buyer_id in dirty
+            }
+            self._flushed_at = time.monotonic()
+        cache.set_many(values, LEDGER_TIMEOUT)
+
+    def _collect_settled(self):
+        generation = cache.get(SETTLED_GENERATION_KEY, 0)
+        if self._settled_generation is None or generation == self._settled_generation:
+            self._settled_generation = generation
+            return
+        with self.lock:
+            self._settled_generation = generation
+            buyer_ids = list(self._settled)
+            totals = cache.get_many([SETTLED_KEY.format(buyer_id) for buyer_id in buyer_ids])
+            for buyer_id in buyer_ids:
+                total = totals.get(SETTLED_KEY.format(buyer_id), 0)
+                if total > self._settled[buyer_id]:
+                    self._released[buyer_id] = self._released.get(buyer_id, 0) + total - self._settled[buyer_id]
+                    self._settled[buyer_id] = total
+
+    def seed_unsettled_fills(self):
+        """
+        Adds the buyers' unsettled fills to their trading exposure, for an engine
+        that has just started and only counted its resting orders.
+        """
+        using = router.db_for_read(Fill)
+        rows = (
+            Fill.objects.using(using).filter(settled_on__isnull=True)
+            .order_by().values('buyer_id').annotate(total=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2)))
+        )
+        for row in rows:
+            self.adjust_trading(row['buyer_id'], to_cents(row['total']))
+
+
+def reconcile_exposure():
+    """
+    Recomputes every buyer's marketplace exposure from their open orders and
+    overwrites the cached counters. Returns the number of buyers that had drifted.
+    Orders placed while this runs can be off until the next run.
+    """
+    buyer_ids = list(BuyerOrderStats.objects.values_list('buyer_id', flat=True))
+    drifted = 0
+    for start in range(0, len(buyer_ids), 1000):
+        batch = buyer_ids[start:start + 1000]
+        actual = open_order_exposure(batch)
+        cached = cache.get_many([ORDERS_KEY.format(buyer_id) for buyer_id in batch])
+        changed = {
+            ORDERS_KEY.format(buyer_id): value for buyer_id, value in actual.items()
+            if cached.get(ORDERS_KEY.format(buyer_id)) != value
+        }
+        drifted += sum(1 for key in changed if key in cached)
+        cache.set_many(changed, LEDGER_TIMEOUT)
+    return drifted
+
+
+ledger = ExposureLedger()
@@ -0,0 +1,139 @@
+import re
+from decimal import Decimal, InvalidOperation
+from django.db import connections, router
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from .models import SugarListing
+
+# Results per page unless the caller asks otherwise, and at most
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchUnavailable(Exception):
+    """
+    The database backend has no full-text index for listings (only PostgreSQL
+    and SQLite with FTS5 have one).
+    """
+
+
+def _fts5_query(text):
+    """
+    Turns free text into an FTS5 query: every word must match, as a prefix,
+    with FTS5 operators in the input treated as plain words.
+    """
+    words = WORD_RE.findall(text)
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def matching(queryset, text):
+    """
+    Narrows `queryset` to listings matching `text` and annotates each with `rank`
+    (higher is better). Raises SearchUnavailable if the backend has no index.
+    """
+    backend = connections[queryset.db].vendor
+
+    if backend == 'postgresql':
+        tsquery = "websearch_to_tsquery('english', %s)"
+        return (
+            queryset
+            .alias(matched=RawSQL(
+                f"market_sugarlisting.search_vector @@ {tsquery}", [text], output_field=BooleanField()
+            ))
+            .filter(matched=True)
+            # ts_rank_cd returns a float4; as a float8 the rank round-trips through
+            # the page cursor exactly, so rank = %s still matches tied rows
+            .annotate(rank=RawSQL(
+                f"ts_rank_cd(market_sugarlisting.search_vector, {tsquery})::float8", [text], output_field=FloatField()
+            ))
+        )
+
+    if backend == 'sqlite':
+        query = _fts5_query(text)
+        if not query:
+            return queryset.none().annotate(rank=RawSQL('0', [], output_field=FloatField()))
+        # bm25 is lower for better matches; negate it so both backends rank high-to-low.
+        # Type and origin are weighted above the free-text specifications.
+        return (
+            queryset
+            .filter(id__in=RawSQL(
+                "SELECT rowid FROM market_sugarlisting_fts WHERE market_sugarlisting_fts MATCH %s", [query]
+            ))
+            .annotate(rank=RawSQL(
+                "SELECT -bm25(market_sugarlisting_fts, 10.0, 10.0, 1.0) FROM market_sugarlisting_fts "
+                "WHERE market_sugarlisting_fts MATCH %s AND rowid = market_sugarlisting.id",
+                [query], output_field=FloatField()
+            ))
+        )
+
+    raise SearchUnavailable(f'No full-text index for the {backend} backend')
+
+
+def _decimal(value):
+    try:
+        return Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        raise ValueError(f'Invalid number: {value}')
+
+
+def _integer(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        raise ValueError(f'Invalid number: {value}')
+
+
+def apply_filters(queryset, params):
+    """
+    Applies the marketplace filters in `params` (a QueryDict or dict):
+    origin, sugar_type, min_price, max_price and order_quantity (listings a buyer
+    can order that many bags from). Raises ValueError on malformed numbers.
+    """
+    if params.get('origin'):
+        queryset = queryset.filter(origin__iexact=params['origin'])
+    if params.get('sugar_type'):
+        queryset = queryset.filter(sugar_type__iexact=params['sugar_type'])
+
+    min_price = _decimal(params.get('min_price'))
+    max_price = _decimal(params.get('max_price'))
+    order_quantity = _integer(params.get('order_quantity'))
+    if min_price is not None:
+        queryset = queryset.filter(price_per_bag__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price_per_bag__lte=max_price)
+    if order_quantity is not None:
+        queryset = queryset.filter(minimum_order_quantity__lte=order_quantity, quantity_available__gte=order_quantity)
+    return queryset
+
+
+def search_listings(text, params=None, after=None, page_size=PAGE_SIZE):
+    """
+    Returns (listings, next_cursor) for in-stock listings matching `text` and the
+    filters in `params`, best match first.
+
+    Pages are keyed on (rank, id): pass next_cursor back as `after`. Only the
+    matched rows are ranked, so the cost follows the number of matches rather
+    than the size of the catalogue.
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    using = router.db_for_read(SugarListing)
+    queryset = SugarListing.objects.using(using).filter(quantity_available__gt=0)
+    queryset = matching(apply_filters(queryset, params or {}), text)
+
+    if after:
+        try:
+            rank, _, pk = after.partition(':')
+            rank, pk = float(rank), int(pk)
+        except ValueError:
+            raise ValueError('Invalid cursor')
+        queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__gt=pk))
+
+    listings = list(queryset.order_by('-rank', 'id')[:page_size + 1])
+    next_cursor = None
+    if len(listings) > page_size:
+        listings = listings[:page_size]
+        last = listings[-1]
+        next_cursor = f'{last.rank!r}:{last.pk}'
+    return listings, next_cursor
@@ -0,0 +1,221 @@
+import random
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, router, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .availability import adjust_available
+from .models import SugarListing, Order, StockReservation
+from .risk import ledger, to_cents
+
+# Attempts for an order whose transaction hits a transient database error
+# (deadlock, serialization failure, SQLite busy), with jittered backoff between them
+ORDER_MAX_ATTEMPTS = 3
+ORDER_RETRY_BACKOFF = 0.02
+
+
+class OrderError(Exception):
+    """
+    An order that cannot be placed; the message is safe to show the buyer.
+    """
+
+
+class BelowMinimumOrder(OrderError):
+    pass
+
+
+class InsufficientStock(OrderError):
+    pass
+
+
+class CreditLimitExceeded(OrderError):
+    pass
+
+
+def place_order(buyer, listing_id, quantity, max_attempts=ORDER_MAX_ATTEMPTS):
+    """
+    Places an order and takes its stock off the listing in one transaction on the
+    listings' database.
+
+    The stock is reserved by a single conditional UPDATE
+    (quantity_available = quantity_available - n WHERE quantity_available -
+    quantity_reserved + held >= n AND minimum_order_quantity <= n),
+    so concurrent buyers are serialised by the row lock for the length of one
+    statement and the stock can never go below zero. No row is read and written
+    back, so there is nothing to lose to a race. Bags other buyers hold are not
+    available; the buyer's own hold on the listing (`held` bags) is, and is used
+    up by the order.
+
+    The order's value is then added to the buyer's exposure in the shared
+    ledger (see market.risk), and the whole order is rolled back if that would
+    take them over their credit limit.
+
+    Raises SugarListing.DoesNotExist, BelowMinimumOrder, InsufficientStock or
+    CreditLimitExceeded.
+    """
+    using = router.db_for_write(Order)
+
+    for attempt in range(1, max_attempts + 1):
+        reserved = 0
+        try:
+            with transaction.atomic(using=using):
+                held_id, held = _lock_hold(using, buyer.pk, listing_id)
+                # Writing first takes the row lock before anything is read
+                reserved_stock = (
+                    SugarListing.objects.using(using)
+                    .filter(
+                        pk=listing_id, minimum_order_quantity__lte=quantity,
+                        quantity_available__gte=F('quantity_reserved') - held + quantity,
+                    )
+                    .update(
+                        quantity_available=F('quantity_available') - quantity,
+                        quantity_reserved=F('quantity_reserved') - held,
+                    )
+                )
+                listing = (
+                    SugarListing.objects.using(using)
+                    .only('id', 'price_per_bag', 'minimum_order_quantity')
+                    .get(pk=listing_id)
+                )
+                if not reserved_stock:
+                    if quantity < listing.minimum_order_quantity:
+                        raise BelowMinimumOrder(f'The minimum order quantity is {listing.minimum_order_quantity} bags.')
+                    raise InsufficientStock('The requested quantity exceeds available stock.')
+
+                total_price = quantity * listing.price_per_bag
+                if not ledger.reserve_order(buyer.pk, to_cents(total_price)):
+                    raise CreditLimitExceeded('This order would take you over your credit limit.')
+                reserved = to_cents(total_price)
+
+                order = Order(buyer=buyer, listing=listing, quantity=quantity, total_price=total_price, status='Pending')
+                order.exposure_reserved = True  # Tells the order signals it is already counted
+                order.save(using=using)
+                if held_id:
+                    StockReservation.objects.using(using).filter(pk=held_id).delete()
+                transaction.on_commit(lambda: adjust_available(listing_id, held - quantity), using=using)
+                return order
+        except Exception as e:
+            if reserved:
+                ledger.adjust_order(buyer.pk, -reserved)
+            if not isinstance(e, OperationalError) or attempt == max_attempts:
+                raise
+            time.sleep(ORDER_RETRY_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random()))
+
+
+def _lock_hold(using, buyer_id, listing_id):
+    """
+    Locks the buyer's hold on the listing, if any, and returns (id, bags) or (None, 0).
+    Holds are always locked before their listing, the same order the sweeper uses.
+    A hold past its expiry still counts until the sweeper releases it.
+    """
+    hold = (
+        StockReservation.objects.using(using).select_for_update()
+        .filter(buyer_id=buyer_id, listing_id=listing_id).values_list('id', 'quantity').first()
+    )
+    return hold or (None, 0)
+
+
+def reserve_stock(buyer, listing_id, quantity, ttl=None, max_attempts=ORDER_MAX_ATTEMPTS):
+    """
+    Holds `quantity` bags of a listing for the buyer for `ttl` seconds
+    (STOCK_RESERVATION_TTL by default), replacing any hold they already have on it.
+    Until the hold is used by place_order, released or expires, no one else can
+    order or hold those bags.
+
+    The bags are taken by one conditional UPDATE of the listing's quantity_reserved
+    counter, as place_order takes stock. Raises SugarListing.DoesNotExist,
+    BelowMinimumOrder or InsufficientStock; returns the StockReservation.
+    """
+    using = router.db_for_write(StockReservation)
+    ttl = ttl if ttl is not None else getattr(settings, 'STOCK_RESERVATION_TTL', 600)
+
+    for attempt in range(1, max_attempts + 1):
+        try:
+            with transaction.atomic(using=using):
+                held_id, held = _lock_hold(using, buyer.pk, listing_id)
+                held_stock = (
+                    SugarListing.objects.using(using)
+                    .filter(
+                        pk=listing_id, minimum_order_quantity__lte=quantity,
+                        quantity_available__gte=F('quantity_reserved') - held + quantity,
+                    )
+                    .update(quantity_reserved=F('quantity_reserved') - held + quantity)
+                )
+                if not held_stock:
+                    listing = SugarListing.objects.using(using).only('id', 'minimum_order_quantity').get(pk=listing_id)
+                    if quantity < listing.minimum_order_quantity:
+                        raise BelowMinimumOrder(f'The minimum order quantity is {listing.minimum_order_quantity} bags.')
+                    raise InsufficientStock('Not enough stock is free to hold that many bags.')
+
+                expires_at = timezone.now() + timedelta(seconds=ttl)
+                if held_id:
+                    StockReservation.objects.using(using).filter(pk=held_id).update(quantity=quantity, expires_at=expires_at)
+                    reservation = StockReservation.objects.using(using).get(pk=held_id)
+                else:
+                    reservation = StockReservation.objects.using(using).create(
+                        buyer=buyer, listing_id=listing_id, quantity=quantity, expires_at=expires_at,
+                    )
+                transaction.on_commit(lambda: adjust_available(listing_id, held - quantity), using=using)
+                return reservation
+        except (OperationalError, IntegrityError):
+            # IntegrityError: a concurrent first hold by the same buyer won; the retry replaces it
+            if attempt == max_attempts:
+                raise
+            time.sleep(ORDER_RETRY_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random()))
+
+
+def release_reservation(buyer, listing_id):
+    """
+    Gives back the buyer's hold on the listing. Returns the bags released (0 if none).
+    """
+    using = router.db_for_write(StockReservation)
+    with transaction.atomic(using=using):
+        held_id, held = _lock_hold(using, buyer.pk, listing_id)
+        if not held_id:
+            return 0
+        StockReservation.objects.using(using).filter(pk=held_id).delete()
+        SugarListing.objects.using(using).filter(pk=listing_id).update(
+            quantity_reserved=Greatest(F('quantity_reserved') - held, Value(0)),
+        )
+        transaction.on_commit(lambda: adjust_available(listing_id, held), using=using)
+    return held
+
+
+def release_expired_reservations(batch_size=1000):
+    """
+    Releases every hold past its expiry, a batch at a time: one DELETE for the
+    holds and one UPDATE for their listings' counters per batch. Holds an order or
+    release has locked are skipped, since those are being used up anyway.
+    Returns the number of holds released.
+    """
+    using = router.db_for_write(StockReservation)
+    released = 0
+    while True:
+        with transaction.atomic(using=using):
+            expired = list(
+                StockReservation.objects.using(using).select_for_update(skip_locked=True)
+                .filter(expires_at__lte=timezone.now()).order_by('expires_at')
+                .values_list('id', 'listing_id', 'quantity')[:batch_size]
+            )
+            if not expired:
+                break
+            bags = {}
+            for _, listing_id, quantity in expired:
+                bags[listing_id] = bags.get(listing_id, 0) + quantity
+
+            StockReservation.objects.using(using).filter(pk__in=[row[0] for row in expired]).delete()
+            held = Case(*[When(pk=listing_id, then=Value(n)) for listing_id, n in bags.items()], output_field=IntegerField())
+            SugarListing.objects.using(using).filter(pk__in=list(bags)).update(
+                quantity_reserved=Greatest(F('quantity_reserved') - held, Value(0)),
+            )
+
+            def refresh(bags=bags):
+                for listing_id, n in bags.items():
+                    adjust_available(listing_id, n)
+            transaction.on_commit(refresh, using=using)
+        released += len(expired)
+        if len(expired) < batch_size:
+            break
+    return released
@@ -0,0 +1,270 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.db import router, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Max, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.urls import reverse
+from django.utils import timezone
+from notifications.broker import publish, user_channel
+from notifications.models import Notification
+from notifications.unread import forget_unread_count
+from trading_engine.orderbook import BUY, from_ticks
+from trading_engine.signals import UndeliverableTrades
+from users.models import Seller
+from .availability import forget_available
+from .models import Fill, Order, Settlement, SugarListing
+from .risk import ledger, to_cents
+from .stats import rebuild_buyer_stats
+
+# How long the engine's process keeps its symbol -> listing map before re-reading it
+SYMBOL_REFRESH = 30
+# Rows per INSERT/UPDATE statement in a settlement run
+SETTLEMENT_BATCH = 1000
+
+
+class SettlementConflict(Exception):
+    """
+    Another run settled some of the same fills; this run is rolled back.
+    """
+
+
+class FillConflict(UndeliverableTrades):
+    """
+    A trade's sequence number is already recorded for a different fill in its listing.
+    """
+
+
+_symbols = {}
+_symbols_read_at = None
+_symbols_lock = threading.Lock()
+
+
+def listing_for_symbol(symbol):
+    """
+    The id of the listing trading in `symbol`, or None, from a map re-read every
+    SYMBOL_REFRESH seconds. Link a listing to its symbol before it starts trading.
+    """
+    global _symbols, _symbols_read_at
+    now = time.monotonic()
+    if _symbols_read_at is None or now - _symbols_read_at > SYMBOL_REFRESH:
+        with _symbols_lock:
+            if _symbols_read_at is None or now - _symbols_read_at > SYMBOL_REFRESH:
+                # A failed read is not retried until the next refresh either
+                _symbols_read_at = now
+                rows = (
+                    SugarListing.objects.using(router.db_for_read(SugarListing))
+                    .filter(trading_symbol__isnull=False).values_list('trading_symbol', 'id')
+                )
+                _symbols = {symbol: listing_id for symbol, listing_id in rows}
+    return _symbols.get(symbol)
+
+
+def forget_symbols():
+    global _symbols_read_at
+    _symbols_read_at = None
+
+
+def record_fills(symbol, trades, at):
+    """
+    Stores the trades of a listing's book as Fills, one INSERT per batch of trades.
+    Trades in other books, without both owners or between an owner and themselves
+    are not settled. Returns the number of fills recorded.
+
+    The engine may send a trade again, so one already recorded identically is
+    skipped; one recorded differently under the same sequence raises FillConflict
+    rather than being dropped, and the engine sets the trades aside in its
+    dead-letter log.
+    """
+    listing_id = listing_for_symbol(symbol)
+    if listing_id is None:
+        return 0
+    fills = []
+    for trade in trades:
+        buyer, seller = (trade.taker_owner, trade.maker_owner) if trade.side == BUY else (trade.maker_owner, trade.taker_owner)
+        if buyer is None or seller is None or buyer == seller:
+            continue
+        fills.append(Fill(
+            listing_id=listing_id, buyer_id=buyer, seller_id=seller, quantity=trade.quantity,
+            price=from_ticks(trade.price), sequence=trade.sequence, executed_at=at,
+        ))
+    if not fills:
+        return 0
+    using = router.db_for_write(Fill)
+    recorded = {
+        fill.sequence: fill for fill in
+        Fill.objects.using(using).filter(listing_id=listing_id, sequence__in=[fill.sequence for fill in fills])
+    }
+    new = []
+    for fill in fills:
+        stored = recorded.get(fill.sequence)
+        if stored is None:
+            new.append(fill)
+        elif (stored.buyer_id, stored.seller_id, stored.quantity, stored.price) != (fill.buyer_id, fill.seller_id, fill.quantity, fill.price):
+            raise FillConflict(f'Trade {fill.sequence} in listing #{listing_id} does not match the fill recorded for it')
+    Fill.objects.using(using).bulk_create(new)
+    return len(new)
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return start, start + timedelta(days=1)
+
+
+def _listing_owners(listing_ids, using):
+    """
+    Maps listing id -> the user id of the listing's seller, across the two databases.
+    """
+    seller_ids = dict(SugarListing.objects.using(using).filter(pk__in=listing_ids).values_list('id', 'seller_id'))
+    users = dict(
+        Seller.objects.using('credentials')
+        .filter(pk__in={seller_id for seller_id in seller_ids.values() if seller_id})
+        .values_list('id', 'user_id')
+    )
+    return {listing_id: users.get(seller_id) for listing_id, seller_id in seller_ids.items()}
+
+
+def settle_day(day):
+    """
+    Settles the unsettled fills executed on `day` (a date, in the current time zone).
+
+    Fills are netted per buyer, seller and listing by one aggregate query, so the
+    run's cost grows with the number of trading pairs rather than fills. For each
+    pair it books a Confirmed Order and a Settlement. It then moves the listing
+    seller's net sales out of their listing's stock and marks the fills settled.
+    All of this is bulk INSERTs and one UPDATE per batch, in one transaction,
+    which also rebuilds the buyers' order totals since bulk writes send no signals.
+
+    After the commit the settled amounts move from trading to order exposure and
+    each party gets one notification for the day. Returns a summary dict.
+    """
+    started = time.perf_counter()
+    using = router.db_for_write(Fill)
+    start, end = _day_bounds(day)
+    amount_field = DecimalField(max_digits=14, decimal_places=2)
+
+    with transaction.atomic(using=using):
+        fills = Fill.objects.using(using).filter(settled_on__isnull=True, executed_at__gte=start, executed_at__lt=end)
+        # Fills recorded while this runs are left for the next run
+        last_id = fills.aggregate(last=Max('id'))['last']
+        if last_id is None:
+            return {'day': day.isoformat(), 'fills': 0, 'settlements': 0, 'parties': 0, 'listings': 0, 'seconds': 0}
+        fills = fills.filter(id__lte=last_id)
+
+        pairs = [
+            {
+                'buyer_id': row['buyer_id'], 'seller_id': row['seller_id'], 'listing_id': row['listing_id'],
+                'quantity': row['bags'], 'amount': row['value'], 'fill_count': row['count'],
+            }
+            for row in (
+                fills.order_by().values('buyer_id', 'seller_id', 'listing_id')
+                .annotate(bags=Sum('quantity'), value=Sum(F('price') * F('quantity'), output_field=amount_field), count=Count('id'))
+            )
+        ]
+
+        orders = Order.objects.using(using).bulk_create(
+            [
+                Order(buyer_id=pair['buyer_id'], listing_id=pair['listing_id'], quantity=pair['quantity'],
+                      total_price=pair['amount'], status='Confirmed')
+                for pair in pairs
+            ],
+            batch_size=SETTLEMENT_BATCH,
+        )
+        Settlement.objects.using(using).bulk_create(
+            [
+                Settlement(day=day, order=order, **pair)
+                for pair, order in zip(pairs, orders)
+            ],
+            batch_size=SETTLEMENT_BATCH,
+        )
+
+        # Stock only leaves a listing when its own seller sells (or comes back when they buy)
+        owners = _listing_owners({pair['listing_id'] for pair in pairs}, using)
+        stock = {}
+        for pair in pairs:
+            owner = owners.get(pair['listing_id'])
+            if owner == pair['seller_id']:
+                stock[pair['listing_id']] = stock.get(pair['listing_id'], 0) - pair['quantity']
+            elif owner == pair['buyer_id']:
+                stock[pair['listing_id']] = stock.get(pair['listing_id'], 0) + pair['quantity']
+        stock = {listing_id: change for listing_id, change in stock.items() if change}
+        listing_ids = list(stock)
+        for i in range(0, len(listing_ids), SETTLEMENT_BATCH):
+            batch = listing_ids[i:i + SETTLEMENT_BATCH]
+            change = Case(
+                *[When(pk=listing_id, then=Value(stock[listing_id])) for listing_id in batch],
+                output_field=IntegerField(),
+            )
+            # The engine does not check stock, so an oversold listing stops at zero
+            SugarListing.objects.using(using).filter(pk__in=batch).update(
+                quantity_available=Greatest(F('quantity_available') + change, Value(0)),
+            )
+
+        settled = fills.update(settled_on=day)
+        expected = sum(pair['fill_count'] for pair in pairs)
+        if settled != expected:
+            raise SettlementConflict(f'Expected to settle {expected} fills for {day} but marked {settled}')
+
+        rebuild_buyer_stats({pair['buyer_id'] for pair in pairs})
+
+    bought, sold = {}, {}
+    for pair in pairs:
+        for totals, party in ((bought, pair['buyer_id']), (sold, pair['seller_id'])):
+            bags, amount, count = totals.get(party, (0, Decimal(0), 0))
+            totals[party] = (bags + pair['quantity'], amount + pair['amount'], count + pair['fill_count'])
+
+    # Settled buys are now open orders rather than engine fills
+    cents = {buyer_id: to_cents(amount) for buyer_id, (_, amount, _) in bought.items()}
+    for buyer_id, value in cents.items():
+        ledger.adjust_order(buyer_id, value)
+    ledger.release_settled(cents)
+    forget_available(listing_ids)
+
+    parties = notify_parties(day, bought, sold, event_key=f'settlement:{day.isoformat()}:{last_id}')
+    return {
+        'day': day.isoformat(),
+        'fills': expected,
+        'settlements': len(pairs),
+        'parties': parties,
+        'listings': len(stock),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def _describe(side, totals):
+    bags, amount, count = totals
+    return f'{side} {bags} bags for KES {amount:,.2f} in {count} trade{"s" if count != 1 else ""}'
+
+
+def notify_parties(day, bought, sold, event_key):
+    """
+    Sends each buyer and seller one notification summing up their settled trades,
+    however many fills they had. Idempotent per event_key. Returns the number of parties.
+    """
+    link = reverse('order_history')
+    notifications = []
+    for user_id in bought.keys() | sold.keys():
+        parts = [_describe(side, totals[user_id]) for side, totals in (('bought', bought), ('sold', sold)) if user_id in totals]
+        message = f'Your trades on {day:%d %b %Y} have settled: {"; ".join(parts)}.'
+        notifications.append(Notification(user_id=user_id, message=message[:255], link=link, event_key=event_key))
+    Notification.objects.using('credentials').bulk_create(notifications, batch_size=SETTLEMENT_BATCH, ignore_conflicts=True)
+
+    # bulk_create sends no post_save, so count and push them here
+    for notification in notifications:
+        forget_unread_count(notification.user_id)
+        publish(user_channel(notification.user_id), {'kind': 'personal', 'message': notification.message, 'link': link})
+    return len(notifications)
+
+
+def unsettled_days(before):
+    """
+    The days before `before` (a date) that still have unsettled fills, oldest first.
+    """
+    start, _ = _day_bounds(before)
+    moments = (
+        Fill.objects.using(router.db_for_read(Fill))
+        .filter(settled_on__isnull=True, executed_at__lt=start)
+        .datetimes('executed_at', 'day')
+    )
+    return [moment.date() for moment in moments]
@@ -1,10 +1,17 @@
 # market/signals.py
 from django.db import transaction
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.urls import reverse
-from .models import Order
+from .models import Order, SugarListing
 from notifications.models import Notification
+from .stats import record_order_created, record_status_change, record_order_deleted
+from .risk import OPEN_STATUSES, ledger, to_cents
+from users.models import CustomUser, Seller
+from trading_engine.engine import normalise_symbol
+from trading_engine.signals import trades_executed
+from .settlement import record_fills
+from .availability import forget_available
 
 def create_order_status_notification(buyer, order_id, status):
     """Creates a notification for an order status change."""
@@ -19,10 +26,98 @@ def order_status_notification(sender, instance, **kwargs):
     """
     Triggers a notification when an order's status changes.
     """
-    if instance.pk:
-        try:
-            original = sender.objects.get(pk=instance.pk)
-            if original.status != instance.status:
-                transaction.on_commit(lambda: create_order_status_notification(instance.buyer, instance.id, instance.status))
-        except sender.DoesNotExist:
-            pass
\ No newline at end of file
+    if instance.has_changed('status'):
+        transaction.on_commit(lambda: create_order_status_notification(instance.buyer, instance.id, instance.status))
+
+@receiver(post_save, sender=Order)
+def update_buyer_stats_on_save(sender, instance, created, **kwargs):
+    """
+    Keeps the buyer's order totals current, in the same transaction as the order.
+    """
+    if created:
+        record_order_created(instance)
+    elif instance.has_changed('status'):
+        record_status_change(instance, instance.previous('status'))
+
+@receiver(post_delete, sender=Order)
+def update_buyer_stats_on_delete(sender, instance, **kwargs):
+    record_order_deleted(instance)
+
+@receiver(post_save, sender=Order)
+def update_exposure_on_save(sender, instance, created, using, **kwargs):
+    """
+    Moves the order's value in or out of the buyer's credit exposure once the
+    change commits: delivery settles an order, and orders created outside
+    place_order (which reserves its own) are counted as they are.
+    """
+    if created:
+        was_open = getattr(instance, 'exposure_reserved', False)
+    elif instance.has_changed('status'):
+        was_open = instance.previous('status') in OPEN_STATUSES
+    else:
+        return
+    is_open = instance.status in OPEN_STATUSES
+    if was_open != is_open:
+        cents = to_cents(instance.total_price) * (1 if is_open else -1)
+        transaction.on_commit(lambda: ledger.adjust_order(instance.buyer_id, cents), using=using)
+
+@receiver(post_delete, sender=Order)
+def update_exposure_on_delete(sender, instance, using, **kwargs):
+    status = instance.previous('status') or instance.status
+    if status in OPEN_STATUSES:
+        cents = to_cents(instance.total_price)
+        transaction.on_commit(lambda: ledger.adjust_order(instance.buyer_id, -cents), using=using)
+
+@receiver(pre_save, sender=SugarListing)
+def copy_seller_company_name(sender, instance, **kwargs):
+    """
+    Fills in the denormalised company name when a listing gets (or changes) its seller.
+    """
+    if instance.pk is None or instance.has_changed('seller'):
+        seller = (
+            Seller.objects.using('credentials').select_related('user').filter(pk=instance.seller_id).first()
+            if instance.seller_id else None
+        )
+        instance.company_name = (seller.user.company_name or '') if seller else ''
+
+@receiver(pre_save, sender=SugarListing)
+def normalise_trading_symbol(sender, instance, **kwargs):
+    """
+    Stores the symbol the way the engine spells it, and a blank one as NULL so it
+    does not collide with other unlinked listings.
+    """
+    instance.trading_symbol = normalise_symbol(instance.trading_symbol) if instance.trading_symbol else None
+
+@receiver(post_save, sender=SugarListing)
+@receiver(post_delete, sender=SugarListing)
+def refresh_available_stock(sender, instance, using, **kwargs):
+    """
+    Drops the cached available-to-promise after a listing is edited or removed.
+    """
+    transaction.on_commit(lambda: forget_available([instance.pk]), using=using)
+
+@receiver(post_save, sender=CustomUser)
+def refresh_credit_limit(sender, instance, created, **kwargs):
+    if not created and instance.has_changed('credit_limit'):
+        ledger.forget_limit(instance.pk)
+
+@receiver(post_save, sender=CustomUser)
+def sync_listing_company_names(sender, instance, created, **kwargs):
+    """
+    Copies a seller's new company name onto their listings.
+    """
+    if created or not instance.has_changed('company_name'):
+        return
+    seller_ids = list(Seller.objects.using('credentials').filter(user=instance).values_list('id', flat=True))
+    if seller_ids:
+        SugarListing.objects.using('sugarprices').filter(seller_id__in=seller_ids).update(
+            company_name=instance.company_name or ''
+        )
+
+@receiver(trades_executed)
+def record_trading_fills(sender, symbol, trades, at, **kwargs):
+    """
+    Keeps trades in listings' books for the end-of-day settlement. Errors are
+    left to the engine, which sends the trades again until they are recorded.
+    """
+    record_fills(symbol, trades, at)
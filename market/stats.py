@@ -0,0 +1,85 @@
+from django.db import router
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce
+from .models import BuyerOrderStats, Order
+
+
+def _apply(buyer_id, **deltas):
+    """
+    Adds `deltas` to the buyer's totals with one UPDATE, creating their row on first use.
+    """
+    using = router.db_for_write(BuyerOrderStats)
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not changes:
+        return
+    if not BuyerOrderStats.objects.using(using).filter(buyer_id=buyer_id).update(**changes):
+        BuyerOrderStats.objects.using(using).get_or_create(buyer_id=buyer_id)
+        BuyerOrderStats.objects.using(using).filter(buyer_id=buyer_id).update(**changes)
+
+
+def _status_field(status):
+    return BuyerOrderStats.STATUS_FIELDS.get(status)
+
+
+def record_order_created(order):
+    deltas = {'order_count': 1, 'bag_count': order.quantity, 'total_spend': order.total_price}
+    if _status_field(order.status):
+        deltas[_status_field(order.status)] = 1
+    _apply(order.buyer_id, **deltas)
+
+
+def record_status_change(order, previous_status):
+    deltas = {}
+    if _status_field(previous_status):
+        deltas[_status_field(previous_status)] = -1
+    if _status_field(order.status):
+        deltas[_status_field(order.status)] = deltas.get(_status_field(order.status), 0) + 1
+    _apply(order.buyer_id, **deltas)
+
+
+def record_order_deleted(order):
+    deltas = {'order_count': -1, 'bag_count': -order.quantity, 'total_spend': -order.total_price}
+    # The status it was stored with, in case it was changed in memory before the delete
+    status = order.previous('status') or order.status
+    if _status_field(status):
+        deltas[_status_field(status)] = -1
+    _apply(order.buyer_id, **deltas)
+
+
+def rebuild_buyer_stats(buyer_ids=None):
+    """
+    Recomputes totals from the orders themselves, for every buyer or just `buyer_ids`.
+    Used to backfill and to repair drift after writes that skip model signals
+    (QuerySet.update, raw SQL). Returns the number of buyers rebuilt.
+    """
+    using = router.db_for_write(BuyerOrderStats)
+    orders = Order.objects.using(using)
+    if buyer_ids is not None:
+        orders = orders.filter(buyer_id__in=buyer_ids)
+
+    status_counts = {
+        field: Count('id', filter=Q(status=status))
+        for status, field in BuyerOrderStats.STATUS_FIELDS.items()
+    }
+    rows = (
+        orders.order_by().values('buyer_id')
+        .annotate(
+            order_count=Count('id'),
+            bag_count=Coalesce(Sum('quantity'), 0),
+            total_spend=Coalesce(Sum('total_price'), 0, output_field=DecimalField(max_digits=14, decimal_places=2)),
+            **status_counts,
+        )
+    )
+
+    rebuilt = 0
+    for row in rows:
+        buyer_id = row.pop('buyer_id')
+        BuyerOrderStats.objects.using(using).update_or_create(buyer_id=buyer_id, defaults=row)
+        rebuilt += 1
+
+    # Buyers whose orders have all gone
+    stale = BuyerOrderStats.objects.using(using).exclude(buyer_id__in=orders.values('buyer_id'))
+    if buyer_ids is not None:
+        stale = stale.filter(buyer_id__in=buyer_ids)
+    stale.delete()
+    return rebuilt
@@ -0,0 +1,35 @@
+from celery import shared_task
+from django.utils import timezone
+from .risk import reconcile_exposure
+from .settlement import settle_day, unsettled_days
+from .services import release_expired_reservations
+
+@shared_task
+def reconcile_buyer_exposure():
+    """
+    Corrects drift in the cached exposure ledger from the orders themselves.
+    """
+    drifted = reconcile_exposure()
+    if drifted:
+        print(f"Corrected exposure for {drifted} buyers")
+    return {'drifted': drifted}
+
+@shared_task
+def settle_trading_days():
+    """
+    Settles every finished day that still has unsettled fills, oldest first.
+    """
+    results = [settle_day(day) for day in unsettled_days(timezone.localdate())]
+    for result in results:
+        print(f"Settled {result['fills']} fills for {result['day']} into {result['settlements']} settlements in {result['seconds']}s")
+    return results
+
+@shared_task
+def release_expired_stock_reservations():
+    """
+    Gives the bags of expired stock holds back to their listings.
+    """
+    released = release_expired_reservations()
+    if released:
+        print(f"Released {released} expired stock reservations")
+    return {'released': released}
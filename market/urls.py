@@ -3,7 +3,11 @@ from . import views
 
 urlpatterns = [
     path('', views.listing_list, name='listing_list'),
+    path('search/', views.listing_search, name='listing_search'),
     path('history/', views.order_history, name='order_history'),
     path('listing/<int:pk>/', views.listing_detail, name='listing_detail'),
     path('listing/<int:pk>/order/', views.place_order, name='place_order'),
+    path('listing/<int:pk>/reserve/', views.reserve_stock, name='reserve_stock'),
+    path('listing/<int:pk>/reserve/release/', views.release_stock, name='release_stock'),
+    path('listing/<int:pk>/availability/', views.listing_availability, name='listing_availability'),
 ]
\ No newline at end of file
@@ -1,14 +1,21 @@
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import transaction
-from .models import SugarListing, Order
+from django.views.decorators.http import require_POST
+from .models import SugarListing, Order, BuyerOrderStats, StockReservation
 from .forms import OrderForm
-from users.models import Seller
+from sugarqube.pagination import paginate_keyset
+from .search import search_listings, SearchUnavailable
+from .services import place_order as place_order_for_buyer, OrderError, reserve_stock as reserve_stock_for_buyer, release_reservation
+from .availability import available_to_promise
 
 def listing_list(request):
     """
-    This view returns a list of all available sugar products
+    This view returns a page of the available sugar products.
+    Sorting and paging happen in the database, seeking from the cursor in
+    ?after= or ?before= along an index on the sort key.
     """
     sort_by = request.GET.get('sort', 'seller__user__company_name') # Default sort
     valid_sort_fields = [
@@ -23,25 +30,64 @@ def listing_list(request):
     if sort_by not in valid_sort_fields:
         sort_by = 'seller__user__company_name'
 
-    # Fetch all listings from the 'sugarprices' database
-    listings = SugarListing.objects.using('sugarprices').filter(quantity_available__gt=0)
-
-    # Fetch the related seller and user data from the 'credentials' database
-    for listing in listings:
-        listing.seller = Seller.objects.using('credentials').get(pk=listing.seller_id)
+    # Sellers live in the 'credentials' db, so the company name is sorted on the listing's own copy
+    ordering = sort_by.replace('seller__user__company_name', 'company_name')
 
-    # Sort the listings in Python
-    if 'seller__user__company_name' in sort_by:
-        listings = sorted(listings, key=lambda l: l.seller.user.company_name, reverse=sort_by.startswith('-'))
-    else:
-        listings = sorted(listings, key=lambda l: getattr(l, sort_by.replace('-', '')), reverse=sort_by.startswith('-'))
+    listings = SugarListing.objects.using('sugarprices').filter(quantity_available__gt=0)
+    try:
+        page = paginate_keyset(
+            listings, ordering,
+            after=request.GET.get('after'), before=request.GET.get('before')
+        )
+    except ValueError:
+        # A stale or tampered cursor starts again from the first page
+        page = paginate_keyset(listings, ordering)
 
     context = {
-        'listings': listings,
+        'listings': page,
+        'page': page,
         'current_sort': sort_by
     }
     return render(request, 'market/listing_list.html', context)
 
+def listing_search(request):
+    """
+    JSON search API over in-stock listings, best match first.
+    ?q= is the search text; origin, sugar_type, min_price, max_price and
+    order_quantity narrow the results. Pass next_cursor back as ?after= for more.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'status': 'error', 'message': 'A search query is required'}, status=400)
+
+    try:
+        page_size = int(request.GET.get('limit', 20))
+        listings, next_cursor = search_listings(
+            query, request.GET, after=request.GET.get('after'), page_size=page_size
+        )
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except SearchUnavailable as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=503)
+
+    results = [{
+        'id': listing.pk,
+        'company_name': listing.company_name,
+        'sugar_type': listing.sugar_type,
+        'origin': listing.origin,
+        'price_per_bag': str(listing.price_per_bag),
+        'quantity_available': listing.quantity_available,
+        'minimum_order_quantity': listing.minimum_order_quantity,
+        'rank': round(listing.rank, 4),
+        'url': reverse('listing_detail', args=[listing.pk]),
+    } for listing in listings]
+
+    return JsonResponse({
+        'results': results,
+        'has_more': next_cursor is not None,
+        'next_cursor': next_cursor,
+    })
+
 @login_required
 def listing_detail(request, pk):
     """
@@ -49,10 +95,17 @@ def listing_detail(request, pk):
     """
     listing = get_object_or_404(SugarListing, pk=pk) #get page or 404 error
     form = OrderForm()
-    return render(request, 'market/listing_detail.html', {'listing': listing, 'form': form})
+    return render(request, 'market/listing_detail.html', _detail_context(request, listing, form))
+
+def _detail_context(request, listing, form):
+    # Stock held by other buyers is not on offer; the buyer's own hold is shown with it
+    available = available_to_promise(listing.pk)
+    if available is None:
+        available = max(0, listing.quantity_available - listing.quantity_reserved)
+    hold = StockReservation.objects.filter(listing=listing, buyer=request.user).first()
+    return {'listing': listing, 'form': form, 'available': available, 'hold': hold}
 
 @login_required
-@transaction.atomic
 def place_order(request, pk):
     """
     This view processes the order submission for a specific sugar product
@@ -72,22 +125,12 @@ def place_order(request, pk):
             """
             quantity = form.cleaned_data['quantity']
 
-            if quantity < listing.minimum_order_quantity:
-                messages.error(request, f'The minimum order quantity is {listing.minimum_order_quantity} bags.')
-            elif quantity > listing.quantity_available:
-                messages.error(request, 'The requested quantity exceeds available stock.')
+            # Stock is checked and taken in one atomic UPDATE on the listings' database
+            try:
+                place_order_for_buyer(request.user, listing.pk, quantity)
+            except OrderError as e:
+                messages.error(request, str(e))
             else:
-                total_price = quantity * listing.price_per_bag
-                Order.objects.create(
-                    buyer=request.user,
-                    listing=listing,
-                    quantity=quantity,
-                    total_price=total_price,
-                    status='Pending'
-                )
-                listing.quantity_available -= quantity
-                listing.save()
-
                 messages.success(request, 'Your order has been placed successfully!')
                 return redirect('order_history')
     else:
@@ -95,10 +138,63 @@ def place_order(request, pk):
         return redirect('listing_detail', pk=pk)
 
     # If form is invalid or has errors, re-render the detail page
-    return render(request, 'market/listing_detail.html', {'listing': listing, 'form': form})
+    return render(request, 'market/listing_detail.html', _detail_context(request, listing, form))
+
+@login_required
+@require_POST
+def reserve_stock(request, pk):
+    """
+    API endpoint to hold `quantity` bags of a listing for the buyer while they order,
+    for STOCK_RESERVATION_TTL seconds. Replaces any hold they already have on it.
+    """
+    if not request.user.is_verified_buyer:
+        return JsonResponse({'status': 'error', 'message': 'You must be a verified buyer to reserve stock'}, status=403)
+    try:
+        quantity = int(request.POST.get('quantity', 0))
+        if quantity < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Quantity must be a whole number of bags'}, status=400)
+
+    try:
+        reservation = reserve_stock_for_buyer(request.user, pk, quantity)
+    except SugarListing.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Listing not found'}, status=404)
+    except OrderError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({
+        'status': 'success',
+        'reservation_id': reservation.pk,
+        'quantity': reservation.quantity,
+        'expires_at': reservation.expires_at.isoformat(),
+        'available': available_to_promise(pk),
+    })
+
+@login_required
+@require_POST
+def release_stock(request, pk):
+    """
+    API endpoint to give back the buyer's hold on a listing.
+    """
+    released = release_reservation(request.user, pk)
+    return JsonResponse({'status': 'success', 'released': released, 'available': available_to_promise(pk)})
+
+def listing_availability(request, pk):
+    """
+    JSON with the bags of a listing still on offer, served from memory rather than the database.
+    """
+    available = available_to_promise(pk)
+    if available is None:
+        return JsonResponse({'status': 'error', 'message': 'Listing not found'}, status=404)
+    return JsonResponse({'listing_id': pk, 'available': available})
 
 @login_required
 def order_history(request):
+    """
+    This view returns the buyer's orders a page at a time, with their running totals.
+    Pages seek from the cursor in ?after= or ?before= along the buyer's history index,
+    so a large trading account loads as fast as a new one.
+    """
     # Get sorting parameters from the URL (e.g., ?sort=status&dir=asc)
     sort_by = request.GET.get('sort', 'created_at')
     sort_dir = request.GET.get('dir', 'desc')
@@ -116,11 +212,21 @@ def order_history(request):
         ordering = sort_by
         next_sort_dir = 'desc'
 
-    # Query the database with the dynamic ordering
-    orders = Order.objects.filter(buyer=request.user).order_by(ordering)
+    # Query the database with the dynamic ordering, one page at a time.
+    # The listing is joined in so the template does not query it per row.
+    orders = Order.objects.filter(buyer=request.user).select_related('listing')
+    try:
+        page = paginate_keyset(
+            orders, ordering,
+            after=request.GET.get('after'), before=request.GET.get('before'), page_size=25
+        )
+    except ValueError:
+        page = paginate_keyset(orders, ordering, page_size=25)
 
     context = {
-        'orders': orders,
+        'orders': page,
+        'page': page,
+        'stats': BuyerOrderStats.objects.filter(buyer=request.user).first(),
         'sort_by': sort_by,
         'sort_dir': sort_dir,
         'next_sort_dir': next_sort_dir
@@ -0,0 +1,128 @@
+import json
+import queue
+import threading
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+BROADCAST_CHANNEL = 'notifications:broadcast'
+
+
+def user_channel(user_id):
+    return f'notifications:user:{user_id}'
+
+
+class LocalSubscription:
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=100)
+
+    def get(self, timeout=None):
+        """
+        Waits up to `timeout` seconds for the next message; returns None on timeout.
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+
+class LocalBroker:
+    """
+    In-memory pub/sub for a single process (development and tests).
+    Messages only reach subscribers served by the process that published them.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                pass  # A stalled client only misses pushes; it refetches on reconnect
+
+    def subscribe(self, *channels):
+        subscription = LocalSubscription(self, channels)
+        with self.lock:
+            for channel in channels:
+                self.subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscribers.get(channel, set()).discard(subscription)
+
+
+class RedisSubscription:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    def get(self, timeout=None):
+        message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout or 0)
+        if message is None:
+            return None
+        return json.loads(message['data'])
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisBroker:
+    """
+    Redis pub/sub, so notifications reach streams served by any process.
+    """
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message))
+
+    def subscribe(self, *channels):
+        pubsub = self.client.pubsub()
+        pubsub.subscribe(*channels)
+        return RedisSubscription(pubsub)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Returns the process-wide broker: Redis when NOTIFICATIONS_REDIS_URL is set,
+    otherwise the in-memory stand-in. A configured URL without the redis package
+    raises ImproperlyConfigured rather than quietly using the stand-in, whose
+    publishes (from Celery, say) would never reach the web processes' streams.
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                url = getattr(settings, 'NOTIFICATIONS_REDIS_URL', None)
+                try:
+                    _broker = RedisBroker(url) if url else LocalBroker()
+                except ImportError:
+                    raise ImproperlyConfigured('NOTIFICATIONS_REDIS_URL is set but the redis package is not installed')
+    return _broker
+
+
+def publish(channel, message):
+    """
+    Publishes without failing the caller on a broker error; a missed push is
+    recovered by the next fetch. A misconfigured broker still raises.
+    """
+    try:
+        get_broker().publish(channel, message)
+    except ImproperlyConfigured:
+        raise
+    except Exception as e:
+        print(f"Error publishing notification: {e}")
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_broadcastnotification_broadcastcursor_broadcastread'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-timestamp', '-id'], name='notification_unread_idx'),
+        ),
+    ]
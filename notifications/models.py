@@ -7,9 +7,71 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
     link = models.URLField(blank=True, null=True)
+    # Identifies the event a notification belongs to, so sending it again is a no-op
+    event_key = models.CharField(max_length=100, blank=True, null=True)
 
     def __str__(self):
         return self.message
 
     class Meta:
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'event_key'], name='unique_notification_per_event'),
+        ]
+        indexes = [
+            # Serves the unread list newest first, one page at a time
+            models.Index(fields=['user', 'is_read', '-timestamp', '-id'], name='notification_unread_idx'),
+        ]
+
+class BroadcastNotification(models.Model):
+    """
+    A notification for every user (market and exchange rate updates), stored once.
+    Users see broadcasts created after they joined that are past their read cursor
+    and not in their sparse read-set.
+    """
+    message = models.CharField(max_length=255)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    link = models.URLField(blank=True, null=True)
+    event_key = models.CharField(max_length=100, unique=True, blank=True, null=True)
+
+    def __str__(self):
+        return self.message
+
+    @classmethod
+    def send(cls, event_key, message, link=None):
+        """
+        Publishes a broadcast, once per event_key.
+        """
+        broadcast, _ = cls.objects.get_or_create(event_key=event_key, defaults={'message': message, 'link': link})
+        return broadcast
+
+    class Meta:
+        ordering = ['-timestamp']
+
+
+class BroadcastCursor(models.Model):
+    """
+    Every broadcast with an id up to last_read_id counts as read for the user.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='broadcast_cursor')
+    last_read_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.user} read up to #{self.last_read_id}'
+
+
+class BroadcastRead(models.Model):
+    """
+    Sparse read-set for broadcasts read individually past the user's cursor.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='broadcast_reads')
+    broadcast = models.ForeignKey(BroadcastNotification, on_delete=models.CASCADE, related_name='reads')
+    read_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.user} read #{self.broadcast_id}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'broadcast'], name='unique_broadcast_read'),
+        ]
@@ -0,0 +1,37 @@
+# notifications/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import Notification, BroadcastNotification
+from .broker import publish, user_channel, BROADCAST_CHANNEL
+from .unread import adjust_unread_count, invalidate_all_unread_counts
+
+def notification_payload(notification, kind):
+    return {
+        'id': notification.id,
+        'kind': kind,
+        'message': notification.message,
+        'link': notification.link,
+    }
+
+@receiver(post_save, sender=Notification)
+def push_personal_notification(sender, instance, created, using, **kwargs):
+    """
+    Counts a new personal notification and pushes it to the user's open streams.
+    """
+    if created and not instance.is_read:
+        def push():
+            adjust_unread_count(instance.user_id, 1)
+            publish(user_channel(instance.user_id), notification_payload(instance, 'personal'))
+        transaction.on_commit(push, using=using)
+
+@receiver(post_save, sender=BroadcastNotification)
+def push_broadcast_notification(sender, instance, created, using, **kwargs):
+    """
+    Retires every cached count and pushes the broadcast to all open streams.
+    """
+    if created:
+        def push():
+            invalidate_all_unread_counts()
+            publish(BROADCAST_CHANNEL, notification_payload(instance, 'broadcast'))
+        transaction.on_commit(push, using=using)
@@ -0,0 +1,111 @@
+import time
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, F, Max, Min, OuterRef, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Notification, BroadcastNotification, BroadcastRead
+from .unread import invalidate_all_unread_counts
+
+# Updates that are stale once a newer one of the same kind exists. Personal rows
+# are matched on the message, broadcasts on the event_key their sender gives them.
+SUPERSEDED_MESSAGE_PREFIXES = ('Market Update:', 'Currency Update:')
+SUPERSEDED_EVENT_PREFIXES = ('price:', 'rate:')
+
+
+def _delete_in_batches(queryset, batch_size):
+    """
+    Deletes the rows matched by `queryset` a batch of primary keys at a time, so
+    each DELETE holds its locks briefly. Each batch is read after the last key of
+    the one before, so the whole run is one pass over the matches.
+    Returns the number of rows deleted.
+    """
+    model = queryset.model
+    deleted = 0
+    last = None
+    while True:
+        batch = queryset if last is None else queryset.filter(pk__gt=last)
+        ids = list(batch.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        model.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
+        last = ids[-1]
+
+
+def _delete_superseded_notifications(prefix, batch_size):
+    """
+    Deletes each user's notifications starting with `prefix` except their newest.
+    Ids grow with timestamps, so a row is superseded when the same user has one
+    with a higher id; the database picks those out batch by batch.
+    """
+    matching = Notification.objects.filter(message__startswith=prefix)
+    newer = matching.filter(user_id=OuterRef('user_id'), id__gt=OuterRef('pk'))
+    return _delete_in_batches(matching.filter(Exists(newer)), batch_size)
+
+
+def _delete_superseded_broadcasts(prefix, batch_size):
+    """
+    Deletes the broadcasts whose event_key starts with `prefix`, except the newest.
+    """
+    matching = BroadcastNotification.objects.filter(event_key__startswith=prefix).order_by()
+    newest = matching.aggregate(newest=Max('id'))['newest']
+    if newest is None:
+        return 0
+    return _delete_in_batches(matching.filter(id__lt=newest), batch_size)
+
+
+def _read_by_everyone(cutoff):
+    """
+    Broadcasts older than `cutoff` that every user who could see them has read:
+    those at or below the lowest read cursor of the users who joined before the
+    cutoff. Users without a cursor count as having read none, and broadcasts only
+    read one by one through the read-set are kept, so this errs towards keeping.
+    """
+    lowest = (
+        get_user_model().objects.filter(date_joined__lt=cutoff)
+        .aggregate(lowest=Min(Coalesce('broadcast_cursor__last_read_id', Value(0))))['lowest']
+    )
+    return BroadcastNotification.objects.filter(timestamp__lt=cutoff, id__lte=lowest or 0)
+
+
+@shared_task
+def compact_notifications(retention_days=None, batch_size=None):
+    """
+    Reclaims notification rows nobody needs any more:
+    read notifications older than the retention period, market and exchange rate
+    updates superseded by a newer one, broadcasts past the retention period that
+    every user has read, and read-set entries already covered by the user's
+    broadcast cursor.
+    Works in small batches and returns the rows reclaimed per kind.
+    """
+    started = time.perf_counter()
+    if retention_days is None:
+        retention_days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 30)
+    if batch_size is None:
+        batch_size = getattr(settings, 'NOTIFICATION_COMPACTION_BATCH', 1000)
+    cutoff = timezone.now() - timedelta(days=retention_days)
+
+    reclaimed = {
+        'read': _delete_in_batches(Notification.objects.filter(is_read=True, timestamp__lt=cutoff), batch_size),
+        'superseded': sum(
+            _delete_superseded_notifications(prefix, batch_size) for prefix in SUPERSEDED_MESSAGE_PREFIXES
+        ),
+        'superseded_broadcasts': sum(
+            _delete_superseded_broadcasts(prefix, batch_size) for prefix in SUPERSEDED_EVENT_PREFIXES
+        ),
+        'broadcasts': _delete_in_batches(_read_by_everyone(cutoff), batch_size),
+        'broadcast_reads': _delete_in_batches(
+            BroadcastRead.objects.filter(broadcast_id__lte=F('user__broadcast_cursor__last_read_id')), batch_size
+        ),
+    }
+
+    # Superseded rows may have been unread, so the cached counts can be stale
+    if reclaimed['superseded'] or reclaimed['superseded_broadcasts']:
+        invalidate_all_unread_counts()
+
+    reclaimed['total'] = sum(reclaimed.values())
+    reclaimed['seconds'] = round(time.perf_counter() - started, 3)
+    return reclaimed
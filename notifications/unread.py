@@ -0,0 +1,66 @@
+from django.core.cache import cache
+from django.db.models import Value, Subquery
+from django.db.models.functions import Coalesce
+from .models import Notification, BroadcastNotification, BroadcastCursor
+
+# Bumped whenever a change touches every user (a broadcast or compaction),
+# which retires all cached counts at once instead of touching one key per user
+GENERATION_KEY = 'notifications_count_generation'
+COUNT_TIMEOUT = 3600
+
+
+def unread_broadcasts(user):
+    """
+    Broadcasts the user has not read: created since they joined, past their
+    read cursor and not in their read-set. Builds a single query.
+    """
+    cursor = BroadcastCursor.objects.filter(user=user).values('last_read_id')[:1]
+    return (
+        BroadcastNotification.objects
+        .filter(timestamp__gte=user.date_joined, id__gt=Coalesce(Subquery(cursor), Value(0)))
+        .exclude(reads__user=user)
+    )
+
+
+def _count_key(user_id):
+    generation = cache.get(GENERATION_KEY, 0)
+    return f'notifications_unread_{user_id}_{generation}'
+
+
+def get_unread_count(user):
+    """
+    Returns the user's unread count (personal plus broadcast) from the cache,
+    counting in the database only after it was invalidated.
+    """
+    key = _count_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user=user, is_read=False).count() + unread_broadcasts(user).count()
+        cache.set(key, count, COUNT_TIMEOUT)
+    return count
+
+
+def adjust_unread_count(user_id, delta):
+    """
+    Applies a change to a cached count. A missing key is left for get_unread_count to rebuild.
+    """
+    key = _count_key(user_id)
+    try:
+        if delta >= 0:
+            cache.incr(key, delta)
+        else:
+            cache.decr(key, -delta)
+    except ValueError:
+        pass
+
+
+def forget_unread_count(user_id):
+    cache.delete(_count_key(user_id))
+
+
+def invalidate_all_unread_counts():
+    if not cache.add(GENERATION_KEY, 1, None):
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.set(GENERATION_KEY, 1, None)
@@ -3,5 +3,8 @@ from . import views
 
 urlpatterns = [
     path('api/get/', views.get_notifications, name='get_notifications'),
+    path('api/stream/', views.notification_stream, name='notification_stream'),
+    path('api/mark-read/all/', views.mark_all_as_read, name='mark_all_notifications_as_read'),
     path('api/mark-read/<int:notification_id>/', views.mark_as_read, name='mark_notification_as_read'),
+    path('api/mark-read/broadcast/<int:broadcast_id>/', views.mark_broadcast_as_read, name='mark_broadcast_as_read'),
 ]
\ No newline at end of file
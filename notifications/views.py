@@ -1,24 +1,100 @@
-from django.http import JsonResponse
+import json
+import random
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
-from .models import Notification
+from django.db import connections, router, transaction
+from django.db.models import CharField, Q, Value
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_POST
+from .models import Notification, BroadcastNotification, BroadcastRead, BroadcastCursor
+from .broker import get_broker, user_channel, BROADCAST_CHANNEL
+from .unread import unread_broadcasts, get_unread_count, adjust_unread_count, forget_unread_count
+
+NOTIFICATION_FIELDS = ('id', 'message', 'timestamp', 'link', 'kind')
+
+# Notifications per page, by default and at most
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Seconds between keep-alive comments, and before a stream closes so the worker is
+# recycled (the browser's EventSource reconnects on its own)
+STREAM_HEARTBEAT = 25
+STREAM_MAX_AGE = 300
+# Broadcasts reach every open stream at once; each stream waits up to this many
+# seconds before passing one on, so the tabs' refetches and recounts are spread out
+BROADCAST_JITTER = 5.0
+
+
+def _parse_cursor(value):
+    """
+    Splits a '<timestamp>,<id>' cursor into its parts; raises ValueError if malformed.
+    """
+    timestamp, _, pk = value.rpartition(',')
+    parsed = datetime.fromisoformat(timestamp)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed, int(pk)
+
+def _page_size(value):
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return PAGE_SIZE
 
 @login_required
 def get_notifications(request):
     """
-    API endpoint to fetch unread notifications for the logged-in user.
+    API endpoint to fetch unread notifications for the logged-in user, newest first.
+    Personal and broadcast notifications are merged in one query and paged by a
+    (timestamp, id) cursor: pass the returned next_cursor as ?cursor= for the next page.
     """
-    notifications = Notification.objects.filter(user=request.user, is_read=False)
-    count = notifications.count()
+    limit = _page_size(request.GET.get('limit'))
+    personal = Notification.objects.filter(user=request.user, is_read=False)
+    broadcasts = unread_broadcasts(request.user)
+
+    if request.GET.get('cursor'):
+        try:
+            timestamp, pk = _parse_cursor(request.GET['cursor'])
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Invalid cursor'}, status=400)
+        older = Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+        personal = personal.filter(older)
+        broadcasts = broadcasts.filter(older)
+
+    personal = personal.annotate(kind=Value('personal', output_field=CharField())).values(*NOTIFICATION_FIELDS)
+    broadcasts = broadcasts.annotate(kind=Value('broadcast', output_field=CharField())).values(*NOTIFICATION_FIELDS)
+    # One row past the page tells us whether another page exists without a COUNT
+    notifications = list(
+        personal.order_by().union(broadcasts.order_by(), all=True).order_by('-timestamp', '-id')[:limit + 1]
+    )
+    has_more = len(notifications) > limit
+    notifications = notifications[:limit]
+
     notifications_data = [{
-        'id': n.id,
-        'message': n.message,
-        'timestamp': n.timestamp.strftime('%b %d, %Y, %I:%M %p'),
-        'link': n.link
+        'id': n['id'],
+        'kind': n['kind'],
+        'message': n['message'],
+        'timestamp': n['timestamp'].strftime('%b %d, %Y, %I:%M %p'),
+        'link': n['link'],
+        'mark_read_url': reverse(
+            'mark_broadcast_as_read' if n['kind'] == 'broadcast' else 'mark_notification_as_read',
+            args=[n['id']]
+        ),
     } for n in notifications]
 
+    next_cursor = None
+    if has_more:
+        last = notifications[-1]
+        next_cursor = f"{last['timestamp'].isoformat()},{last['id']}"
+
     return JsonResponse({
-        'count': count,
-        'notifications': notifications_data
+        'count': get_unread_count(request.user),
+        'notifications': notifications_data,
+        'has_more': has_more,
+        'next_cursor': next_cursor,
     })
 
 @login_required
@@ -26,10 +102,102 @@ def mark_as_read(request, notification_id):
     """
     API endpoint to mark a specific notification as read.
     """
+    updated = Notification.objects.filter(id=notification_id, user=request.user, is_read=False).update(is_read=True)
+    if updated:
+        adjust_unread_count(request.user.pk, -1)
+    elif not Notification.objects.filter(id=notification_id, user=request.user).exists():
+        return JsonResponse({'status': 'error', 'message': 'Notification not found'}, status=404)
+    return JsonResponse({'status': 'success'})
+
+@login_required
+def mark_broadcast_as_read(request, broadcast_id):
+    """
+    API endpoint to mark a broadcast notification as read for the logged-in user.
+    """
+    if not BroadcastNotification.objects.filter(id=broadcast_id).exists():
+        return JsonResponse({'status': 'error', 'message': 'Notification not found'}, status=404)
+
+    # Broadcasts behind the read cursor or from before the user joined were never
+    # counted as unread, so marking them must not lower the count
+    counted = unread_broadcasts(request.user).filter(id=broadcast_id).exists()
+    _, created = BroadcastRead.objects.get_or_create(user=request.user, broadcast_id=broadcast_id)
+    if created and counted:
+        adjust_unread_count(request.user.pk, -1)
+    return JsonResponse({'status': 'success'})
+
+@login_required
+@require_POST
+def mark_all_as_read(request):
+    """
+    API endpoint to mark notifications as read in bulk, up to the newest ids the
+    user has seen: up_to for personal notifications and up_to_broadcast for
+    broadcasts. A missing or 0 bound marks none of that kind, so notifications that
+    arrive meanwhile, or were never shown, stay unread. Personal notifications are
+    marked with a single UPDATE and broadcasts by advancing the read cursor.
+    """
     try:
-        notification = Notification.objects.get(id=notification_id, user=request.user)
-        notification.is_read = True
-        notification.save()
-        return JsonResponse({'status': 'success'})
-    except Notification.DoesNotExist:
-        return JsonResponse({'status': 'error', 'message': 'Notification not found'}, status=404)
\ No newline at end of file
+        up_to = int(request.POST.get('up_to') or 0)
+        up_to_broadcast = int(request.POST.get('up_to_broadcast') or 0)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid notification id'}, status=400)
+
+    marked = 0
+    if up_to > 0:
+        marked = Notification.objects.filter(user=request.user, is_read=False, id__lte=up_to).update(is_read=True)
+
+    if up_to_broadcast > 0:
+        with transaction.atomic(using=router.db_for_write(BroadcastCursor)):
+            cursor, _ = BroadcastCursor.objects.get_or_create(user=request.user)
+            if up_to_broadcast > cursor.last_read_id:
+                BroadcastCursor.objects.filter(pk=cursor.pk).update(last_read_id=up_to_broadcast)
+                # Reads at or below the cursor are now implied by it
+                BroadcastRead.objects.filter(user=request.user, broadcast_id__lte=up_to_broadcast).delete()
+
+    forget_unread_count(request.user.pk)
+    return JsonResponse({'status': 'success', 'marked': marked, 'count': get_unread_count(request.user)})
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@login_required
+def notification_stream(request):
+    """
+    Server-sent events endpoint that pushes new notifications and the unread
+    count as they happen. While nothing happens it only sends keep-alive
+    comments, so an idle tab costs no database queries.
+
+    Under WSGI each open stream holds a worker thread for up to STREAM_MAX_AGE
+    seconds, so the server needs a thread per expected open tab on top of its
+    normal pool (or an ASGI server for this URL). The stream gives its database
+    connections back between counts so it does not hold one as well.
+    """
+    user = request.user
+
+    def unread_count():
+        count = get_unread_count(user)
+        connections.close_all()
+        return count
+
+    def events():
+        subscription = get_broker().subscribe(user_channel(user.pk), BROADCAST_CHANNEL)
+        try:
+            yield "retry: 5000\n\n"
+            yield _sse_event('count', {'count': unread_count()})
+
+            closes_at = time.monotonic() + STREAM_MAX_AGE
+            while time.monotonic() < closes_at:
+                message = subscription.get(timeout=STREAM_HEARTBEAT)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message.get('kind') == 'broadcast':
+                    time.sleep(random.uniform(0, BROADCAST_JITTER))
+                yield _sse_event('notification', message)
+                yield _sse_event('count', {'count': unread_count()})
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
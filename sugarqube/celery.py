@@ -3,10 +3,16 @@ from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
 from celery.schedules import crontab
+from kombu import Queue
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sugarqube.settings')
 
+# The statsmodels fits are CPU-bound and already parallel across prefork children,
+# so stop each child from also starting a BLAS thread per core.
+for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(var, '1')
+
 app = Celery('sugarqube')
 
 # Using a string here means the worker doesn't have to serialize
@@ -18,10 +24,70 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+# Task priorities (Redis serves the lowest number first)
+PRIORITY_USER = 0       # forecasts someone is waiting on
+PRIORITY_DEFAULT = 5
+PRIORITY_SCHEDULED = 9  # beat and post-write cache prewarming
+
+# Queues, so minutes-long forecasts never starve notification work and emails.
+# Run a worker per queue with its own concurrency, e.g.
+#   celery -A sugarqube worker -Q forecasting -c 2 -n forecasting@%h
+#   celery -A sugarqube worker -Q notifications -c 8 -n notifications@%h
+#   celery -A sugarqube worker -Q email -c 4 -n email@%h
+#   celery -A sugarqube worker -Q default -c 4 -n default@%h
+# Keep the forecasting concurrency at or below the number of CPU cores.
+app.conf.task_default_queue = 'default'
+app.conf.task_queues = (
+    Queue('default'),
+    Queue('forecasting'),
+    Queue('notifications'),
+    Queue('email'),
+)
+app.conf.task_routes = {
+    'dashboard.tasks.*': {'queue': 'forecasting'},
+    'notifications.tasks.*': {'queue': 'notifications'},
+    '*.send_*_email': {'queue': 'email'},
+}
+
+app.conf.task_default_priority = PRIORITY_DEFAULT
+app.conf.broker_transport_options = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+
+# Prefork limits: a child only reserves the task it is running, so a long fit
+# does not hold short tasks hostage, and children are recycled to release memory
+# held by the model libraries.
+app.conf.worker_prefetch_multiplier = 1
+app.conf.task_acks_late = True
+app.conf.worker_max_tasks_per_child = 50
+
 # Periodic task configuration
 app.conf.beat_schedule = {
     'prewarm-prediction-cache-every-30-minutes': {
         'task': 'dashboard.tasks.prewarm_prediction_cache',
         'schedule': crontab(minute='*/30'),  # Every 30 minutes
+        'options': {'priority': PRIORITY_SCHEDULED},
+    },
+    'compact-notifications-daily': {
+        'task': 'notifications.tasks.compact_notifications',
+        'schedule': crontab(hour=3, minute=30),  # Daily, off-peak
+        'options': {'priority': PRIORITY_SCHEDULED},
+    },
+    'reconcile-buyer-exposure-every-5-minutes': {
+        'task': 'market.tasks.reconcile_buyer_exposure',
+        'schedule': crontab(minute='*/5'),
+        'options': {'priority': PRIORITY_SCHEDULED},
+    },
+    'settle-trading-days-daily': {
+        'task': 'market.tasks.settle_trading_days',
+        'schedule': crontab(hour=0, minute=15),  # Just after the trading day closes
+        'options': {'priority': PRIORITY_SCHEDULED},
+    },
+    'release-expired-stock-reservations-every-minute': {
+        'task': 'market.tasks.release_expired_stock_reservations',
+        'schedule': crontab(minute='*'),
+        'options': {'priority': PRIORITY_SCHEDULED},
     },
 }
\ No newline at end of file
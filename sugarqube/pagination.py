@@ -0,0 +1,117 @@
+import base64
+import json
+from django.db.models import Q
+
+# Rows per page unless the caller asks otherwise
+PAGE_SIZE = 24
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated queryset, with opaque cursors for its neighbours.
+    """
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """
+    Turns a cursor back into typed values for `fields`; raises ValueError if it is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValueError('Invalid cursor')
+    try:
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except Exception as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
+
+def _resolve_field(model, path):
+    """
+    Follows a lookup such as 'listing__sugar_type' to the field it ends on.
+    """
+    parts = path.split('__')
+    field = model._meta.get_field(parts[0])
+    for part in parts[1:]:
+        field = field.related_model._meta.get_field(part)
+    return field
+
+
+def _row_value(row, path):
+    *relations, last = path.split('__')
+    for relation in relations:
+        row = getattr(row, relation)
+    return getattr(row, last)
+
+
+def paginate_keyset(queryset, ordering, after=None, before=None, page_size=PAGE_SIZE):
+    """
+    Returns a KeysetPage of `queryset` sorted by `ordering` (a field name, '-' for
+    descending) with the primary key as tie-breaker.
+
+    Instead of an OFFSET each page seeks past the last row of the previous one,
+    so with an index on (field, id) every page costs the same however deep it is.
+    Pass a page's next_cursor as `after` or its previous_cursor as `before`.
+    The sort field must not be nullable. It may span a relation
+    ('listing__sugar_type'), in which case select_related it.
+    """
+    descending = ordering.startswith('-')
+    name = ordering.lstrip('-')
+    model = queryset.model
+    fields = [_resolve_field(model, name), model._meta.pk]
+
+    # Walking backwards is the same query in the opposite direction, reversed afterwards
+    cursor = before or after
+    backwards = bool(before)
+    ascending = descending == backwards
+
+    if cursor:
+        value, pk = decode_cursor(cursor, fields)
+        op = 'gt' if ascending else 'lt'
+        queryset = queryset.filter(Q(**{f'{name}__{op}': value}) | Q(**{name: value, f'pk__{op}': pk}))
+
+    prefix = '' if ascending else '-'
+    rows = list(queryset.order_by(f'{prefix}{name}', f'{prefix}pk')[:page_size + 1])
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(row):
+        return encode_cursor([_row_value(row, name), row.pk])
+
+    if not rows:
+        return KeysetPage(rows)
+    has_next = more if not backwards else True
+    has_previous = more if backwards else cursor is not None
+    return KeysetPage(
+        rows,
+        next_cursor=cursor_for(rows[-1]) if has_next else None,
+        previous_cursor=cursor_for(rows[0]) if has_previous else None,
+    )
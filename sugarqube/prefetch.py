@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.db import router
+
+# Ids per IN query, well under the parameter limits of every backend
+PREFETCH_BATCH_SIZE = 1000
+
+
+def _cache_key(model, pk):
+    return f'xdb_{model._meta.label_lower}_{pk}'
+
+
+def prefetch_cross_db(instances, field_name, select_related=(), only=(), using=None, cache_timeout=None):
+    """
+    Like prefetch_related for a foreign key into another database (db_constraint=False),
+    which Django cannot join or prefetch across.
+
+    Collects the ids held by `field_name` on `instances`, fetches the related objects
+    with one IN query on the related model's database (batched for very long lists) and
+    caches them on each instance, so `instance.<field_name>` no longer queries.
+    `select_related` is applied to that query and must stay within its database, and
+    `only` limits the columns loaded.
+
+    With `cache_timeout`, fetched objects are also kept in the cache for that many
+    seconds, which suits display data such as seller and user names. Pass `only`
+    with it so no more than the display fields end up in the cache.
+
+    Returns the instances as a list.
+    """
+    instances = list(instances)
+    if not instances:
+        return instances
+
+    field = instances[0]._meta.get_field(field_name)
+    model = field.related_model
+    using = using or router.db_for_read(model)
+
+    ids = {getattr(instance, field.attname) for instance in instances} - {None}
+    related = {}
+
+    if cache_timeout and ids:
+        cached = cache.get_many([_cache_key(model, pk) for pk in ids])
+        related = {obj.pk: obj for obj in cached.values()}
+        ids -= related.keys()
+
+    fetched = {}
+    ids = list(ids)
+    for start in range(0, len(ids), PREFETCH_BATCH_SIZE):
+        queryset = model._base_manager.using(using).filter(pk__in=ids[start:start + PREFETCH_BATCH_SIZE])
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if only:
+            queryset = queryset.only(*only)
+        fetched.update((obj.pk, obj) for obj in queryset)
+
+    if cache_timeout and fetched:
+        cache.set_many({_cache_key(model, pk): obj for pk, obj in fetched.items()}, cache_timeout)
+    related.update(fetched)
+
+    for instance in instances:
+        # Ids with no row are cached as None, so templates see a missing relation
+        # instead of triggering a query that raises DoesNotExist
+        field.set_cached_value(instance, related.get(getattr(instance, field.attname)))
+
+    return instances
+
+
+class CrossDatabasePrefetchMixin:
+    """
+    ModelAdmin mixin that runs prefetch_cross_db on each changelist page.
+
+        cross_db_prefetch = {'seller': ('user',)}
+
+    maps foreign key names to the select_related lookups used on the other database.
+    Only the rows on the page are looked up, with one query per field.
+    """
+    cross_db_prefetch = {}
+    cross_db_cache_timeout = None
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        # Evaluating the page here fills its result cache, which the template then reuses
+        for field_name, select_related in self.cross_db_prefetch.items():
+            prefetch_cross_db(
+                changelist.result_list, field_name,
+                select_related=select_related, cache_timeout=self.cross_db_cache_timeout,
+            )
+        return changelist
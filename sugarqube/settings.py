@@ -194,6 +194,50 @@ CACHES = {
         'LOCATION': '127.0.0.1:11211',
     }
 }
+
+# Seconds to wait after the last SugarPrice write before re-warming the prediction cache
+PREDICTION_PREWARM_DEBOUNCE = 30
+
+# Redis pub/sub used to push notifications to open streams across processes (needs the
+# redis package). Set to None for the in-memory broker, which only reaches streams in the
+# process that published, so only suits a single-process development server.
+NOTIFICATIONS_REDIS_URL = 'redis://localhost:6379/1'
+
+# Read notifications and broadcasts older than this many days are deleted by the
+# nightly compaction job, which removes at most this many rows per statement
+NOTIFICATION_RETENTION_DAYS = 30
+NOTIFICATION_COMPACTION_BATCH = 1000
+
+# The trading engine runs in one process (manage.py run_trading_engine), which the web
+# processes reach through this Unix socket; calls give up after this many seconds
+TRADING_ENGINE_SOCKET = BASE_DIR / 'var' / 'trading-engine.sock'
+TRADING_ENGINE_TIMEOUT = 5
+
+# Directory for the trading engine's write-ahead journal and book snapshots; None keeps
+# the books in memory only. Flushes wait this many seconds to batch more events per
+# fsync, and a snapshot is taken (and older journal segments dropped) every N events.
+TRADING_JOURNAL_DIR = BASE_DIR / 'var' / 'trading'
+TRADING_JOURNAL_COMMIT_INTERVAL = 0.001
+TRADING_SNAPSHOT_EVERY = 100000
+
+# Products traded by periodic call auction rather than continuous matching, and the
+# seconds between uncrosses. Only run_trading_engine runs the auctions (see its --no-auctions)
+TRADING_AUCTION_SYMBOLS = []
+TRADING_AUCTION_INTERVAL = 60
+
+# Credit limit, in KES, for buyers without their own, and how many seconds a process
+# may use its copy of a buyer's limit and shared exposure before re-reading the cache
+BUYER_CREDIT_LIMIT = 5000000
+RISK_LEDGER_REFRESH = 1.0
+
+# Seconds a stock reservation holds bags for a buyer, and how many seconds a process
+# may serve a listing's available-to-promise quantity from memory
+STOCK_RESERVATION_TTL = 600
+STOCK_ATP_REFRESH = 1.0
+
 # Celery Configuration Options
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+# Keep the result backend small: compress results and expire them after an hour
+CELERY_RESULT_COMPRESSION = 'gzip'
+CELERY_RESULT_EXPIRES = 3600
@@ -0,0 +1,47 @@
+import hashlib
+import json
+import time
+import zlib
+from django.core.cache import cache
+
+# How long stored payloads live, in seconds
+PAYLOAD_TIMEOUT = 3600
+
+
+def store_payload(namespace, data, timeout=PAYLOAD_TIMEOUT):
+    """
+    Stores JSON-serialisable task output compressed in the cache under a content key.
+    Returns a small handle for the task to return instead of the data itself.
+    Identical output maps onto the same key, so repeated runs overwrite one entry.
+    """
+    raw = json.dumps(data, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    digest = hashlib.sha256(raw).hexdigest()[:32]
+    key = f'task_payload_{namespace}_{digest}'
+    blob = zlib.compress(raw, 6)
+
+    cache.set(key, blob, timeout)
+
+    return {
+        'payload_key': key,
+        'size': len(raw),
+        'compressed_size': len(blob),
+        'expires_at': time.time() + timeout,
+    }
+
+
+def is_payload_handle(value):
+    return isinstance(value, dict) and 'payload_key' in value
+
+
+def load_payload(handle):
+    """
+    Returns the data behind a handle from store_payload, or None if it is missing or expired.
+    """
+    if not is_payload_handle(handle):
+        return None
+
+    blob = cache.get(handle['payload_key'])
+    if blob is None:
+        return None
+
+    return json.loads(zlib.decompress(blob))
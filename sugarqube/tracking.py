@@ -0,0 +1,78 @@
+# Marks a field with no stored value to compare against
+_MISSING = object()
+
+
+class FieldTrackerMixin:
+    """
+    Remembers the stored values of `tracked_fields` when an instance is loaded or
+    saved, so signal handlers can see what changed without re-fetching the row:
+
+        class Order(FieldTrackerMixin, models.Model):
+            tracked_fields = ('status',)
+
+        if instance.has_changed('status'):
+            ...
+
+    Instances built in memory with a primary key (never loaded), or loaded with
+    a tracked field deferred, fall back to one query for that field.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self, fields=None):
+        deferred = self.get_deferred_fields()
+        snapshot = self.__dict__.setdefault('_tracked_snapshot', {})
+        for name in self.tracked_fields if fields is None else fields:
+            attname = self._meta.get_field(name).attname
+            if attname not in deferred:
+                snapshot[name] = getattr(self, attname)
+
+    def _stored_value(self, field):
+        if self.pk is None:
+            return _MISSING
+        snapshot = self.__dict__.setdefault('_tracked_snapshot', {})
+        if field not in snapshot:
+            stored = list(
+                type(self)._base_manager.using(self._state.db)
+                .filter(pk=self.pk)
+                .values_list(field, flat=True)
+            )
+            if not stored:
+                return _MISSING
+            snapshot[field] = stored[0]
+        return snapshot[field]
+
+    def previous(self, field):
+        """
+        Returns the value `field` had when the instance was last loaded or saved.
+        Instances with no stored row return None.
+        """
+        value = self._stored_value(field)
+        return None if value is _MISSING else value
+
+    def has_changed(self, field):
+        """
+        True if `field` differs from its stored value. Always False for instances with no stored row.
+        """
+        value = self._stored_value(field)
+        if value is _MISSING:
+            return False
+        return value != getattr(self, self._meta.get_field(field).attname)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Post-save handlers have already run against the old values
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self._snapshot_tracked_fields()
+        else:
+            self._snapshot_tracked_fields([name for name in self.tracked_fields if name in update_fields])
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._snapshot_tracked_fields()
@@ -1,8 +1,11 @@
 import uuid
 from django.db import models
 from django.conf import settings
+from sugarqube.tracking import FieldTrackerMixin
+
+class SupportTicket(FieldTrackerMixin, models.Model):
+    tracked_fields = ('status',)
 
-class SupportTicket(models.Model):
     STATUS_CHOICES = [
         ('Open', 'Open'),
         ('In Progress', 'In Progress'),
@@ -19,10 +19,5 @@ def support_ticket_notification(sender, instance, **kwargs):
     """
     Triggers a notification when a ticket's status changes to 'Resolved'.
     """
-    if instance.pk:
-        try:
-            original = sender.objects.get(pk=instance.pk)
-            if original.status != 'Resolved' and instance.status == 'Resolved':
-                transaction.on_commit(lambda: create_ticket_resolved_notification(instance.user, instance.subject))
-        except sender.DoesNotExist:
-            pass
\ No newline at end of file
+    if instance.has_changed('status') and instance.status == 'Resolved':
+        transaction.on_commit(lambda: create_ticket_resolved_notification(instance.user, instance.subject))
\ No newline at end of file
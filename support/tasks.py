@@ -0,0 +1,18 @@
+from celery import shared_task
+from django.core.mail import send_mail
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
+def send_ticket_confirmation_email(username, email, ticket_id, ticket_subject):
+    """
+    Sends the confirmation email for a newly created support ticket.
+    """
+    subject = f"Support Ticket Created: #{ticket_id}"
+    message = f"Hi {username},\n\nYour support ticket with the subject '{ticket_subject}' has been successfully created. Your ticket number is {ticket_id}.\n\nA support agent will get back to you shortly.\n\nThanks,\nSugarQube Support"
+
+    send_mail(
+        subject,
+        message,
+        'support@sugarqube.com',
+        [email],
+        fail_silently=False,
+    )
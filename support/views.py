@@ -3,11 +3,11 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 import json
 from .forms import SupportTicketForm
 from .models import SupportTicket
+from .tasks import send_ticket_confirmation_email
 
 @csrf_exempt # Use exempt for simplicity in this context; for production, use standard CSRF tokens
 @require_POST
@@ -24,17 +24,8 @@ def submit_ticket(request):
             ticket.user = request.user
             ticket.save() # .save() will generate the ticket_id
 
-            # Send confirmation email
-            subject = f"Support Ticket Created: #{ticket.ticket_id}"
-            message = f"Hi {request.user.username},\n\nYour support ticket with the subject '{ticket.subject}' has been successfully created. Your ticket number is {ticket.ticket_id}.\n\nA support agent will get back to you shortly.\n\nThanks,\nSugarQube Support"
-            
-            send_mail(
-                subject,
-                message,
-                'support@sugarqube.com',
-                [request.user.email],
-                fail_silently=False,
-            )
+            # Send confirmation email from the email queue
+            send_ticket_confirmation_email.delay(request.user.username, request.user.email, ticket.ticket_id, ticket.subject)
 
             return JsonResponse({'success': 'Ticket created successfully!', 'ticket_id': ticket.ticket_id})
         else:
@@ -0,0 +1,174 @@
+import threading
+import numpy as np
+from .orderbook import BUY, LIMIT, Trade, from_ticks
+
+
+class AuctionResult:
+    __slots__ = ('symbol', 'price', 'volume', 'trades', 'orders')
+
+    def __init__(self, symbol, price, volume, trades, orders):
+        self.symbol = symbol
+        self.price = price
+        self.volume = volume
+        self.trades = trades
+        self.orders = orders  # The RestingOrders that took part
+
+    def as_dict(self):
+        return {
+            'symbol': self.symbol,
+            'price': str(from_ticks(self.price)) if self.price is not None else None,
+            'volume': self.volume,
+            'trades': [trade.as_dict() for trade in self.trades],
+        }
+
+
+def clearing_price(buy_prices, buy_quantities, sell_prices, sell_quantities, reference=None):
+    """
+    The price that executes the most volume, and that volume, for limit orders
+    given as arrays of ticks and bags. Every limit price is a candidate: demand at p
+    is the buy quantity priced at p or above, supply the sell quantity at p or
+    below, and the volume min(demand, supply). Ties go to the smallest imbalance,
+    then the price nearest `reference` (the last clearing price), then the middle
+    of the tied range. Returns (None, 0) when nothing crosses.
+    """
+    if not len(buy_prices) or not len(sell_prices):
+        return None, 0
+    candidates = np.unique(np.concatenate([buy_prices, sell_prices]))
+
+    order = np.argsort(buy_prices, kind='stable')
+    sorted_buys = buy_prices[order]
+    buys_below = np.concatenate([[0], np.cumsum(buy_quantities[order])])
+    demand = buys_below[-1] - buys_below[np.searchsorted(sorted_buys, candidates, side='left')]
+
+    order = np.argsort(sell_prices, kind='stable')
+    sorted_sells = sell_prices[order]
+    sells_at_or_below = np.concatenate([[0], np.cumsum(sell_quantities[order])])
+    supply = sells_at_or_below[np.searchsorted(sorted_sells, candidates, side='right')]
+
+    volume = np.minimum(demand, supply)
+    best = volume.max()
+    if best <= 0:
+        return None, 0
+
+    imbalance = np.abs(demand - supply)
+    tied = volume == best
+    tied &= imbalance == imbalance[tied].min()
+    prices = candidates[tied]
+    if reference is not None:
+        return int(prices[np.argmin(np.abs(prices - reference))]), int(best)
+    return int(prices[len(prices) // 2]), int(best)
+
+
+def _allocate(quantities, eligible, sort_keys, volume):
+    """
+    Fills `volume` across the eligible orders in the order given by `sort_keys`
+    (np.lexsort keys). Returns (order indexes, fills) for orders that get some.
+    """
+    indexes = np.flatnonzero(eligible)
+    indexes = indexes[np.lexsort(tuple(key[indexes] for key in sort_keys))]
+    wanted = quantities[indexes]
+    before = np.cumsum(wanted) - wanted
+    fills = np.clip(volume - before, 0, wanted)
+    filled = fills > 0
+    return indexes[filled], fills[filled]
+
+
+def uncross(book, reference=None, replay=None):
+    """
+    Runs a call auction over everything resting in `book` (which may be crossed):
+    finds the clearing price, or takes it from `replay` (a (price,) tuple, from
+    the journal), and fills the eligible orders at it in one vectorised pass,
+    price then time priority.
+    The unfilled remainders are then put back as a normal continuous book.
+    Returns an AuctionResult.
+    """
+    orders = list(book.resting())
+    result = AuctionResult(book.symbol, None, 0, [], orders)
+    if not orders:
+        return result
+
+    prices = np.fromiter((o.price for o in orders), dtype=np.int64, count=len(orders))
+    quantities = np.fromiter((o.remaining for o in orders), dtype=np.int64, count=len(orders))
+    is_buy = np.fromiter((o.side == BUY for o in orders), dtype=bool, count=len(orders))
+    # resting() gives each level oldest first, which is all time priority needs
+    rank = np.arange(len(orders))
+
+    if replay is None:
+        price, volume = clearing_price(prices[is_buy], quantities[is_buy], prices[~is_buy], quantities[~is_buy], reference)
+    elif replay[0] is None:
+        price, volume = None, 0
+    else:
+        price = replay[0]
+        demand = quantities[is_buy & (prices >= price)].sum()
+        supply = quantities[~is_buy & (prices <= price)].sum()
+        volume = int(min(demand, supply))
+
+    trades = []
+    if price is not None and volume:
+        buys, buy_fills = _allocate(quantities, is_buy & (prices >= price), (rank, -prices), volume)
+        sells, sell_fills = _allocate(quantities, ~is_buy & (prices <= price), (rank, prices), volume)
+
+        # Pair the two fill sequences: each trade runs to the next point where
+        # either side moves on to its next order
+        buy_edges, sell_edges = np.cumsum(buy_fills), np.cumsum(sell_fills)
+        edges = np.union1d(buy_edges, sell_edges)
+        starts = np.concatenate([[0], edges[:-1]])
+        buy_at = buys[np.searchsorted(buy_edges, starts, side='right')]
+        sell_at = sells[np.searchsorted(sell_edges, starts, side='right')]
+
+        for b, s, quantity in zip(buy_at.tolist(), sell_at.tolist(), (edges - starts).tolist()):
+            book.sequence += 1
+            # Recorded as the buyer taking the seller's order, at the one auction price
+            trades.append(Trade(book.sequence, orders[s], orders[b].order_id, orders[b].owner, BUY, price, quantity))
+
+        # Only filled orders change; the rest of the book stays where it is
+        for i, fill in zip(np.concatenate([buys, sells]).tolist(), np.concatenate([buy_fills, sell_fills]).tolist()):
+            order = orders[i]
+            level = book.levels[order.side][order.price]
+            order.remaining -= fill
+            level.volume -= fill
+            if not order.remaining:
+                order.active = False
+                level.count -= 1
+                del book.orders[order.order_id]
+
+    # A volume tie can leave remainders that still cross; those match
+    # continuously as the book is rebuilt
+    bid, ask = book.best_bid(), book.best_ask()
+    if bid is not None and ask is not None and bid >= ask:
+        remainders = [(o.order_id, o.side, o.remaining, o.price, o.owner) for o in book.resting()]
+        book.clear()
+        for order_id, side, remaining, order_price, owner in remainders:
+            trades.extend(book.submit(order_id, side, remaining, order_price, LIMIT, owner).trades)
+    book.sequence += 1
+
+    result.price, result.volume, result.trades = price, int(volume or 0), trades
+    return result
+
+
+class AuctionScheduler(threading.Thread):
+    """
+    Keeps `symbols` in call-auction mode and uncrosses them every `interval`
+    seconds, so their orders are collected between uncrosses instead of matching
+    as they arrive. Runs in the process that owns the engine.
+    """
+
+    def __init__(self, engine, symbols, interval):
+        super().__init__(name='trading-auctions', daemon=True)
+        self.engine = engine
+        self.symbols = symbols
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        for symbol in self.symbols:
+            self.engine.start_auction(symbol)
+        while not self.stopped.wait(self.interval):
+            for symbol in self.symbols:
+                try:
+                    self.engine.uncross(symbol, keep_auction=True)
+                except Exception as e:
+                    print(f"Error running the {symbol} auction: {e}")
+
+    def stop(self):
+        self.stopped.set()
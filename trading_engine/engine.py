@@ -0,0 +1,529 @@
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from .auction import uncross
+from .feed import BookFeed
+from .journal import Journal, load_snapshot, lock_journal, read_journal, repair_journal, write_dead_letter, write_snapshot
+from .orderbook import BUY, SELL, OrderBook, OrderRejected, Trade, to_ticks, validate_order
+from .signals import UndeliverableTrades, trades_executed
+
+SYMBOL_RE = re.compile(r'^[A-Z0-9][A-Z0-9_-]{0,31}$')
+
+
+class MatchingEngine:
+    """
+    The order books for every product, behind one lock so request threads can
+    share them. Order ids are assigned here and are unique across books.
+
+    With a `journal`, every accepted submit and cancel is appended under the lock,
+    so the journal holds them in the order they were applied, and the caller then
+    waits, outside the lock, until its event is fsynced. Other threads keep matching
+    meanwhile and their events share the next fsync. Every `snapshot_every` events
+    the books are snapshotted and the journal segments before it dropped.
+    See recover() for the startup side.
+
+    With a `risk` ledger (market.risk.ExposureLedger), a buy order with an owner
+    first reserves its worst-case value against the owner's credit limit, under
+    the lock, and is rejected if that does not fit. What the order did not use
+    (price improvement, unfilled IOC/market quantity) is released straight after
+    matching, and a cancel releases what was resting. Fills stay as exposure.
+
+    A book can be switched into call-auction mode (start_auction): its limit orders
+    then rest without matching until uncross() clears them all at one price.
+
+    Books with depth subscribers also get a BookFeed, which each event's changed
+    levels and trades are published to; see subscribe().
+
+    Trades are queued in an outbox, under the lock, and trades_executed is sent
+    for them once their event is durable (see deliver_trades()). They stay queued
+    until every receiver has taken them. The outbox is kept in snapshots, and
+    recovery queues the trades of every replayed event again, so a trade is sent
+    at least once even across a crash.
+    """
+
+    def __init__(self, journal=None, snapshot_every=None, risk=None):
+        self.lock = threading.Lock()
+        self.risk = risk
+        self.books = {}
+        self.feeds = {}
+        self.journal = journal
+        self.snapshot_every = snapshot_every
+        self.next_order_id = 1
+        self.auction_prices = {}
+        # (lsn, symbol, trades, at, replayed) not yet taken by every receiver, oldest first
+        self.outbox = deque()
+        self._delivering = threading.Lock()
+        self._since_snapshot = 0
+        self._snapshotting = False
+
+    def book(self, symbol):
+        """
+        The book for `symbol`, opened if there is none yet. Only for paths that
+        place orders; read-only ones use find_book().
+        """
+        symbol = normalise_symbol(symbol)
+        book = self.books.get(symbol)
+        if book is None:
+            lsn = None
+            with self.lock:
+                book = self.books.get(symbol)
+                if book is None:
+                    self._check_journal()
+                    # Trade sequences carry on from the clock in microseconds rather than
+                    # 0, so a book opened again after its history was lost (no journal)
+                    # cannot reuse the sequence of a trade already recorded as a fill
+                    book = self._open_book(symbol, time.time_ns() // 1000)
+                    lsn = self._journal('b', symbol, book.sequence)
+            self._commit(lsn)
+        return book
+
+    def _open_book(self, symbol, sequence):
+        book = self.books[symbol] = OrderBook(symbol)
+        book.sequence = sequence
+        return book
+
+    def find_book(self, symbol):
+        """
+        The book for `symbol`, or None if nothing has been traded in it.
+        """
+        return self.books.get(normalise_symbol(symbol))
+
+    def submit(self, symbol, side, quantity, price=None, order_type='limit', owner=None):
+        """
+        Places an order; `price` is in KES (any Decimal-compatible value).
+        Returns an ExecutionReport, or raises OrderRejected.
+        """
+        ticks = to_ticks(price) if price not in (None, '') else None
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise OrderRejected(f'Invalid quantity: {quantity}')
+        # Before anything is reserved against the owner's limit
+        validate_order(side, quantity, ticks, order_type)
+        book = self.book(symbol)
+        checked = self.risk is not None and owner is not None and side == BUY
+        with self.lock:
+            self._check_journal()
+            order_id = self.next_order_id
+            place = book.collect if book.auction else book.submit
+            if checked:
+                # A tick is one cent, so ticks x bags is the value in the ledger's units
+                need = ticks * quantity if order_type != 'market' else book.cost_to_fill(BUY, quantity)
+                if not self.risk.reserve_trading(owner, need):
+                    raise OrderRejected('This order would take you over your credit limit')
+                try:
+                    report = place(order_id, side, quantity, ticks, order_type, owner)
+                except OrderRejected:
+                    self.risk.adjust_trading(owner, -need)
+                    raise
+                used = sum(trade.price * trade.quantity for trade in report.trades) + report.remaining * (ticks or 0)
+                if need != used:
+                    self.risk.adjust_trading(owner, used - need)
+            else:
+                report = place(order_id, side, quantity, ticks, order_type, owner)
+            self.next_order_id += 1
+            feed = self.feeds.get(book.symbol)
+            if feed is not None:
+                opposite = SELL if side == BUY else BUY
+                touched = {(opposite, trade.price) for trade in report.trades}
+                if report.remaining:
+                    touched.add((side, ticks))
+                feed.publish([(s, p, *book.level_state(s, p)) for s, p in touched], report.trades)
+            at = timezone.now()
+            lsn = self._journal('s', book.symbol, order_id, side, quantity, ticks, order_type, owner, at.timestamp())
+            if report.trades:
+                self.outbox.append((lsn, book.symbol, report.trades, at, False))
+        self._commit(lsn)
+        if self.risk is not None:
+            self.risk.flush_trading()
+        if report.trades:
+            self.deliver_trades()
+        return report
+
+    def cancel(self, symbol, order_id, owner=None):
+        book = self.find_book(symbol)
+        if book is None:
+            return None
+        with self.lock:
+            self._check_journal()
+            order = book.cancel(order_id, owner)
+            if order is not None and self.risk is not None and order.side == BUY and order.owner is not None:
+                self.risk.adjust_trading(order.owner, -order.price * order.remaining)
+            feed = self.feeds.get(book.symbol)
+            if order is not None and feed is not None:
+                feed.publish([(order.side, order.price, *book.level_state(order.side, order.price))], ())
+            lsn = self._journal('c', book.symbol, order_id) if order else None
+        self._commit(lsn)
+        return order
+
+    # Call auctions
+
+    def start_auction(self, symbol):
+        """
+        Starts collecting the book's orders for a call auction instead of matching them.
+        """
+        book = self.book(symbol)
+        with self.lock:
+            self._check_journal()
+            book.auction = True
+            lsn = self._journal('a', book.symbol)
+        self._commit(lsn)
+
+    def uncross(self, symbol, keep_auction=False):
+        """
+        Clears the book at the price that executes the most volume (see
+        auction.uncross), then goes back to continuous matching unless
+        `keep_auction`. Returns an AuctionResult.
+        """
+        book = self.book(symbol)
+        with self.lock:
+            self._check_journal()
+            result = uncross(book, reference=self.auction_prices.get(book.symbol))
+            book.auction = keep_auction
+            if result.price is not None:
+                self.auction_prices[book.symbol] = result.price
+
+            if self.risk is not None:
+                # Buyers reserved their limit price; release what paying less freed up
+                limits = {order.order_id: order.price for order in result.orders if order.side == BUY}
+                for trade in result.trades:
+                    buyer_order, buyer = (trade.taker_id, trade.taker_owner) if trade.side == BUY else (trade.maker_id, trade.maker_owner)
+                    if buyer is not None and limits[buyer_order] != trade.price:
+                        self.risk.adjust_trading(buyer, (trade.price - limits[buyer_order]) * trade.quantity)
+
+            feed = self.feeds.get(book.symbol)
+            if feed is not None:
+                touched = {(order.side, order.price) for order in result.orders}
+                feed.publish([(s, p, *book.level_state(s, p)) for s, p in touched], result.trades)
+            at = timezone.now()
+            lsn = self._journal('u', book.symbol, result.price, keep_auction, at.timestamp())
+            if result.trades:
+                self.outbox.append((lsn, book.symbol, result.trades, at, False))
+        self._commit(lsn)
+        if self.risk is not None:
+            self.risk.flush_trading()
+        if result.trades:
+            self.deliver_trades()
+        return result
+
+    def depth(self, symbol, levels=10):
+        book = self.find_book(symbol)
+        if book is None:
+            return {BUY: [], SELL: []}
+        with self.lock:
+            return book.depth(levels)
+
+    def overview(self):
+        """
+        (symbol, best bid, best ask, in auction) for every book, in symbol order.
+        """
+        with self.lock:
+            return [
+                (symbol, book.best_bid(), book.best_ask(), book.auction)
+                for symbol, book in sorted(self.books.items())
+            ]
+
+    def subscribe(self, symbol):
+        """
+        Returns a book's feed, with a full depth snapshot and the feed sequence
+        it is consistent with, to take deltas from; None if there is no such book.
+        """
+        book = self.find_book(symbol)
+        if book is None:
+            return None
+        with self.lock:
+            feed = self.feeds.get(book.symbol)
+            if feed is None:
+                feed = self.feeds[book.symbol] = BookFeed(book.symbol)
+            return feed, book.depth(None), feed.seq
+
+    # Trade delivery
+
+    def deliver_trades(self):
+        """
+        Sends trades_executed for the outbox, oldest first, as far as the journal
+        is durable. Receivers may be sent the same trades again (`replayed` is set
+        for trades queued by recovery) and raise to have them sent again: a
+        delivery that any receiver failed stays in the outbox for the next call,
+        and so do the later ones for the same symbol, while other symbols carry on.
+        A receiver raising UndeliverableTrades instead has the delivery set aside
+        in the dead-letter log (see _dead_letter()). Returns the number of
+        deliveries still queued.
+        """
+        # One thread delivers at a time; the others leave their trades to it, or to
+        # the next call (see TradeRedelivery) if it had just finished
+        if not self._delivering.acquire(blocking=False):
+            return len(self.outbox)
+        try:
+            blocked = set()
+            index = 0
+            # Only this thread removes entries and others only append, so index
+            # keeps pointing at the same entry
+            while index < len(self.outbox):
+                entry = self.outbox[index]
+                lsn, symbol, trades, at, replayed = entry
+                if lsn is not None and lsn > self.journal.durable_lsn:
+                    break
+                if symbol in blocked:
+                    index += 1
+                    continue
+                responses = trades_executed.send_robust(
+                    sender=self.__class__, symbol=symbol, trades=trades, at=at, replayed=replayed,
+                )
+                errors = [response for _, response in responses if isinstance(response, Exception)]
+                rejected = [error for error in errors if isinstance(error, UndeliverableTrades)]
+                if rejected and self._dead_letter(entry, rejected[0]):
+                    errors = []
+                if errors:
+                    print(f"Error delivering {symbol} trades, will retry: {errors[0]}")
+                    blocked.add(symbol)
+                    index += 1
+                    continue
+                with self.lock:
+                    del self.outbox[index]
+        finally:
+            self._delivering.release()
+        return len(self.outbox)
+
+    def _dead_letter(self, entry, error):
+        # Sending these again would fail the same way and hold up the symbol
+        # behind them, so they are kept aside for someone to look into. Returns
+        # False, leaving them queued, if the dead-letter log cannot be written.
+        _, symbol, trades, at, replayed = entry
+        print(f"Setting aside {symbol} trades that cannot be delivered: {error}")
+        if self.journal is None:
+            return True
+        try:
+            write_dead_letter(self.journal.directory, {
+                'symbol': symbol,
+                'at': at.isoformat(),
+                'trades': [trade.as_row() for trade in trades],
+                'replayed': replayed,
+                'error': f'{type(error).__name__}: {error}',
+            })
+        except OSError as e:
+            print(f"Error writing the trade dead-letter log: {e}")
+            return False
+        return True
+
+    # Durability
+
+    def _check_journal(self):
+        # Called with the lock held, before a book changes: once a journal write
+        # has failed, nothing more is applied that the journal would not hold
+        if self.journal is not None:
+            self.journal.check()
+
+    def _journal(self, *record):
+        # Called with the lock held
+        if self.journal is None:
+            return None
+        self._since_snapshot += 1
+        return self.journal.append(record)
+
+    def _commit(self, lsn):
+        if lsn is None:
+            return
+        self.journal.wait(lsn)
+        if self.snapshot_every and self._since_snapshot >= self.snapshot_every and not self._snapshotting:
+            self.snapshot()
+
+    def _apply(self, record):
+        # Replays one journal record; ids and order come from the journal. Trades
+        # are queued again, with the time they first happened at.
+        kind, symbol = record[1:3]
+        if kind == 'b':
+            self._open_book(symbol, record[3])
+            return
+        # Journals from before books were journaled start them at 0, as they did then
+        book = self.books.get(symbol) or self._open_book(symbol, 0)
+        trades = ()
+        if kind == 's':
+            order_id, side, quantity, ticks, order_type, owner = record[3:9]
+            place = book.collect if book.auction else book.submit
+            trades = place(order_id, side, quantity, ticks, order_type, owner).trades
+            self.next_order_id = max(self.next_order_id, order_id + 1)
+            at = record[9:10]
+        elif kind == 'c':
+            book.cancel(record[3])
+        elif kind == 'a':
+            book.auction = True
+        elif kind == 'u':
+            price, book.auction = record[3:5]
+            trades = uncross(book, replay=(price,)).trades
+            if price is not None:
+                self.auction_prices[book.symbol] = price
+            at = record[5:6]
+        if trades:
+            at = datetime.fromtimestamp(at[0], tz=dt_timezone.utc) if at else timezone.now()
+            self.outbox.append((None, book.symbol, trades, at, True))
+
+    def snapshot(self):
+        """
+        Writes the books to a snapshot and drops the journal segments it covers.
+        Matching pauses only while the books are copied and the journal rotated.
+        Returns the lsn the snapshot covers, or None without a journal.
+        """
+        if self.journal is None:
+            return None
+        with self.lock:
+            if self._snapshotting:
+                return None
+            self._snapshotting = True
+            try:
+                state = {
+                    'next_order_id': self.next_order_id,
+                    'auction_prices': dict(self.auction_prices),
+                    'outbox': [
+                        [symbol, at.timestamp(), [trade.as_row() for trade in trades]]
+                        for _, symbol, trades, at, _ in self.outbox
+                    ],
+                    'books': {
+                        symbol: {
+                            'sequence': book.sequence,
+                            'auction': book.auction,
+                            'orders': [[o.order_id, o.owner, o.side, o.price, o.remaining] for o in book.resting()],
+                        }
+                        for symbol, book in self.books.items()
+                    },
+                }
+                state['lsn'] = self.journal.rotate()
+                self._since_snapshot = 0
+            except Exception:
+                self._snapshotting = False
+                raise
+        try:
+            write_snapshot(self.journal.directory, state)
+            self.journal.discard_through(state['lsn'])
+        finally:
+            self._snapshotting = False
+        return state['lsn']
+
+    @classmethod
+    def recover(cls, directory, commit_interval=0.001, snapshot_every=None, risk=None):
+        """
+        Rebuilds the books from the latest snapshot in `directory` plus the journal
+        events after it, then returns an engine journaling to the same directory.
+        The outbox then holds the snapshot's undelivered trades and those of every
+        replayed event, for deliver_trades().
+        `recovered` on the engine holds what was loaded and how long it took.
+        Raises JournalLocked if another process is using the directory.
+        """
+        started = time.perf_counter()
+        lock = lock_journal(directory)
+        try:
+            repair_journal(directory)
+            engine = cls(snapshot_every=snapshot_every)
+            snapshot = load_snapshot(directory)
+            lsn = 0
+            if snapshot:
+                lsn = snapshot['lsn']
+                engine.next_order_id = snapshot['next_order_id']
+                engine.auction_prices = snapshot.get('auction_prices', {})
+                for symbol, at, rows in snapshot.get('outbox', []):
+                    at = datetime.fromtimestamp(at, tz=dt_timezone.utc)
+                    engine.outbox.append((None, symbol, [Trade.from_row(row) for row in rows], at, True))
+                for symbol, data in snapshot['books'].items():
+                    book = engine._open_book(symbol, data['sequence'])
+                    book.auction = data.get('auction', False)
+                    for order in data['orders']:
+                        book.restore(*order)
+
+            replayed = 0
+            for record in read_journal(directory, after_lsn=lsn):
+                engine._apply(record)
+                lsn = record[0]
+                replayed += 1
+
+            engine.journal = Journal(directory, last_lsn=lsn, commit_interval=commit_interval, lock=lock)
+        except Exception:
+            lock.close()
+            raise
+        if risk is not None:
+            # Replay bypasses the checks; count what is resting now
+            for book in engine.books.values():
+                for order in book.resting():
+                    if order.side == BUY and order.owner is not None:
+                        risk.adjust_trading(order.owner, order.price * order.remaining)
+            engine.risk = risk
+        engine._since_snapshot = replayed
+        engine.recovered = {
+            'snapshot_lsn': snapshot['lsn'] if snapshot else 0,
+            'replayed': replayed,
+            'lsn': lsn,
+            'seconds': time.perf_counter() - started,
+        }
+        return engine
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+
+def normalise_symbol(symbol):
+    symbol = str(symbol).strip().upper()
+    if not SYMBOL_RE.match(symbol):
+        raise OrderRejected(f'Invalid symbol: {symbol}')
+    return symbol
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def start_engine():
+    """
+    Starts this process's matching engine, recovered from TRADING_JOURNAL_DIR when
+    one is configured, and returns it. Only the run_trading_engine process does
+    this; everything else reaches that engine through trading_engine.service.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            raise RuntimeError('The matching engine is already running in this process')
+        from market.risk import ledger
+        ledger.claim_trading()
+        directory = getattr(settings, 'TRADING_JOURNAL_DIR', None)
+        if directory:
+            engine = MatchingEngine.recover(
+                str(directory),
+                commit_interval=getattr(settings, 'TRADING_JOURNAL_COMMIT_INTERVAL', 0.001),
+                snapshot_every=getattr(settings, 'TRADING_SNAPSHOT_EVERY', None),
+                risk=ledger,
+            )
+        else:
+            engine = MatchingEngine(risk=ledger)
+        # Replayed trades may not have been recorded as fills before the restart;
+        # they have to be before the unsettled fills are counted below
+        if engine.deliver_trades():
+            engine.close()
+            raise RuntimeError('Could not deliver the recovered trades; see the errors above')
+        # Fills are only released from exposure once they settle
+        ledger.seed_unsettled_fills()
+        _engine = engine
+    return _engine
+
+
+class TradeRedelivery(threading.Thread):
+    """
+    Retries the engine's undelivered trades every `interval` seconds, for when no
+    new trade comes along to do it. Runs in the process that owns the engine.
+    """
+
+    def __init__(self, engine, interval=5):
+        super().__init__(name='trading-redelivery', daemon=True)
+        self.engine = engine
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if self.engine.outbox:
+                self.engine.deliver_trades()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,98 @@
+import json
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from .orderbook import BUY, SELL, from_ticks
+
+# Book changes kept per product for subscribers to catch up from; one that falls
+# further behind than this is sent a fresh snapshot instead
+FEED_BUFFER = 2048
+# Rendered deltas cached per feed, so subscribers at the same point share one encoding
+RENDER_CACHE = 32
+
+
+def _levels(levels):
+    return [[str(from_ticks(price)), volume, count] for price, volume, count in levels]
+
+
+class BookFeed:
+    """
+    The stream of changes to one book, for depth subscribers.
+
+    The engine calls publish() under its lock after each event that changed the
+    book: it records the new totals of the touched price levels and the trades,
+    tagged with the next feed sequence number, in a ring buffer. That is all the
+    matching thread does, however many subscribers there are.
+
+    Each subscriber pulls at its own pace with delta(seq): everything since the
+    last sequence it saw is merged into one message, keeping only the latest
+    totals per level, so a slow consumer gets fewer, bigger updates (conflation).
+    If it has fallen out of the buffer it must start again from a snapshot.
+    """
+
+    def __init__(self, symbol, size=FEED_BUFFER):
+        self.symbol = symbol
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.events = deque(maxlen=size)
+        self._rendered = OrderedDict()
+
+    def publish(self, levels, trades):
+        """
+        Records one book event: `levels` as (side, price, volume, count) after the
+        event, `trades` as Trade objects.
+        """
+        with self.lock:
+            self.seq += 1
+            self.events.append((self.seq, levels, trades))
+
+    def snapshot(self, depth, seq):
+        return json.dumps({
+            'symbol': self.symbol,
+            'seq': seq,
+            'bids': _levels(depth[BUY]),
+            'asks': _levels(depth[SELL]),
+        })
+
+    def delta(self, seq):
+        """
+        Returns (latest seq, rendered delta) covering everything after `seq`,
+        (seq, None) when nothing happened, or None when `seq` is too old to
+        catch up from and the subscriber needs a new snapshot.
+        """
+        with self.lock:
+            latest = self.seq
+            if seq == latest:
+                return seq, None
+            key = (seq, latest)
+            rendered = self._rendered.get(key)
+            if rendered is not None:
+                return latest, rendered
+            if not self.events or self.events[0][0] > seq + 1:
+                return None
+            pending = list(islice(self.events, seq + 1 - self.events[0][0], None))
+
+        changed = {}
+        trades = []
+        for _, levels, event_trades in pending:
+            for side, price, volume, count in levels:
+                changed[side, price] = (volume, count)
+            trades.extend(event_trades)
+
+        bids = sorted(((p, v, c) for (s, p), (v, c) in changed.items() if s == BUY), reverse=True)
+        asks = sorted((p, v, c) for (s, p), (v, c) in changed.items() if s == SELL)
+        rendered = json.dumps({
+            'symbol': self.symbol,
+            'prev_seq': seq,
+            'seq': latest,
+            # A level with 0 orders has been removed
+            'bids': _levels(bids),
+            'asks': _levels(asks),
+            'trades': [trade.as_dict() for trade in trades],
+        })
+
+        with self.lock:
+            self._rendered[key] = rendered
+            if len(self._rendered) > RENDER_CACHE:
+                self._rendered.popitem(last=False)
+        return latest, rendered
@@ -0,0 +1,279 @@
+import glob
+import json
+import os
+import threading
+import time
+
+SEGMENT_PATTERN = 'journal-{:012d}.log'
+SNAPSHOT_NAME = 'snapshot.json'
+DEAD_LETTER_NAME = 'dead-letter.log'
+LOCK_NAME = 'LOCK'
+
+
+class JournalError(Exception):
+    """
+    The journal could not be written; nothing more is accepted until the engine restarts.
+    """
+
+
+class JournalLocked(JournalError):
+    """
+    Another process already has the journal directory open.
+    """
+
+
+class JournalCorrupt(JournalError):
+    pass
+
+
+def _fsync_directory(directory):
+    # Makes file creations, renames and deletions in the directory durable (POSIX only)
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _segments(directory):
+    """
+    Journal segment paths with the first sequence number each one holds, oldest first.
+    """
+    paths = glob.glob(os.path.join(directory, 'journal-*.log'))
+    return sorted((int(os.path.basename(path)[8:20]), path) for path in paths)
+
+
+def lock_journal(directory):
+    """
+    Takes an exclusive lock on the journal directory, held until the returned file
+    is closed, so only one process ever reads and appends to it. Raises
+    JournalLocked straight away if another process holds it.
+    """
+    import fcntl
+    os.makedirs(directory, exist_ok=True)
+    handle = open(os.path.join(directory, LOCK_NAME), 'w')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        raise JournalLocked(f'Another process is journaling to {directory}')
+    return handle
+
+
+def repair_journal(directory):
+    """
+    Cuts a torn final line, left by a crash mid-write, off the newest segment so
+    later appends start on a line of their own. Only the newest segment is ever
+    written to, and a line is only acknowledged once it is complete, so nothing
+    acknowledged is lost. Returns the number of bytes cut.
+    """
+    segments = _segments(directory)
+    if not segments:
+        return 0
+    with open(segments[-1][1], 'r+b') as handle:
+        size = end = handle.seek(0, os.SEEK_END)
+        while end:
+            start = max(0, end - 4096)
+            handle.seek(start)
+            newline = handle.read(end - start).rfind(b'\n')
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            handle.truncate(end)
+            handle.flush()
+            os.fsync(handle.fileno())
+    return size - end
+
+
+class Journal:
+    """
+    Append-only, write-ahead log of accepted order events, one JSON array per line
+    starting with the event's sequence number (lsn).
+
+    append() only buffers the line; a background thread writes everything buffered
+    and fsyncs it in one go (group commit), so concurrent writers share each fsync.
+    wait(lsn) blocks until an event is on disk. `commit_interval` holds each flush
+    back slightly to gather a bigger batch.
+
+    The journal is split into segments; rotate() starts a new one so the segments
+    covered by a snapshot can be deleted.
+
+    The directory is locked (see lock_journal) for as long as the journal is open;
+    pass `lock` when it was taken already. If a write or fsync fails the journal
+    stops: the waiting callers, and every later append, get a JournalError.
+    """
+
+    def __init__(self, directory, last_lsn=0, commit_interval=0.001, lock=None):
+        self._lock = lock or lock_journal(directory)
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.lsn = last_lsn
+        self.durable_lsn = last_lsn
+        self.fsyncs = 0
+
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._error = None
+        self._file = self._open_segment(last_lsn + 1)
+        self._flusher = threading.Thread(target=self._flush_loop, name='trading-journal', daemon=True)
+        self._flusher.start()
+
+    def _open_segment(self, first_lsn):
+        repair_journal(self.directory)
+        segments = _segments(self.directory)
+        # Keep appending to the newest segment after a restart
+        path = segments[-1][1] if segments else os.path.join(self.directory, SEGMENT_PATTERN.format(first_lsn))
+        handle = open(path, 'ab')
+        _fsync_directory(self.directory)
+        return handle
+
+    def append(self, record):
+        """
+        Buffers `record` (a list) as the next event and returns its lsn.
+        Callers serialise appends so lsn order matches the order events were applied.
+        """
+        with self._cond:
+            self.check()
+            self.lsn += 1
+            self._buffer.append(json.dumps([self.lsn, *record], separators=(',', ':')))
+            self._cond.notify()
+            return self.lsn
+
+    def wait(self, lsn):
+        """
+        Blocks until the event `lsn` has been written and fsynced.
+        """
+        with self._cond:
+            while self.durable_lsn < lsn:
+                self.check()
+                if self._closed:
+                    raise RuntimeError('Journal closed before the event was written')
+                self._cond.wait()
+
+    def sync(self):
+        self.wait(self.lsn)
+
+    def check(self):
+        """
+        Raises JournalError if a write has failed.
+        """
+        if self._error is not None:
+            raise JournalError(f'The trading journal could not be written: {self._error}') from self._error
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer and self._closed:
+                    return
+            if self.commit_interval:
+                time.sleep(self.commit_interval)
+            with self._cond:
+                lines, self._buffer = self._buffer, []
+                upto = self.lsn
+                handle = self._file
+            try:
+                handle.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                handle.flush()
+                os.fsync(handle.fileno())
+            except Exception as e:
+                print(f"Trading journal write failed, no more events will be accepted: {e}")
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self.fsyncs += 1
+                self.durable_lsn = upto
+                self._cond.notify_all()
+
+    def rotate(self):
+        """
+        Makes everything appended so far durable and starts a new segment for what
+        follows. Appends must be held off meanwhile. Returns the last lsn of the old segments.
+        """
+        self.sync()
+        with self._cond:
+            self._file.close()
+            path = os.path.join(self.directory, SEGMENT_PATTERN.format(self.lsn + 1))
+            self._file = open(path, 'ab')
+            _fsync_directory(self.directory)
+            return self.lsn
+
+    def discard_through(self, lsn):
+        """
+        Deletes segments that only hold events up to `lsn` (covered by a snapshot).
+        """
+        segments = _segments(self.directory)
+        for (first, path), following in zip(segments, segments[1:]):
+            if following[0] - 1 <= lsn:
+                os.remove(path)
+        _fsync_directory(self.directory)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        self._file.close()
+        self._lock.close()
+
+
+def read_journal(directory, after_lsn=0):
+    """
+    Yields the events after `after_lsn`, in order, as lists of [lsn, kind, ...].
+    A torn final line from a crash mid-write is ignored (repair_journal() cuts it
+    off); a bad line anywhere else raises JournalCorrupt.
+    """
+    segments = _segments(directory)
+    for index, (_, path) in enumerate(segments):
+        with open(path, 'rb') as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Only the last write can be incomplete
+                    if index == len(segments) - 1 and not line.endswith(b'\n'):
+                        return
+                    raise JournalCorrupt(f'Unreadable journal line in {path}')
+                if record[0] > after_lsn:
+                    yield record
+
+
+def write_snapshot(directory, state):
+    """
+    Writes `state` as the latest snapshot, atomically: a crash leaves either the
+    old snapshot or the new one, never a partial file.
+    """
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    temp = path + '.tmp'
+    with open(temp, 'w') as handle:
+        json.dump(state, handle, separators=(',', ':'))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp, path)
+    _fsync_directory(directory)
+
+
+def write_dead_letter(directory, record):
+    """
+    Appends `record` to the directory's dead-letter log, for events set aside
+    because they can never be processed, and makes it durable.
+    """
+    with open(os.path.join(directory, DEAD_LETTER_NAME), 'ab') as handle:
+        handle.write((json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8'))
+        handle.flush()
+        os.fsync(handle.fileno())
+
+
+def load_snapshot(directory):
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as handle:
+        return json.load(handle)
@@ -0,0 +1,382 @@
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from .orderbook import BUY, SELL, LIMIT, MARKET, IOC, OrderRejected
+
+# Histogram resolution: values below 2**SUB_BITS are counted exactly, larger ones in
+# buckets 1/2**(SUB_BITS-1) wide relative to their value (under 1% error)
+SUB_BITS = 8
+PERCENTILES = (50, 90, 99, 99.9, 99.99)
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram of latencies in nanoseconds. Recording is one
+    bit_length() and a list increment, memory is fixed at a few thousand counters,
+    and histograms from several threads can be merged.
+    """
+
+    def __init__(self):
+        self.sub_count = 1 << SUB_BITS
+        self.half = self.sub_count >> 1
+        self.counts = [0] * (self.sub_count + 64 * self.half)
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.sum = 0
+
+    def _index(self, value):
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - SUB_BITS
+        return self.sub_count + (shift - 1) * self.half + (value >> shift) - self.half
+
+    def _value(self, index):
+        # The highest value a bucket holds, so percentiles never under-report
+        if index < self.sub_count:
+            return index
+        shift, offset = divmod(index - self.sub_count, self.half)
+        shift += 1
+        return ((offset + self.half + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(0, int(value))
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, p):
+        if not self.total:
+            return 0
+        rank = max(1, int(self.total * p / 100 + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Percentiles, mean and max in microseconds.
+        """
+        return {
+            'count': self.total,
+            'mean_us': round(self.sum / self.total / 1000, 2) if self.total else 0,
+            'min_us': round((self.min or 0) / 1000, 2),
+            **{f'p{p:g}_us': round(self.percentile(p) / 1000, 2) for p in PERCENTILES},
+            'max_us': round(self.max / 1000, 2),
+        }
+
+
+class OrderFlow:
+    """
+    Repeatable synthetic order flow around `mid` (KES). Limit prices are drawn from
+    a normal distribution (`sigma` ticks) or uniformly within `spread` ticks,
+    skewed so buys sit below the mid and sells above with some crossing.
+    `market_ratio` of orders are market orders, `ioc_ratio` IOC, and
+    `cancel_ratio` of events cancel one of the worker's own resting orders.
+    """
+
+    def __init__(self, seed=42, mid=6500, distribution='normal', sigma=50, spread=200,
+                 cancel_ratio=0.2, market_ratio=0.05, ioc_ratio=0.05, max_quantity=50):
+        self.rng = random.Random(seed)
+        self.mid = int(mid * 100)
+        self.distribution = distribution
+        self.sigma = sigma
+        self.spread = spread
+        self.cancel_ratio = cancel_ratio
+        self.market_ratio = market_ratio
+        self.ioc_ratio = ioc_ratio
+        self.max_quantity = max_quantity
+
+    def _offset(self):
+        if self.distribution == 'uniform':
+            return self.rng.randint(-self.spread, self.spread)
+        return int(self.rng.gauss(0, self.sigma))
+
+    def next_event(self, has_resting):
+        """
+        Returns ('cancel',) or ('submit', side, quantity, price, order_type).
+        """
+        rng = self.rng
+        if has_resting and rng.random() < self.cancel_ratio:
+            return ('cancel',)
+        side = BUY if rng.random() < 0.5 else SELL
+        quantity = rng.randint(1, self.max_quantity)
+        roll = rng.random()
+        if roll < self.market_ratio:
+            return ('submit', side, quantity, None, MARKET)
+        # Mostly passive: buys below the mid and sells above, by the drawn distance
+        ticks = self.mid + (-abs(self._offset()) - 1 if side == BUY else abs(self._offset()) + 1)
+        if rng.random() < 0.1:
+            ticks = self.mid + (self._offset() if side == BUY else -self._offset())
+        order_type = IOC if roll < self.market_ratio + self.ioc_ratio else LIMIT
+        return ('submit', side, quantity, f'{ticks / 100:.2f}', order_type)
+
+
+# Targets: each returns the order id (if it rests) for submit and handles cancel
+
+class InProcessTarget:
+    """
+    Calls a MatchingEngine directly.
+    """
+    name = 'inprocess'
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def submit(self, symbol, side, quantity, price, order_type, owner):
+        report = self.engine.submit(symbol, side, quantity, price, order_type, owner=owner)
+        return report.order_id if report.remaining else None
+
+    def cancel(self, symbol, order_id, owner):
+        self.engine.cancel(symbol, order_id, owner=owner)
+
+
+class ServiceTarget:
+    """
+    Calls the running engine process over its socket, as the web views do.
+    """
+    name = 'service'
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, symbol, side, quantity, price, order_type, owner):
+        report = self.client.submit(symbol, side, quantity, price, order_type, owner=owner)
+        return report['order_id'] if report['remaining'] else None
+
+    def cancel(self, symbol, order_id, owner):
+        self.client.cancel(symbol, order_id, owner=owner)
+
+
+class ClientTarget:
+    """
+    Goes through the full Django request stack (middleware, URL routing, views)
+    with the test client, logged in as `user`, without a network hop.
+    """
+    name = 'client'
+
+    def __init__(self, user):
+        self.user = user
+        self.local = threading.local()
+
+    def _client(self):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            from django.test import Client
+            client = self.local.client = Client()
+            client.force_login(self.user)
+        return client
+
+    def submit(self, symbol, side, quantity, price, order_type, owner):
+        data = {'side': side, 'quantity': quantity, 'type': order_type}
+        if price is not None:
+            data['price'] = price
+        response = self._client().post(f'/trading/api/{symbol}/orders/', data)
+        return _order_id(response.status_code, response.content)
+
+    def cancel(self, symbol, order_id, owner):
+        self._client().post(f'/trading/api/{symbol}/orders/{order_id}/cancel/')
+
+
+class HttpTarget:
+    """
+    Sends real HTTP requests to a running server at `base_url`, logging in with
+    `username` and `password` through the login form. One session per thread.
+    """
+    name = 'http'
+
+    def __init__(self, base_url, username, password, timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            jar = http.cookiejar.CookieJar()
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+            login_url = f'{self.base_url}/accounts/login/'
+            page = opener.open(login_url, timeout=self.timeout).read().decode()
+            token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', page)
+            form = {'username': self.username, 'password': self.password,
+                    'csrfmiddlewaretoken': token.group(1) if token else ''}
+            opener.open(urllib.request.Request(
+                login_url, urllib.parse.urlencode(form).encode(), headers={'Referer': login_url},
+            ), timeout=self.timeout)
+            csrf = next((cookie.value for cookie in jar if cookie.name == 'csrftoken'), '')
+            if not any(cookie.name == 'sessionid' for cookie in jar):
+                raise RuntimeError(f'Could not log in to {login_url} as {self.username}')
+            session = self.local.session = (opener, csrf)
+        return session
+
+    def _post(self, path, data=None):
+        opener, csrf = self._session()
+        request = urllib.request.Request(
+            f'{self.base_url}{path}', urllib.parse.urlencode(data or {}).encode(),
+            headers={'X-CSRFToken': csrf, 'Referer': self.base_url + '/'},
+        )
+        try:
+            with opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def submit(self, symbol, side, quantity, price, order_type, owner):
+        data = {'side': side, 'quantity': quantity, 'type': order_type}
+        if price is not None:
+            data['price'] = price
+        return _order_id(*self._post(f'/trading/api/{symbol}/orders/', data))
+
+    def cancel(self, symbol, order_id, owner):
+        self._post(f'/trading/api/{symbol}/orders/{order_id}/cancel/')
+
+
+def _order_id(status, content):
+    if status in (301, 302):
+        raise RuntimeError('Redirected instead of placing the order; is the user logged in and KYC verified?')
+    if status != 200:
+        raise OrderRejected(f'HTTP {status}: {content[:200]!r}')
+    body = json.loads(content)
+    return body['order_id'] if body.get('remaining') else None
+
+
+def run_load(target, symbol='LOADGEN', events=100000, rate=0, threads=1, seed=42, warmup=0, owner=None,
+             **flow_options):
+    """
+    Drives `events` order events through `target` from `threads` workers, each
+    with its own repeatable OrderFlow. With a `rate` (events/s across all
+    workers) the load is open-loop: every event has an intended start time and
+    its latency is measured from then, so a stall is charged to every event
+    queued behind it rather than hidden (no coordinated omission). With rate 0
+    each worker sends as fast as responses come back.
+
+    The first `warmup` events of each worker are not recorded. Orders belong to
+    `owner`, or to a made-up owner per worker. Returns a dict of results.
+    """
+    histograms = [LatencyHistogram() for _ in range(threads)]
+    errors = [0] * threads
+    per_thread = [events // threads + (1 if i < events % threads else 0) for i in range(threads)]
+    interval = threads / rate if rate else 0
+    start_barrier = threading.Barrier(threads + 1)
+    clock = time.perf_counter_ns
+
+    failures = []
+
+    def worker(index):
+        flow = OrderFlow(seed=seed + index, **flow_options)
+        histogram = histograms[index]
+        resting = []
+        worker_owner = owner if owner is not None else index + 1
+        try:
+            for _ in range(warmup):
+                event = flow.next_event(bool(resting))
+                try:
+                    _send(target, symbol, event, resting, worker_owner, flow.rng)
+                except OrderRejected:
+                    pass
+            start_barrier.wait()
+            began = clock()
+            for n in range(per_thread[index]):
+                event = flow.next_event(bool(resting))
+                if interval:
+                    # Offset workers so the combined stream is evenly spaced
+                    intended = began + int((n + index / threads) * interval * 1e9)
+                    delay = intended - clock()
+                    if delay > 0:
+                        time.sleep(delay / 1e9)
+                else:
+                    intended = clock()
+                try:
+                    _send(target, symbol, event, resting, worker_owner, flow.rng)
+                except OrderRejected:
+                    errors[index] += 1
+                histogram.record(clock() - intended)
+        except threading.BrokenBarrierError:
+            pass
+        except Exception as e:
+            # Release everyone waiting to start, then report it from the caller
+            failures.append(e)
+            start_barrier.abort()
+
+    workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    try:
+        start_barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - started
+    if failures:
+        raise failures[0]
+
+    histogram = LatencyHistogram()
+    for other in histograms:
+        histogram.merge(other)
+    return {
+        'target': target.name,
+        'symbol': symbol,
+        'events': events,
+        'threads': threads,
+        'rate': rate,
+        'seed': seed,
+        'flow': flow_options,
+        'seconds': round(seconds, 3),
+        'throughput': round(events / seconds, 1) if seconds else 0,
+        'errors': sum(errors),
+        'latency': histogram.summary(),
+    }
+
+
+def _send(target, symbol, event, resting, owner, rng):
+    if event[0] == 'cancel':
+        order_id = resting.pop(rng.randrange(len(resting)))
+        target.cancel(symbol, order_id, owner)
+    else:
+        order_id = target.submit(symbol, *event[1:], owner)
+        if order_id is not None:
+            resting.append(order_id)
+
+
+def compare(result, baseline, tolerance):
+    """
+    Lists the regressions of `result` against a `baseline` result: throughput
+    down, or p50/p99 latency up, by more than `tolerance` (a fraction). p99.9
+    rests on few samples and is allowed twice the tolerance.
+    """
+    regressions = []
+    old, new = baseline['throughput'], result['throughput']
+    if old and new < old * (1 - tolerance):
+        regressions.append(f'throughput {old:,.0f} -> {new:,.0f} events/s')
+    for key, allowed in (('p50_us', tolerance), ('p99_us', tolerance), ('p99.9_us', 2 * tolerance)):
+        old, new = baseline['latency'].get(key), result['latency'].get(key)
+        if old and new > old * (1 + allowed):
+            regressions.append(f'{key} {old} -> {new}')
+    return regressions
@@ -0,0 +1,90 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from django.core.management.base import BaseCommand
+from trading_engine.engine import MatchingEngine
+from trading_engine.orderbook import BUY, SELL, LIMIT, MARKET
+
+class Command(BaseCommand):
+    help = 'Measure journaled order throughput with group commit, then recovery time from the journal and from a snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=1000000, help='Order events to journal')
+        parser.add_argument('--threads', type=int, default=64, help='Concurrent submitting threads')
+        parser.add_argument('--commit-interval', type=float, default=0.001, help='Seconds each flush waits to batch events')
+        parser.add_argument('--dir', help='Journal directory (default: a temporary one, removed afterwards)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for repeatable runs')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or tempfile.mkdtemp(prefix='bench-journal-')
+        if os.path.exists(directory) and os.listdir(directory):
+            self.stderr.write(self.style.ERROR(f'{directory} is not empty'))
+            return
+        try:
+            self._run(directory, options)
+        finally:
+            if not options['dir']:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def _run(self, directory, options):
+        events, threads = options['events'], options['threads']
+        engine = MatchingEngine.recover(directory, commit_interval=options['commit_interval'])
+        mid = 650000  # 6,500.00 KES in ticks
+        symbols = ['SUGAR', 'BROWN', 'WHITE']
+
+        def worker(index, count):
+            rng = random.Random(options['seed'] + index)
+            placed = []
+            for _ in range(count):
+                roll = rng.random()
+                side = BUY if rng.random() < 0.5 else SELL
+                symbol = rng.choice(symbols)
+                if roll < 0.75 or not placed:
+                    offset = rng.randint(1, 200)
+                    price = (mid - offset if side == BUY else mid + offset) / 100
+                    report = engine.submit(symbol, side, rng.randint(1, 50), price, LIMIT, owner=index)
+                    placed.append((symbol, report.order_id))
+                elif roll < 0.85:
+                    engine.submit(symbol, side, rng.randint(1, 20), None, MARKET, owner=index)
+                else:
+                    engine.cancel(*placed.pop(rng.randrange(len(placed))), owner=index)
+
+        self.stdout.write(f'Journaling {events} events from {threads} threads into {directory}...')
+        per_thread = [events // threads + (1 if i < events % threads else 0) for i in range(threads)]
+        workers = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(per_thread)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        journaled, fsyncs = engine.journal.lsn, engine.journal.fsyncs
+        resting = sum(len(book.orders) for book in engine.books.values())
+        engine.close()
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+        self.stdout.write(f'\nJournaled:  {journaled} events in {seconds:.2f}s ({size / 1e6:.1f} MB)')
+        self.stdout.write(self.style.SUCCESS(f'Throughput: {journaled / seconds:,.0f} durable events/s'))
+        self.stdout.write(f'fsyncs:     {fsyncs} ({journaled / max(fsyncs, 1):.0f} events per fsync)')
+
+        recovered = MatchingEngine.recover(directory)
+        self._report('Replaying the whole journal', recovered, resting)
+
+        recovered.snapshot()
+        recovered.close()
+        recovered = MatchingEngine.recover(directory)
+        self._report('Loading the snapshot', recovered, resting)
+        recovered.close()
+
+    def _report(self, label, engine, expected_resting):
+        info = engine.recovered
+        resting = sum(len(book.orders) for book in engine.books.values())
+        self.stdout.write(f'\n{label}:')
+        self.stdout.write(self.style.SUCCESS(f'Recovery:   {info["seconds"]:.2f}s'))
+        self.stdout.write(f'Replayed:   {info["replayed"]} events after snapshot lsn {info["snapshot_lsn"]}')
+        style = self.style.SUCCESS if resting == expected_resting else self.style.ERROR
+        self.stdout.write(style(f'Resting:    {resting} orders (expected {expected_resting})'))
@@ -0,0 +1,96 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from trading_engine.auction import uncross
+from trading_engine.orderbook import OrderBook, BUY, SELL, LIMIT, MARKET, IOC
+
+class Command(BaseCommand):
+    help = 'Microbenchmark the order book with a random mix of limit, market, IOC and cancel events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=200000, help='Order events to process')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for repeatable runs')
+        parser.add_argument('--warm-book', type=int, default=10000, help='Resting orders to place before timing')
+        parser.add_argument('--auction', action='store_true', help='Collect limit orders and clear them in one call auction instead')
+
+    def handle(self, *args, **options):
+        if options['auction']:
+            return self._auction(options)
+        events = options['events']
+        rng = random.Random(options['seed'])
+        book = OrderBook('BENCH')
+        mid = 650000  # 6,500.00 KES in ticks
+
+        # Build the event stream up front so generation is not timed
+        next_id = 1
+        stream = []
+        for _ in range(options['warm_book'] + events):
+            roll = rng.random()
+            side = BUY if rng.random() < 0.5 else SELL
+            if roll < 0.6:
+                offset = rng.randint(1, 200)
+                price = mid - offset if side == BUY else mid + offset
+                stream.append(('submit', next_id, side, rng.randint(1, 50), price, LIMIT))
+            elif roll < 0.7:
+                stream.append(('submit', next_id, side, rng.randint(1, 20), None, MARKET))
+            elif roll < 0.8:
+                price = mid + rng.randint(-50, 50)
+                stream.append(('submit', next_id, side, rng.randint(1, 30), price, IOC))
+            else:
+                stream.append(('cancel', rng.randint(max(1, next_id - 5000), next_id)))
+            next_id += 1
+
+        warm, timed = stream[:options['warm_book']], stream[options['warm_book']:]
+        for event in warm:
+            if event[0] == 'submit':
+                book.submit(*event[1:])
+
+        self.stdout.write(f'Processing {len(timed)} events against a book of {len(book.orders)} resting orders...')
+
+        latencies = []
+        trades = 0
+        clock = time.perf_counter_ns
+        started = clock()
+        for event in timed:
+            t0 = clock()
+            if event[0] == 'submit':
+                trades += len(book.submit(*event[1:]).trades)
+            else:
+                book.cancel(event[1])
+            latencies.append(clock() - t0)
+        seconds = (clock() - started) / 1e9
+
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] / 1000
+
+        self.stdout.write(f'\nEvents:     {len(timed)} in {seconds:.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'Throughput: {len(timed) / seconds:,.0f} events/s'))
+        self.stdout.write(f'Trades:     {trades}')
+        self.stdout.write(f'Latency:    p50 {percentile(0.5):.1f}us, p99 {percentile(0.99):.1f}us, max {latencies[-1] / 1000:.1f}us')
+        self.stdout.write(f'Resting:    {len(book.orders)} orders')
+
+    def _auction(self, options):
+        rng = random.Random(options['seed'])
+        book = OrderBook('BENCH')
+        book.auction = True
+        mid = 650000
+
+        # Both sides spread across the mid, so the collected book crosses heavily
+        started = time.perf_counter()
+        for order_id in range(1, options['events'] + 1):
+            side = BUY if rng.random() < 0.5 else SELL
+            book.collect(order_id, side, rng.randint(1, 50), mid + rng.randint(-300, 300))
+        collect_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = uncross(book)
+        uncross_seconds = time.perf_counter() - started
+        total = collect_seconds + uncross_seconds
+
+        self.stdout.write(f'Orders:        {options["events"]}')
+        self.stdout.write(f'Collect:       {collect_seconds:.2f}s')
+        self.stdout.write(f'Uncross:       {uncross_seconds:.2f}s at {result.price / 100:.2f} KES, {result.volume} bags in {len(result.trades)} trades')
+        self.stdout.write(self.style.SUCCESS(f'Throughput:    {options["events"] / total:,.0f} orders/s'))
+        self.stdout.write(f'Resting after: {len(book.orders)} orders')
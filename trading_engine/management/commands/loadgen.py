@@ -0,0 +1,177 @@
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from market.models import SugarListing
+from trading_engine.engine import MatchingEngine, normalise_symbol
+from trading_engine.loadgen import InProcessTarget, ServiceTarget, ClientTarget, HttpTarget, run_load, compare
+from trading_engine.orderbook import OrderRejected
+from trading_engine.service import EngineUnavailable, get_client
+
+class Command(BaseCommand):
+    help = 'Replay synthetic order flow against the trading engine and report latency percentiles and throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['inprocess', 'client', 'http'], default='inprocess',
+                            help='inprocess: call an engine directly; client: the Django views via the test client; '
+                                 'http: a running server at --url')
+        parser.add_argument('--events', type=int, default=100000, help='Order events to send')
+        parser.add_argument('--warmup', type=int, default=1000, help='Untimed events per thread before measuring')
+        parser.add_argument('--rate', type=float, default=0, help='Target events/s across all threads (0: as fast as possible)')
+        parser.add_argument('--threads', type=int, default=1, help='Concurrent senders')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for repeatable runs')
+        parser.add_argument('--symbol', default='LOADGEN', help='Book to trade in')
+        parser.add_argument('--mid', type=float, default=6500, help='Mid price in KES')
+        parser.add_argument('--distribution', choices=['normal', 'uniform'], default='normal', help='Limit price distribution')
+        parser.add_argument('--sigma', type=int, default=50, help='Standard deviation of normal prices, in ticks')
+        parser.add_argument('--spread', type=int, default=200, help='Half-width of uniform prices, in ticks')
+        parser.add_argument('--cancel-ratio', type=float, default=0.2, help='Share of events that cancel a resting order')
+        parser.add_argument('--market-ratio', type=float, default=0.05, help='Share of orders that are market orders')
+        parser.add_argument('--ioc-ratio', type=float, default=0.05, help='Share of orders that are IOC')
+        parser.add_argument('--shared', action='store_true',
+                            help='inprocess: send to the running engine process (journal, risk checks) instead of a private '
+                                 'engine. Only for an engine journaling to a scratch directory, or not at all; needs --owner')
+        parser.add_argument('--owner', type=int,
+                            help='--shared: id of the user every order is placed for (a test account; its exposure is charged)')
+        parser.add_argument('--journal', action='store_true',
+                            help='inprocess: journal the private engine to a temporary directory, to include fsync')
+        parser.add_argument('--username', help='client/http: verified buyer to trade as (with a credit limit that covers the buys)')
+        parser.add_argument('--password', help='http: password for --username')
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='http: server base URL')
+        parser.add_argument('--json', help='Write the results to this file')
+        parser.add_argument('--compare', help='Results file from an earlier run to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Allowed throughput drop or latency rise against --compare, as a fraction')
+
+    def handle(self, *args, **options):
+        engine, cleanup = None, None
+        owner = None
+        if options['target'] == 'inprocess':
+            if options['shared']:
+                owner = self._shared_owner(options)
+                target = ServiceTarget(get_client())
+            elif options['journal']:
+                cleanup = tempfile.TemporaryDirectory()
+                engine = MatchingEngine.recover(
+                    cleanup.name,
+                    commit_interval=getattr(settings, 'TRADING_JOURNAL_COMMIT_INTERVAL', 0.001),
+                )
+            else:
+                engine = MatchingEngine()
+            if engine is not None:
+                target = InProcessTarget(engine)
+        elif options['target'] == 'client':
+            user = self._user(options)
+            owner = user.pk
+            target = ClientTarget(user)
+        else:
+            if not options['username'] or not options['password']:
+                raise CommandError('--username and --password are required for --target http')
+            target = HttpTarget(options['url'], options['username'], options['password'])
+
+        flow = {
+            key: options[key] for key in
+            ('mid', 'distribution', 'sigma', 'spread', 'cancel_ratio', 'market_ratio', 'ioc_ratio')
+        }
+        pace = f'{options["rate"]:,.0f} events/s' if options['rate'] else 'full speed'
+        self.stdout.write(f'Sending {options["events"]} events to {target.name} from {options["threads"]} thread(s) at {pace}...')
+        try:
+            result = run_load(
+                target, symbol=options['symbol'], events=options['events'], rate=options['rate'],
+                threads=options['threads'], seed=options['seed'], warmup=options['warmup'], owner=owner, **flow,
+            )
+        except (OSError, RuntimeError, EngineUnavailable) as e:
+            raise CommandError(f'Load run failed: {e}')
+        finally:
+            if engine is not None:
+                engine.close()
+            if cleanup is not None:
+                cleanup.cleanup()
+        result.update({
+            'commit': self._commit(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'journal': options['journal'] or options['shared'],
+            'run_at': timezone.now().isoformat(),
+        })
+
+        latency = result['latency']
+        self.stdout.write(f'\nEvents:     {result["events"]} in {result["seconds"]:.2f}s ({result["errors"]} rejected)')
+        self.stdout.write(self.style.SUCCESS(f'Throughput: {result["throughput"]:,.0f} events/s'))
+        self.stdout.write(
+            f'Latency:    p50 {latency["p50_us"]}us, p90 {latency["p90_us"]}us, p99 {latency["p99_us"]}us, '
+            f'p99.9 {latency["p99.9_us"]}us, max {latency["max_us"]}us'
+        )
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(f'Results written to {options["json"]}')
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self._check_comparable(result, baseline)
+            regressions = compare(result, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError(f'Regressed against {baseline.get("commit") or options["compare"]}: ' + '; '.join(regressions))
+            self.stdout.write(self.style.SUCCESS(f'No regression against {baseline.get("commit") or options["compare"]}'))
+
+    def _user(self, options):
+        if not options['username']:
+            raise CommandError('--username is required for --target client')
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["username"]} not found')
+        if not user.is_verified_buyer and not user.is_superuser:
+            raise CommandError(f'User {user.username} must be a verified buyer to reach the trading API')
+        return user
+
+    def _shared_owner(self, options):
+        """
+        Checks a --shared run cannot leave anything real behind, and returns the owner to trade as.
+        """
+        if options['owner'] is None:
+            raise CommandError('--shared needs --owner: the id of a test user to place every order for')
+        if not get_user_model().objects.filter(pk=options['owner']).exists():
+            raise CommandError(f'User {options["owner"]} not found')
+        try:
+            symbol = normalise_symbol(options['symbol'])
+        except OrderRejected as e:
+            raise CommandError(str(e))
+        if SugarListing.objects.filter(trading_symbol=symbol).exists():
+            raise CommandError(f'{symbol} is the trading symbol of a listing, whose fills would be recorded')
+        try:
+            journal = get_client().info()['journal']
+        except EngineUnavailable as e:
+            raise CommandError(str(e))
+        # The orders are recovered on every restart of an engine journaling somewhere durable
+        scratch = os.path.realpath(tempfile.gettempdir()) + os.sep
+        if journal is not None and not os.path.realpath(journal).startswith(scratch):
+            raise CommandError(
+                f'The engine journals to {journal}; --shared only runs against an engine journaling '
+                f'under {scratch} or not at all'
+            )
+        return options['owner']
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _check_comparable(self, result, baseline):
+        # Numbers only mean something against a run with the same load
+        keys = ('target', 'events', 'threads', 'rate', 'seed', 'flow', 'journal')
+        different = [key for key in keys if baseline.get(key) != result.get(key)]
+        if different:
+            self.stdout.write(self.style.WARNING(f'Baseline was run with different settings: {", ".join(different)}'))
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from trading_engine.auction import AuctionScheduler
+from trading_engine.engine import TradeRedelivery, start_engine
+from trading_engine.journal import JournalLocked
+from trading_engine.service import EngineAlreadyRunning, EngineServer
+
+class Command(BaseCommand):
+    help = (
+        'Run the trading engine: recover the order books, then serve orders from the web '
+        'processes over a local socket. Run exactly one, alongside the web and Celery workers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-auctions', action='store_true',
+            help='Do not run the periodic call auctions for TRADING_AUCTION_SYMBOLS',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            server = EngineServer()
+        except EngineAlreadyRunning as e:
+            raise CommandError(str(e))
+        engine = scheduler = redelivery = None
+        try:
+            try:
+                engine = start_engine()
+            except JournalLocked as e:
+                raise CommandError(str(e))
+            recovered = getattr(engine, 'recovered', None)
+            if recovered:
+                self.stdout.write(
+                    f'Recovered {recovered["replayed"]} journal events after snapshot {recovered["snapshot_lsn"]} '
+                    f'in {recovered["seconds"]:.2f}s'
+                )
+            redelivery = TradeRedelivery(engine)
+            redelivery.start()
+            # Auctions run here only, next to the one engine they uncross
+            symbols = getattr(settings, 'TRADING_AUCTION_SYMBOLS', ())
+            if symbols and not options['no_auctions']:
+                scheduler = AuctionScheduler(engine, symbols, getattr(settings, 'TRADING_AUCTION_INTERVAL', 60))
+                scheduler.start()
+                self.stdout.write(f'Running call auctions for {", ".join(symbols)}')
+            self.stdout.write(self.style.SUCCESS(f'Trading engine serving on {server.address}'))
+            server.serve_forever(engine)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            if scheduler is not None:
+                scheduler.stop()
+                scheduler.join()
+            if redelivery is not None:
+                redelivery.stop()
+            if engine is not None:
+                engine.close()
@@ -0,0 +1,344 @@
+import heapq
+from collections import deque
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+BUY = 'buy'
+SELL = 'sell'
+
+LIMIT = 'limit'
+MARKET = 'market'
+IOC = 'ioc'
+ORDER_TYPES = (LIMIT, MARKET, IOC)
+
+# Prices are held as integer ticks of 0.01 KES, so levels compare and hash cheaply
+TICKS_PER_UNIT = 100
+
+
+def to_ticks(price):
+    try:
+        return int((Decimal(str(price)) * TICKS_PER_UNIT).to_integral_value(rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError, OverflowError):
+        raise OrderRejected(f'Invalid price: {price}')
+
+
+def from_ticks(ticks):
+    return (Decimal(ticks) / TICKS_PER_UNIT).quantize(Decimal('0.01'))
+
+
+class OrderRejected(Exception):
+    pass
+
+
+def validate_order(side, quantity, price, order_type):
+    """
+    Raises OrderRejected for an order no book would accept; `price` is in ticks.
+    """
+    if side not in (BUY, SELL):
+        raise OrderRejected(f'Unknown side: {side}')
+    if order_type not in ORDER_TYPES:
+        raise OrderRejected(f'Unknown order type: {order_type}')
+    if quantity <= 0:
+        raise OrderRejected('Quantity must be positive')
+    if order_type != MARKET and (price is None or price <= 0):
+        raise OrderRejected('Limit and IOC orders need a positive price')
+
+
+class RestingOrder:
+    __slots__ = ('order_id', 'owner', 'side', 'price', 'remaining', 'active')
+
+    def __init__(self, order_id, owner, side, price, remaining):
+        self.order_id = order_id
+        self.owner = owner
+        self.side = side
+        self.price = price
+        self.remaining = remaining
+        self.active = True
+
+
+class PriceLevel:
+    """
+    The orders resting at one price, oldest first. Cancelled orders stay in the
+    queue, marked inactive, until they reach the front or outnumber the live
+    ones, when the queue is compacted.
+    """
+    __slots__ = ('price', 'orders', 'volume', 'count')
+
+    def __init__(self, price):
+        self.price = price
+        self.orders = deque()
+        self.volume = 0
+        self.count = 0
+
+    def front(self):
+        orders = self.orders
+        while orders and not orders[0].active:
+            orders.popleft()
+        return orders[0] if orders else None
+
+    def compact(self):
+        """
+        Drops cancelled orders from the queue once they outnumber the live ones,
+        so a level that never trades does not grow without bound. Linear in the
+        queue, but at most once per `count` cancels.
+        """
+        if len(self.orders) > 2 * self.count:
+            self.orders = deque(order for order in self.orders if order.active)
+
+
+class Trade:
+    __slots__ = ('sequence', 'maker_id', 'taker_id', 'maker_owner', 'taker_owner', 'side', 'price', 'quantity')
+
+    def __init__(self, sequence, maker, taker_id, taker_owner, side, price, quantity):
+        self.sequence = sequence
+        self.maker_id = maker.order_id
+        self.maker_owner = maker.owner
+        self.taker_id = taker_id
+        self.taker_owner = taker_owner
+        self.side = side  # The taker's side
+        self.price = price
+        self.quantity = quantity
+
+    def as_row(self):
+        return [self.sequence, self.maker_id, self.maker_owner, self.taker_id, self.taker_owner, self.side, self.price, self.quantity]
+
+    @classmethod
+    def from_row(cls, row):
+        trade = cls.__new__(cls)
+        (trade.sequence, trade.maker_id, trade.maker_owner, trade.taker_id, trade.taker_owner,
+         trade.side, trade.price, trade.quantity) = row
+        return trade
+
+    def as_dict(self):
+        return {
+            'sequence': self.sequence,
+            'maker_id': self.maker_id,
+            'taker_id': self.taker_id,
+            'side': self.side,
+            'price': str(from_ticks(self.price)),
+            'quantity': self.quantity,
+        }
+
+
+class ExecutionReport:
+    __slots__ = ('order_id', 'status', 'filled', 'remaining', 'trades')
+
+    def __init__(self, order_id, status, filled, remaining, trades):
+        self.order_id = order_id
+        self.status = status
+        self.filled = filled
+        self.remaining = remaining
+        self.trades = trades
+
+    def as_dict(self):
+        return {
+            'order_id': self.order_id,
+            'status': self.status,
+            'filled': self.filled,
+            'remaining': self.remaining,
+            'trades': [trade.as_dict() for trade in self.trades],
+        }
+
+
+class OrderBook:
+    """
+    Price-time priority limit order book for one product.
+
+    Each side keeps a dict of price -> PriceLevel and a heap of the level prices
+    (bids negated), so the best price is at the top of the heap. Adding an order at
+    a new price is one heap push, O(log n); at an existing price it is a deque append.
+    Cancelling is amortised O(1): the order is marked inactive and its level's
+    totals drop at once, while the entry itself is discarded when matching reaches
+    it or the level compacts (see PriceLevel), and an emptied level's heap entry
+    when a best-price lookup reaches it.
+
+    Quantities are whole bags and prices integer ticks (see to_ticks).
+    Not thread-safe; MatchingEngine serialises access.
+
+    While `auction` is set the book is collecting orders for a call auction:
+    collect() rests them without matching, so the book may cross until
+    auction.uncross() clears it.
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.auction = False
+        self.sequence = 0
+        self.clear()
+
+    def clear(self):
+        self.levels = {BUY: {}, SELL: {}}
+        self.heaps = {BUY: [], SELL: []}
+        self.orders = {}
+
+    # Book state
+
+    def _best_level(self, side):
+        heap = self.heaps[side]
+        levels = self.levels[side]
+        while heap:
+            price = -heap[0] if side == BUY else heap[0]
+            level = levels.get(price)
+            if level is not None and level.count:
+                return level
+            heapq.heappop(heap)
+            if level is not None:
+                del levels[price]
+        return None
+
+    def best_bid(self):
+        level = self._best_level(BUY)
+        return level.price if level else None
+
+    def best_ask(self):
+        level = self._best_level(SELL)
+        return level.price if level else None
+
+    def depth(self, levels=10):
+        """
+        Returns up to `levels` aggregated price levels per side (all of them when
+        None), best first, as (price ticks, volume, order count).
+        """
+        book = {}
+        for side, reverse in ((BUY, True), (SELL, False)):
+            live = [level for level in self.levels[side].values() if level.count]
+            if levels is None:
+                best = sorted(live, key=lambda l: l.price, reverse=reverse)
+            elif reverse:
+                best = heapq.nlargest(levels, live, key=lambda l: l.price)
+            else:
+                best = heapq.nsmallest(levels, live, key=lambda l: l.price)
+            book[side] = [(level.price, level.volume, level.count) for level in best]
+        return book
+
+    def cost_to_fill(self, side, quantity):
+        """
+        What a market order for `quantity` on `side` would pay, in ticks x bags,
+        walking the opposite side best price first. Only the fillable part counts.
+        """
+        opposite = SELL if side == BUY else BUY
+        cost = 0
+        for price in sorted(self.levels[opposite], reverse=opposite == BUY):
+            level = self.levels[opposite][price]
+            take = min(level.volume, quantity)
+            cost += take * price
+            quantity -= take
+            if not quantity:
+                break
+        return cost
+
+    # Order entry
+
+    def submit(self, order_id, side, quantity, price=None, order_type=LIMIT, owner=None):
+        """
+        Matches an incoming order against the book and rests any limit remainder.
+        Market and IOC remainders are cancelled. Returns an ExecutionReport.
+        """
+        validate_order(side, quantity, price, order_type)
+        if order_type == MARKET:
+            price = None
+        if order_id in self.orders:
+            raise OrderRejected(f'Duplicate order id: {order_id}')
+
+        remaining = quantity
+        trades = []
+        opposite = SELL if side == BUY else BUY
+
+        while remaining:
+            level = self._best_level(opposite)
+            if level is None:
+                break
+            if price is not None and (level.price > price if side == BUY else level.price < price):
+                break
+
+            maker = level.front()
+            fill = maker.remaining if maker.remaining < remaining else remaining
+            maker.remaining -= fill
+            remaining -= fill
+            level.volume -= fill
+            self.sequence += 1
+            trades.append(Trade(self.sequence, maker, order_id, owner, side, level.price, fill))
+
+            if not maker.remaining:
+                maker.active = False
+                level.orders.popleft()
+                level.count -= 1
+                del self.orders[maker.order_id]
+
+        filled = quantity - remaining
+        if remaining and order_type == LIMIT:
+            self._rest(RestingOrder(order_id, owner, side, price, remaining))
+            status = 'partial' if filled else 'resting'
+        elif remaining:
+            status = 'partial' if filled else 'cancelled'
+        else:
+            status = 'filled'
+        self.sequence += 1
+        return ExecutionReport(order_id, status, filled, remaining if order_type == LIMIT else 0, trades)
+
+    def collect(self, order_id, side, quantity, price, order_type=LIMIT, owner=None):
+        """
+        Rests a limit order for the next auction without matching it.
+        """
+        validate_order(side, quantity, price, order_type)
+        if order_type != LIMIT:
+            raise OrderRejected('Only limit orders are accepted during an auction')
+        if order_id in self.orders:
+            raise OrderRejected(f'Duplicate order id: {order_id}')
+        self._rest(RestingOrder(order_id, owner, side, price, quantity))
+        self.sequence += 1
+        return ExecutionReport(order_id, 'queued', 0, quantity, [])
+
+    def _rest(self, order):
+        levels = self.levels[order.side]
+        level = levels.get(order.price)
+        if level is None:
+            level = levels[order.price] = PriceLevel(order.price)
+            heapq.heappush(self.heaps[order.side], -order.price if order.side == BUY else order.price)
+        level.orders.append(order)
+        level.volume += order.remaining
+        level.count += 1
+        self.orders[order.order_id] = order
+
+    def cancel(self, order_id, owner=None):
+        """
+        Cancels a resting order. Returns the cancelled RestingOrder, or None if it is
+        not resting (already filled, cancelled or unknown) or belongs to someone else.
+        """
+        order = self.orders.get(order_id)
+        if order is None or (owner is not None and order.owner != owner):
+            return None
+        del self.orders[order_id]
+        order.active = False
+        level = self.levels[order.side][order.price]
+        level.volume -= order.remaining
+        level.count -= 1
+        level.compact()
+        self.sequence += 1
+        return order
+
+    def level_state(self, side, price):
+        """
+        The (volume, order count) now resting at a price; (0, 0) if none.
+        """
+        level = self.levels[side].get(price)
+        return (level.volume, level.count) if level else (0, 0)
+
+    # Snapshots
+
+    def resting(self):
+        """
+        Yields the live resting orders, each level oldest first, so resting them
+        again in this order rebuilds the same time priority.
+        """
+        for side in (BUY, SELL):
+            for level in self.levels[side].values():
+                if level.count:
+                    for order in level.orders:
+                        if order.active:
+                            yield order
+
+    def restore(self, order_id, owner, side, price, remaining):
+        """
+        Rests an order from a snapshot without matching it.
+        """
+        self._rest(RestingOrder(order_id, owner, side, price, remaining))
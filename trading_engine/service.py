@@ -0,0 +1,234 @@
+import os
+import threading
+from multiprocessing.connection import Client, Listener
+from django.conf import settings
+from .engine import normalise_symbol
+from .orderbook import OrderRejected
+
+
+class EngineUnavailable(Exception):
+    """
+    The engine process is not running or did not answer in time.
+    """
+
+
+class EngineAlreadyRunning(Exception):
+    pass
+
+
+def engine_address():
+    return str(settings.TRADING_ENGINE_SOCKET)
+
+
+def _authkey():
+    return settings.SECRET_KEY.encode('utf-8')
+
+
+class EngineServer:
+    """
+    Serves one MatchingEngine to the other processes over a Unix socket, so every
+    web worker trades in the same books. Each connection gets a thread, which
+    makes one call at a time: a request is a (method, args) tuple and the reply
+    ('ok', value), ('rejected', message) for an OrderRejected, or ('error', message).
+
+    An exclusive lock on `<address>.lock`, taken before the engine is started
+    and held for the life of the server, keeps a second engine from starting
+    while this one runs; a socket left behind by a crash is replaced.
+    """
+
+    # The calls clients may make, each served by the method of the same name
+    METHODS = ('submit', 'cancel', 'depth', 'overview', 'subscribe', 'delta', 'info')
+
+    def __init__(self, address=None, authkey=None):
+        import fcntl
+        self.engine = None
+        self.address = address or engine_address()
+        os.makedirs(os.path.dirname(self.address) or '.', exist_ok=True)
+        self._lock_file = open(self.address + '.lock', 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise EngineAlreadyRunning(f'Another trading engine is serving {self.address}')
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        self.listener = Listener(self.address, family='AF_UNIX', authkey=authkey or _authkey())
+        self._closed = False
+
+    def serve_forever(self, engine):
+        self.engine = engine
+        while not self._closed:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                if self._closed:
+                    return
+                raise
+            except Exception as e:
+                # A client that failed the handshake; keep serving the others
+                print(f"Rejected a trading engine connection: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(connection,), name='trading-client', daemon=True).start()
+
+    def _serve(self, connection):
+        with connection:
+            while True:
+                try:
+                    method, args = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if method not in self.METHODS:
+                        raise ValueError(f'Unknown method: {method}')
+                    reply = ('ok', getattr(self, method)(*args))
+                except OrderRejected as e:
+                    reply = ('rejected', str(e))
+                except Exception as e:
+                    print(f"Error serving trading engine call {method}: {e}")
+                    reply = ('error', f'{type(e).__name__}: {e}')
+                try:
+                    connection.send(reply)
+                except OSError:
+                    return
+
+    def close(self):
+        self._closed = True
+        self.listener.close()
+        self._lock_file.close()
+
+    # Calls
+
+    def submit(self, symbol, side, quantity, price, order_type, owner):
+        return self.engine.submit(symbol, side, quantity, price, order_type, owner=owner).as_dict()
+
+    def cancel(self, symbol, order_id, owner):
+        order = self.engine.cancel(symbol, order_id, owner=owner)
+        return order.remaining if order is not None else None
+
+    def depth(self, symbol, levels):
+        book = self.engine.find_book(symbol)
+        return {
+            'auction': book.auction if book is not None else False,
+            'depth': self.engine.depth(symbol, levels),
+        }
+
+    def overview(self):
+        return self.engine.overview()
+
+    def subscribe(self, symbol):
+        subscription = self.engine.subscribe(symbol)
+        if subscription is None:
+            return None
+        feed, depth, seq = subscription
+        return feed.snapshot(depth, seq), seq
+
+    def delta(self, symbol, seq):
+        feed = self.engine.feeds.get(normalise_symbol(symbol))
+        return feed.delta(seq) if feed is not None else None
+
+    def info(self):
+        journal = self.engine.journal
+        return {'journal': journal.directory if journal is not None else None}
+
+
+class EngineClient:
+    """
+    Calls the engine process (see EngineServer). Each thread keeps its own
+    connection, opened on first use and dropped after any failure. Calls that
+    change the books are never retried, since a lost reply does not say whether
+    the engine applied them; reads are retried once on a fresh connection.
+
+    Mirrors the engine's methods, with plain values in place of its objects:
+    submit() returns the execution report as a dict and cancel() the quantity
+    cancelled (None if the order was not resting). Raises OrderRejected as the
+    engine does, and EngineUnavailable when it cannot be reached.
+    """
+
+    def __init__(self, address=None, authkey=None, timeout=None):
+        self.address = address or engine_address()
+        self.authkey = authkey or _authkey()
+        self.timeout = timeout if timeout is not None else getattr(settings, 'TRADING_ENGINE_TIMEOUT', 5)
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            try:
+                connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            except (OSError, EOFError) as e:
+                raise EngineUnavailable(f'The trading engine is not running ({e})')
+            self.local.connection = connection
+        return connection
+
+    def _drop(self):
+        connection = getattr(self.local, 'connection', None)
+        self.local.connection = None
+        if connection is not None:
+            connection.close()
+
+    def _call(self, method, *args, retry=False):
+        for attempt in range(2 if retry else 1):
+            connection = self._connection()
+            try:
+                connection.send((method, args))
+                if not connection.poll(self.timeout):
+                    self._drop()
+                    raise EngineUnavailable(f'The trading engine did not answer {method} in time')
+                status, value = connection.recv()
+                break
+            except (OSError, EOFError) as e:
+                self._drop()
+                if not retry or attempt:
+                    raise EngineUnavailable(f'Lost the connection to the trading engine ({e})')
+        if status == 'rejected':
+            raise OrderRejected(value)
+        if status == 'error':
+            raise RuntimeError(f'Trading engine error: {value}')
+        return value
+
+    def submit(self, symbol, side, quantity, price=None, order_type='limit', owner=None):
+        return self._call('submit', symbol, side, quantity, price, order_type, owner)
+
+    def cancel(self, symbol, order_id, owner=None):
+        return self._call('cancel', symbol, order_id, owner)
+
+    def depth(self, symbol, levels=10):
+        """
+        Returns (in auction, depth) for the book; an unknown book is empty.
+        """
+        state = self._call('depth', symbol, levels, retry=True)
+        return state['auction'], state['depth']
+
+    def overview(self):
+        return self._call('overview', retry=True)
+
+    def subscribe(self, symbol):
+        """
+        Returns (rendered snapshot, feed sequence) for a book, or None if there is no such book.
+        """
+        return self._call('subscribe', symbol, retry=True)
+
+    def delta(self, symbol, seq):
+        """
+        As BookFeed.delta(), for the feed of a book already subscribed to.
+        """
+        return self._call('delta', symbol, seq, retry=True)
+
+    def info(self):
+        """
+        Returns {'journal': the engine's journal directory, or None if it has none}.
+        """
+        return self._call('info', retry=True)
+
+
+_client = None
+
+
+def get_client():
+    """
+    Returns this process's client for the engine process.
+    """
+    global _client
+    if _client is None:
+        _client = EngineClient()
+    return _client
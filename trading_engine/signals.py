@@ -0,0 +1,16 @@
+from django.dispatch import Signal
+
+# Sent by the matching engine once an order's trades are durable, outside the engine
+# lock, with `symbol`, `trades` (orderbook.Trade objects), `at` (an aware datetime)
+# and `replayed`. Receivers must tolerate the same trades twice: after a receiver
+# raises they are sent again, and on startup the trades of the replayed journal
+# events are sent again with `replayed` set. See MatchingEngine.deliver_trades().
+trades_executed = Signal()
+
+
+class UndeliverableTrades(Exception):
+    """
+    Raised by a trades_executed receiver for trades it can never take, such as
+    ones that conflict with what it already recorded. The engine sets them aside
+    (see MatchingEngine.deliver_trades()) instead of sending them again.
+    """
@@ -1,3 +1,288 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+import threading
+from unittest import mock
+from django.dispatch import Signal
+from django.test import SimpleTestCase
+from .engine import MatchingEngine
+from .journal import DEAD_LETTER_NAME, Journal, JournalError, JournalLocked, _segments
+from .orderbook import BUY, SELL, LIMIT, MARKET, IOC, OrderBook, OrderRejected, to_ticks
+from .service import EngineAlreadyRunning, EngineClient, EngineServer
+from .signals import UndeliverableTrades
 
-# Create your tests here.
+
+class ReferenceBook:
+    """
+    A deliberately naive price-time priority book: a flat list of resting orders,
+    scanned in full for every match. Slow, but obviously right.
+    """
+
+    def __init__(self):
+        self.orders = []  # [order_id, side, price, remaining], oldest first
+
+    def submit(self, order_id, side, quantity, price, order_type):
+        trades = []
+        while quantity:
+            crossing = [
+                order for order in self.orders
+                if order[1] != side and (price is None or (order[2] <= price if side == BUY else order[2] >= price))
+            ]
+            if not crossing:
+                break
+            # min() keeps the first of equal keys, i.e. the oldest order at the best price
+            maker = min(crossing, key=lambda order: order[2] if side == BUY else -order[2])
+            fill = min(maker[3], quantity)
+            trades.append((maker[0], order_id, maker[2], fill))
+            maker[3] -= fill
+            quantity -= fill
+            if not maker[3]:
+                self.orders.remove(maker)
+        if quantity and order_type == LIMIT:
+            self.orders.append([order_id, side, price, quantity])
+        return trades
+
+    def cancel(self, order_id):
+        for order in self.orders:
+            if order[0] == order_id:
+                self.orders.remove(order)
+                return True
+        return False
+
+    def depth(self):
+        book = {}
+        for side in (BUY, SELL):
+            levels = {}
+            for order_id, order_side, price, remaining in self.orders:
+                if order_side == side:
+                    volume, count = levels.get(price, (0, 0))
+                    levels[price] = (volume + remaining, count + 1)
+            book[side] = sorted(
+                ((price, volume, count) for price, (volume, count) in levels.items()),
+                reverse=side == BUY,
+            )
+        return book
+
+
+class OrderBookTests(SimpleTestCase):
+    def test_matches_reference_book(self):
+        rng = random.Random(7)
+        book, reference = OrderBook('TEST'), ReferenceBook()
+        resting = []
+        for order_id in range(1, 5001):
+            if resting and rng.random() < 0.25:
+                cancel_id = resting.pop(rng.randrange(len(resting)))
+                self.assertEqual(book.cancel(cancel_id) is not None, reference.cancel(cancel_id))
+            else:
+                side = rng.choice((BUY, SELL))
+                quantity = rng.randint(1, 20)
+                order_type = rng.choices((LIMIT, MARKET, IOC), weights=(90, 5, 5))[0]
+                price = None if order_type == MARKET else 10000 + rng.randint(-30, 30)
+                report = book.submit(order_id, side, quantity, price, order_type)
+                expected = reference.submit(order_id, side, quantity, price, order_type)
+                self.assertEqual(
+                    [(t.maker_id, t.taker_id, t.price, t.quantity) for t in report.trades], expected,
+                    f'order {order_id}',
+                )
+                if report.remaining:
+                    resting.append(order_id)
+            self.assertEqual(book.depth(None), reference.depth(), f'after event {order_id}')
+
+    def test_cancelled_orders_are_compacted(self):
+        book = OrderBook('TEST')
+        book.submit(1, BUY, 1, 100)
+        for order_id in range(2, 1002):
+            book.submit(order_id, BUY, 1, 100)
+            book.cancel(order_id)
+        level = book.levels[BUY][100]
+        self.assertLessEqual(len(level.orders), 2 * level.count + 1)
+        self.assertEqual(book.depth(), {BUY: [(100, 1, 1)], SELL: []})
+
+    def test_rejects_prices_that_are_not_finite(self):
+        for price in ('Infinity', '-Infinity', 'NaN', 'abc'):
+            with self.assertRaises(OrderRejected):
+                to_ticks(price)
+
+
+class MatchingEngineTests(SimpleTestCase):
+    def test_read_paths_do_not_open_books(self):
+        engine = MatchingEngine()
+        self.assertEqual(engine.depth('NOBOOK'), {BUY: [], SELL: []})
+        self.assertIsNone(engine.subscribe('NOBOOK'))
+        self.assertIsNone(engine.cancel('NOBOOK', 1))
+        self.assertEqual(engine.books, {})
+
+    def test_orders_are_checked_before_anything_is_reserved(self):
+        class Ledger:
+            reserved = []
+
+            def reserve_trading(self, owner, cents):
+                self.reserved.append((owner, cents))
+                return True
+
+        engine = MatchingEngine(risk=Ledger())
+        for order_type in (LIMIT, IOC):
+            with self.assertRaises(OrderRejected):
+                engine.submit('SUGAR', BUY, 5, None, order_type, owner=1)
+        with self.assertRaises(OrderRejected):
+            engine.submit('SUGAR', BUY, 'five', '65.00', owner=1)
+        self.assertEqual(Ledger.reserved, [])
+
+
+class JournalTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_events_after_a_torn_line_survive_the_next_restart(self):
+        engine = MatchingEngine.recover(self.directory, commit_interval=0)
+        engine.submit('SUGAR', BUY, 5, '65.00')
+        engine.close()
+        with open(_segments(self.directory)[-1][1], 'ab') as handle:
+            handle.write(b'[3,"s","SUG')
+
+        engine = MatchingEngine.recover(self.directory, commit_interval=0)
+        engine.submit('SUGAR', BUY, 3, '64.00')
+        engine.close()
+
+        engine = MatchingEngine.recover(self.directory, commit_interval=0)
+        self.addCleanup(engine.close)
+        self.assertEqual(engine.recovered['replayed'], 3)  # The book, then its two orders
+        self.assertEqual(engine.depth('SUGAR'), {BUY: [(6500, 5, 1), (6400, 3, 1)], SELL: []})
+
+    def test_a_second_process_cannot_open_the_journal(self):
+        engine = MatchingEngine.recover(self.directory, commit_interval=0)
+        self.addCleanup(engine.close)
+        with self.assertRaises(JournalLocked):
+            MatchingEngine.recover(self.directory)
+
+    def test_a_failed_write_is_raised_to_the_waiting_callers(self):
+        journal = Journal(self.directory, commit_interval=0)
+        self.addCleanup(journal.close)
+        journal._file.close()
+        lsn = journal.append(['a', 'SUGAR'])
+        with self.assertRaises(JournalError):
+            journal.wait(lsn)
+        with self.assertRaises(JournalError):
+            journal.append(['a', 'SUGAR'])
+
+
+class TradeDeliveryTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        # Only this test's receiver, not the apps' (which need the database)
+        patcher = mock.patch('trading_engine.engine.trades_executed', Signal())
+        self.signal = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.deliveries = []
+        self.failing = False
+        self.rejecting = ()
+        self.signal.connect(self.receive)
+
+    def receive(self, sender, symbol, trades, at, replayed, **kwargs):
+        if self.failing is True or symbol == self.failing:
+            raise RuntimeError('database down')
+        if symbol in self.rejecting:
+            raise UndeliverableTrades('conflicts with a recorded fill')
+        self.deliveries.append((symbol, [trade.sequence for trade in trades], at, replayed))
+
+    def trade(self, engine, symbol='SUGAR'):
+        engine.submit(symbol, SELL, 5, '65.00', owner=1)
+        engine.submit(symbol, BUY, 2, '65.00', owner=2)
+
+    def test_failed_deliveries_are_sent_again(self):
+        engine = MatchingEngine()
+        self.failing = True
+        self.trade(engine)
+        self.assertEqual((self.deliveries, len(engine.outbox)), ([], 1))
+        self.failing = False
+        self.assertEqual(engine.deliver_trades(), 0)
+        self.assertEqual(len(self.deliveries), 1)
+
+    def test_a_failing_symbol_does_not_hold_up_the_others(self):
+        engine = MatchingEngine()
+        self.failing = 'BAD'
+        self.trade(engine, 'BAD')
+        self.trade(engine)
+        self.assertEqual([symbol for symbol, *_ in self.deliveries], ['SUGAR'])
+        self.assertEqual(len(engine.outbox), 1)
+
+    def test_undeliverable_trades_are_set_aside(self):
+        engine = MatchingEngine.recover(self.directory, commit_interval=0)
+        self.addCleanup(engine.close)
+        self.rejecting = ('BAD',)
+        self.trade(engine, 'BAD')
+        self.trade(engine)
+        self.assertEqual([symbol for symbol, *_ in self.deliveries], ['SUGAR'])
+        self.assertEqual(len(engine.outbox), 0)
+        with open(os.path.join(self.directory, DEAD_LETTER_NAME)) as handle:
+            self.assertEqual([json.loads(line)['symbol'] for line in handle], ['BAD'])
+
+    def test_recovery_sends_replayed_trades_again(self):
+        engine = MatchingEngine.recover(self.directory, commit_interval=0)
+        self.trade(engine)
+        engine.close()
+        symbol, sequences, at, replayed = self.deliveries[0]
+        self.assertFalse(replayed)
+
+        engine = MatchingEngine.recover(self.directory, commit_interval=0)
+        self.addCleanup(engine.close)
+        engine.deliver_trades()
+        self.assertEqual(self.deliveries[1], (symbol, sequences, at, True))
+
+    def test_undelivered_trades_are_kept_in_snapshots(self):
+        engine = MatchingEngine.recover(self.directory, commit_interval=0)
+        self.failing = True
+        self.trade(engine)
+        engine.snapshot()
+        engine.close()
+
+        self.failing = False
+        engine = MatchingEngine.recover(self.directory, commit_interval=0)
+        self.addCleanup(engine.close)
+        self.assertEqual(engine.recovered['replayed'], 0)
+        engine.deliver_trades()
+        self.assertEqual([replayed for *_, replayed in self.deliveries], [True])
+
+    def test_reopened_books_do_not_reuse_trade_sequences(self):
+        first = MatchingEngine()
+        self.trade(first)
+        second = MatchingEngine()
+        self.trade(second)
+        self.assertGreater(self.deliveries[1][1][0], self.deliveries[0][1][0])
+
+
+class EngineServiceTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.address = os.path.join(directory.name, 'engine.sock')
+        self.server = EngineServer(self.address, authkey=b'test')
+        self.addCleanup(self.server.close)
+        threading.Thread(target=self.server.serve_forever, args=(MatchingEngine(),), daemon=True).start()
+        self.client = EngineClient(self.address, authkey=b'test', timeout=5)
+
+    def test_calls_reach_the_engine_process(self):
+        report = self.client.submit('sugar', BUY, 5, '65.00', owner=1)
+        self.assertEqual((report['status'], report['remaining']), ('resting', 5))
+        self.client.submit('SUGAR', SELL, 3, '66.00', owner=2)
+
+        auction, depth = self.client.depth('SUGAR')
+        self.assertFalse(auction)
+        self.assertEqual(depth, {BUY: [(6500, 5, 1)], SELL: [(6600, 3, 1)]})
+        self.assertEqual(self.client.overview(), [('SUGAR', 6500, 6600, False)])
+        self.assertEqual(self.client.info(), {'journal': None})
+        self.assertEqual(self.client.cancel('SUGAR', report['order_id'], owner=2), None)
+        self.assertEqual(self.client.cancel('SUGAR', report['order_id'], owner=1), 5)
+
+    def test_rejections_are_raised_in_the_caller(self):
+        with self.assertRaises(OrderRejected):
+            self.client.submit('SUGAR', BUY, 5, 'Infinity')
+
+    def test_a_second_engine_cannot_start(self):
+        with self.assertRaises(EngineAlreadyRunning):
+            EngineServer(self.address, authkey=b'test')
@@ -3,4 +3,8 @@ from . import views
 
 urlpatterns = [
     path('', views.trading_home, name='trading_home'),
-]
\ No newline at end of file
+    path('api/<str:symbol>/orders/', views.submit_order, name='trading_submit_order'),
+    path('api/<str:symbol>/orders/<int:order_id>/cancel/', views.cancel_order, name='trading_cancel_order'),
+    path('api/<str:symbol>/book/', views.order_book, name='trading_order_book'),
+    path('api/<str:symbol>/feed/', views.book_feed, name='trading_book_feed'),
+]
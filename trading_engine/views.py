@@ -1,9 +1,154 @@
+import time
 from django.shortcuts import render
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+from .orderbook import OrderRejected, from_ticks, BUY, SELL
+from .service import EngineUnavailable, get_client
+
+# Depth streams send at most one conflated delta per interval, a keep-alive comment
+# after this long without changes, and close after a while so clients reconnect
+FEED_INTERVAL = 0.1
+STREAM_HEARTBEAT = 25
+STREAM_MAX_AGE = 300
+
+
+def engine_unavailable():
+    return JsonResponse({'status': 'error', 'message': 'Trading is unavailable right now'}, status=503)
 
 @login_required
 def trading_home(request):
     """
-    Placeholder view for the trading engine interface.
+    Trading engine interface: the books currently open, with their best prices.
+    """
+    try:
+        overview = get_client().overview()
+    except EngineUnavailable:
+        overview = []
+    books = [
+        {
+            'symbol': symbol,
+            'best_bid': from_ticks(bid) if bid is not None else None,
+            'best_ask': from_ticks(ask) if ask is not None else None,
+        }
+        for symbol, bid, ask, _ in overview
+    ]
+    return render(request, 'trading_engine/trading_home.html', {'books': books})
+
+@login_required
+@require_POST
+def submit_order(request, symbol):
+    """
+    API endpoint to place an order.
+    Takes side (buy/sell), type (limit/market/ioc), quantity in bags and, except
+    for market orders, a price in KES. Returns the execution report.
+    """
+    try:
+        report = get_client().submit(
+            symbol,
+            side=request.POST.get('side'),
+            quantity=int(request.POST.get('quantity', 0)),
+            price=request.POST.get('price'),
+            order_type=request.POST.get('type', 'limit'),
+            owner=request.user.pk,
+        )
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Quantity must be a whole number of bags'}, status=400)
+    except OrderRejected as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except EngineUnavailable:
+        return engine_unavailable()
+    return JsonResponse({'status': 'success', **report})
+
+@login_required
+@require_POST
+def cancel_order(request, symbol, order_id):
+    """
+    API endpoint to cancel one of the user's resting orders.
+    """
+    try:
+        cancelled = get_client().cancel(symbol, order_id, owner=request.user.pk)
+    except OrderRejected as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except EngineUnavailable:
+        return engine_unavailable()
+    if cancelled is None:
+        return JsonResponse({'status': 'error', 'message': 'Order not found'}, status=404)
+    return JsonResponse({'status': 'success', 'order_id': order_id, 'cancelled': cancelled})
+
+@login_required
+def order_book(request, symbol):
+    """
+    API endpoint returning the aggregated depth of a book, best prices first.
+    """
+    try:
+        levels = max(1, min(int(request.GET.get('depth', 10)), 100))
+        auction, depth = get_client().depth(symbol, levels)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid depth'}, status=400)
+    except OrderRejected as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except EngineUnavailable:
+        return engine_unavailable()
+
+    def side(levels):
+        return [{'price': str(from_ticks(price)), 'quantity': volume, 'orders': count} for price, volume, count in levels]
+
+    return JsonResponse({
+        'symbol': symbol.upper(),
+        # While collecting for an auction the book can cross
+        'auction': auction,
+        'bids': side(depth[BUY]),
+        'asks': side(depth[SELL]),
+    })
+
+@login_required
+def book_feed(request, symbol):
+    """
+    Server-sent events stream of a book: a `snapshot` event with every level, then
+    `delta` events carrying the levels that changed (new totals; 0 orders means
+    the level is gone) and the trades since. Each delta's prev_seq is the seq of the
+    previous message, so a client that sees a gap should reconnect. A client that
+    falls too far behind is sent a new snapshot.
     """
-    return render(request, 'trading_engine/trading_home.html')
\ No newline at end of file
+    engine = get_client()
+    try:
+        subscription = engine.subscribe(symbol)
+    except OrderRejected as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except EngineUnavailable:
+        return engine_unavailable()
+    if subscription is None:
+        return JsonResponse({'status': 'error', 'message': 'No such order book'}, status=404)
+
+    def events():
+        snapshot, last = subscription
+        yield "retry: 5000\n\n"
+        yield f"event: snapshot\ndata: {snapshot}\n\n"
+
+        closes_at = time.monotonic() + STREAM_MAX_AGE
+        quiet_since = time.monotonic()
+        while time.monotonic() < closes_at:
+            time.sleep(FEED_INTERVAL)
+            try:
+                update = engine.delta(symbol, last)
+                if update is None:
+                    # Fell out of the feed buffer: start over from the current book
+                    snapshot, last = engine.subscribe(symbol)
+            except EngineUnavailable:
+                return  # The browser reconnects, and gets a 503 until the engine is back
+            if update is None:
+                yield f"event: snapshot\ndata: {snapshot}\n\n"
+            elif update[1] is not None:
+                last = update[0]
+                yield f"event: delta\ndata: {update[1]}\n\n"
+            elif time.monotonic() - quiet_since < STREAM_HEARTBEAT:
+                continue
+            else:
+                yield ": keep-alive\n\n"
+            quiet_since = time.monotonic()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
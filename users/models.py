@@ -1,11 +1,16 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from sugarqube.tracking import FieldTrackerMixin
+
+class CustomUser(FieldTrackerMixin, AbstractUser):
+    tracked_fields = ('is_verified_buyer', 'is_seller', 'company_name', 'credit_limit')
 
-class CustomUser(AbstractUser):
     is_verified_buyer = models.BooleanField(default=False)
     company_name = models.CharField(max_length=255, blank=True, null=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     is_seller = models.BooleanField(default=False)
+    # Most a buyer may have committed to open orders, in KES; empty uses BUYER_CREDIT_LIMIT
+    credit_limit = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True)
 
     def __str__(self):
         return self.username
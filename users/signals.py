@@ -19,20 +19,15 @@ def user_verification_notification(sender, instance, **kwargs):
     """
     Triggers a notification when a user's verification status changes to True.
     """
-    if instance.pk:
-        try:
-            # The user object is fetched from the 'credentials' db by the router
-            original = sender.objects.get(pk=instance.pk)
-            
-            # Notify on becoming a verified buyer
-            if not original.is_verified_buyer and instance.is_verified_buyer:
-                message = "Congratulations! Your account has been verified as a buyer."
-                transaction.on_commit(lambda: create_verification_notification(instance, message))
-            
-            # Notify on becoming a seller
-            if not original.is_seller and instance.is_seller:
-                message = "Congratulations! Your account has been approved as a seller."
-                transaction.on_commit(lambda: create_verification_notification(instance, message))
+    # Compared with the values the user was loaded with, so no extra query.
+    # New users have nothing to compare to and are skipped.
 
-        except sender.DoesNotExist:
-            pass # Object is new, so no original to compare to
\ No newline at end of file
+    # Notify on becoming a verified buyer
+    if instance.has_changed('is_verified_buyer') and instance.is_verified_buyer:
+        message = "Congratulations! Your account has been verified as a buyer."
+        transaction.on_commit(lambda: create_verification_notification(instance, message))
+
+    # Notify on becoming a seller
+    if instance.has_changed('is_seller') and instance.is_seller:
+        message = "Congratulations! Your account has been approved as a seller."
+        transaction.on_commit(lambda: create_verification_notification(instance, message))
\ No newline at end of file
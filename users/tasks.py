@@ -0,0 +1,14 @@
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import send_mail
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
+def send_seller_request_email(username, email):
+    """
+    Emails the site admins when a verified buyer asks to become a seller.
+    """
+    subject = 'Seller Account Request'
+    message = f'User {username} (email: {email}) has requested to become a seller.'
+    from_email = settings.DEFAULT_FROM_EMAIL
+    recipient_list = [admin[1] for admin in settings.ADMINS]
+    send_mail(subject, message, from_email, recipient_list)
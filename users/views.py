@@ -2,9 +2,8 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from .forms import CustomUserCreationForm, KYCForm, ChangePhoneNumberForm, CustomPasswordChangeForm
 from .models import KYC, Seller
+from .tasks import send_seller_request_email
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
-from django.conf import settings
 from django.contrib.auth import update_session_auth_hash, logout
 
 @login_required
@@ -88,12 +87,8 @@ def request_seller_account(request):
     if request.method == 'POST':
         user = request.user
         if user.is_verified_buyer:
-            # Send email to admin
-            subject = 'Seller Account Request'
-            message = f'User {user.username} (email: {user.email}) has requested to become a seller.'
-            from_email = settings.DEFAULT_FROM_EMAIL
-            recipient_list = [admin[1] for admin in settings.ADMINS]
-            send_mail(subject, message, from_email, recipient_list)
+            # Send email to admin from the email queue
+            send_seller_request_email.delay(user.username, user.email)
             messages.success(request, 'Your request to become a seller has been sent to the admin for approval.')
         else:
             messages.error(request, 'Only verified buyers can request a seller account.')